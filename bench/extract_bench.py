@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Offline micro-benchmark for the HTML extractors
+Times each extractor over the pages in bench/corpus, padded to several sizes,
+and reports throughput, p50/p99 latency and peak traced memory. Results can be
+saved as a baseline and later runs compared against it to catch regressions.
+
+Usage: python bench/extract_bench.py [--sizes 0,256,2048] [--save-baseline] [--baseline PATH]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(BENCH_DIR, 'corpus')
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'server', 'services'))
+
+# The extractors never touch the network, but keep the shared cache out of the way anyway
+os.environ.setdefault('SCRAPER_CACHE', '0')
+
+import scraper  # noqa: E402
+import real_scraper  # noqa: E402
+from document import Document  # noqa: E402
+
+# Baselines are machine specific, so the default lives next to the script and is not committed
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+# Padded page sizes in KiB; 0 means the corpus page as saved
+DEFAULT_SIZES = (0, 256, 2048)
+# A case whose p50 grows by more than this fraction over the baseline is a regression
+DEFAULT_THRESHOLD = 0.15
+
+FILLER_MARKER = '<!-- FILLER -->'
+FILLER_BLOCK = (
+    '<div class="recs-item" data-slot="{i}"><a class="recs-link" href="/p/{i}?ref=recs_{i}">'
+    'Related item {i}</a><p class="recs-blurb">Customers who viewed this also viewed item {i}. '
+    'Lightweight, durable and backed by the manufacturer warranty.</p>'
+    '<img src="/img/recs/{i}.jpg" alt="Related item {i}" loading="lazy"></div>\n'
+)
+
+TRANSACTION_ID = 'FT25189LQ0XK'
+
+# (name, extractor, corpus page, url the page was saved from)
+CASES = [
+    ('extract_product_data/amazon', scraper.extract_product_data, 'amazon_product.html',
+     'https://www.amazon.com/dp/B0B2MLMPZR'),
+    ('extract_product_data/ebay', scraper.extract_product_data, 'ebay_item.html',
+     'https://www.ebay.com/itm/295512345678'),
+    ('extract_product_data/generic', scraper.extract_product_data, 'generic_shop.html',
+     'https://shop.northsidegoods.com/products/ceramic-dripper'),
+    ('extract_amazon_data', scraper.extract_amazon_data, 'amazon_product.html',
+     'https://www.amazon.com/dp/B0B2MLMPZR'),
+    ('extract_ebay_data', scraper.extract_ebay_data, 'ebay_item.html',
+     'https://www.ebay.com/itm/295512345678'),
+    ('extract_real_product_data/amazon', scraper.extract_real_product_data, 'amazon_product.html',
+     'https://www.amazon.com/dp/B0B2MLMPZR'),
+    ('extract_real_product_data/ebay', scraper.extract_real_product_data, 'ebay_item.html',
+     'https://www.ebay.com/itm/295512345678'),
+    ('extract_real_product_data/generic', scraper.extract_real_product_data, 'generic_shop.html',
+     'https://shop.northsidegoods.com/products/ceramic-dripper'),
+    ('extract_data_from_rendered_content', None, 'boa_receipt.html',
+     f'https://cs.bankofabyssinia.com/slip/?trx={TRANSACTION_ID}'),
+]
+
+
+def load_page(name, size_kib):
+    """Corpus page padded with neutral markup up to roughly size_kib"""
+    with open(os.path.join(CORPUS_DIR, name), encoding='utf-8') as f:
+        html = f.read()
+    target = size_kib * 1024
+    if len(html) >= target:
+        return html
+    blocks = []
+    padding = 0
+    i = 0
+    while len(html) + padding < target:
+        block = FILLER_BLOCK.format(i=i)
+        blocks.append(block)
+        padding += len(block)
+        i += 1
+    return html.replace(FILLER_MARKER, ''.join(blocks), 1)
+
+
+def call(fn, html, url):
+    """One extraction as the scraper performs it: fresh Document, then the extractor"""
+    document = Document(html, url=url)
+    if fn is None:
+        return real_scraper.extract_data_from_rendered_content(document, TRANSACTION_ID)
+    return fn(document, url)
+
+
+def fingerprint(result):
+    """Stable hash of an extractor result, ignoring the timestamp"""
+    def scrub(value):
+        if isinstance(value, dict):
+            return {k: scrub(v) for k, v in value.items() if k != 'extractedAt'}
+        if isinstance(value, list):
+            return [scrub(v) for v in value]
+        return value
+    return hashlib.sha256(json.dumps(scrub(result), sort_keys=True).encode()).hexdigest()[:16]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(fn, html, url, min_time, min_runs, max_runs, warmup=2):
+    for _ in range(warmup):
+        result = call(fn, html, url)
+
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_runs and (len(samples) < min_runs or time.perf_counter() - started < min_time):
+        t0 = time.perf_counter()
+        call(fn, html, url)
+        samples.append(time.perf_counter() - t0)
+
+    # Memory is traced on a separate run so tracing overhead doesn't skew the timings
+    tracemalloc.start()
+    call(fn, html, url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(samples)
+    return {
+        'bytes': len(html.encode('utf-8')),
+        'runs': len(samples),
+        'p50_ms': statistics.median(samples) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'ops_per_s': len(samples) / total,
+        'mb_per_s': len(samples) * len(html.encode('utf-8')) / total / 1e6,
+        'peak_kib': peak / 1024,
+        'output': fingerprint(result),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print per-case deltas against baseline; return the names that regressed"""
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('created', 'unknown date')} "
+          f"({baseline.get('python', '?')}, parser {baseline.get('parser', '?')}):")
+    for key, current in results.items():
+        previous = baseline['results'].get(key)
+        if previous is None:
+            print(f"  {key:<48} new case")
+            continue
+        change = current['p50_ms'] / previous['p50_ms'] - 1
+        memory = current['peak_kib'] / previous['peak_kib'] - 1 if previous['peak_kib'] else 0.0
+        flags = []
+        if change > threshold:
+            flags.append('SLOWER')
+            regressions.append(key)
+        if current['output'] != previous['output']:
+            flags.append('OUTPUT CHANGED')
+        print(f"  {key:<48} p50 {change:+7.1%}  peak mem {memory:+7.1%}  {' '.join(flags)}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the extractors against the saved HTML corpus')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='comma-separated page sizes in KiB to pad the corpus to (0 = as saved)')
+    parser.add_argument('--filter', default='', help='only run cases whose name contains this text')
+    parser.add_argument('--min-time', type=float, default=1.0, help='seconds to spend on each case (default 1)')
+    parser.add_argument('--min-runs', type=int, default=10)
+    parser.add_argument('--max-runs', type=int, default=1000)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline file to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true', help='record this run as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed p50 slowdown before a case counts as a regression (default 0.15)')
+    parser.add_argument('--json', action='store_true', help='print raw results as JSON instead of a table')
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    results = {}
+    if not args.json:
+        print(f"{'case':<48} {'size':>9} {'runs':>5} {'p50 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'MB/s':>7} {'peak KiB':>9}")
+    for name, fn, page, url in CASES:
+        if args.filter not in name:
+            continue
+        for size in sizes:
+            html = load_page(page, size)
+            key = f'{name}@{size}k'
+            result = results[key] = measure(fn, html, url, args.min_time, args.min_runs, args.max_runs)
+            if not args.json:
+                print(f"{name:<48} {result['bytes'] / 1024:>8.0f}k {result['runs']:>5} {result['p50_ms']:>9.2f} "
+                      f"{result['p99_ms']:>9.2f} {result['ops_per_s']:>9.1f} {result['mb_per_s']:>7.2f} "
+                      f"{result['peak_kib']:>9.0f}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'python': platform.python_version(),
+                'parser': Document('').parser,
+                'results': results,
+            }, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Cold-start budget for the scraper entry points
+Starts each entry point in a fresh interpreter, both up to its usage check
+and as a one-shot `<url> <method>` job stopped at its first network call or
+browser launch, reports the time spent on top of a bare interpreter and the
+slowest imports from `python -X importtime`, and fails when startup exceeds
+its budget or pulls in a module that should only load with the method that
+needs it.
+
+Usage: python bench/startup_bench.py [--runs 15] [--budget-ms N] [--top 10] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICES_DIR = os.path.abspath(os.path.join(BENCH_DIR, '..', 'server', 'services'))
+
+# Startup cost over a bare interpreter, in milliseconds
+DEFAULT_BUDGET_MS = 80
+
+# Modules a cold start must not import: each belongs to a method or engine that loads it on demand
+DEFERRED_MODULES = (
+    'requests', 'urllib3', 'bs4', 'lxml', 'aiohttp', 'asyncio', 'multiprocessing',
+    'selenium', 'playwright', 'zstandard',
+)
+
+# Runs a script with the network stubbed out: the first connection, DNS lookup or
+# subprocess (a browser launch) ends the process with NETWORK_EXIT, so a job's
+# imports and setup are timed without waiting on a site or a browser
+NETWORK_EXIT = 97
+STUB_NETWORK = f"""
+import os, runpy, sys
+def stop(event, args):
+    if event in ('socket.getaddrinfo', 'socket.connect', 'subprocess.Popen'):
+        os._exit({NETWORK_EXIT})
+sys.addaudithook(stop)
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+# (name, script arguments); with no arguments each script stops at its usage check,
+# with a URL and method it runs a one-shot job up to the network
+ENTRY_POINTS = [
+    ('scraper', ['scraper.py']),
+    ('real_scraper', ['real_scraper.py']),
+    ('scraper chromium', ['-c', STUB_NETWORK, 'scraper.py', 'https://www.amazon.com/dp/B000000000', 'chromium']),
+]
+
+
+def environment():
+    env = dict(os.environ)
+    # Keep the run off the shared state database, with bytecode caching as in production
+    env.setdefault('SCRAPER_STATE_DIR', tempfile.mkdtemp(prefix='startup-bench-'))
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def wall_time(args, env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable] + args, cwd=SERVICES_DIR, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def reaches_network(args, env):
+    """Whether a stubbed job run got as far as its first network call"""
+    completed = subprocess.run([sys.executable] + args, cwd=SERVICES_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return completed.returncode == NETWORK_EXIT
+
+
+def import_profile(args, env):
+    """[(module, self_us, cumulative_us)] from one `-X importtime` run"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=SERVICES_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    profile = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        profile.append((name.strip(), int(self_us), int(cumulative_us)))
+    return profile
+
+
+def measure(name, args, env, runs, top):
+    # Warm the bytecode cache first; a worker restart never recompiles either
+    wall_time(args, env)
+    floor = statistics.median(wall_time(['-c', 'pass'], env) for _ in range(runs))
+    samples = [wall_time(args, env) for _ in range(runs)]
+    # Whatever a bare interpreter imports (site hooks and the like) is not ours to trim
+    interpreter = {module for module, _, _ in import_profile(['-c', 'pass'], env)}
+    profile = [entry for entry in import_profile(args, env) if entry[0] not in interpreter]
+    loaded = {module for module, _, _ in profile}
+    return {
+        'name': name,
+        'medianMs': round(statistics.median(samples) * 1000, 1),
+        'minMs': round(min(samples) * 1000, 1),
+        'interpreterMs': round(floor * 1000, 1),
+        'startupMs': round((statistics.median(samples) - floor) * 1000, 1),
+        'deferredLoaded': sorted(module for module in DEFERRED_MODULES if module in loaded),
+        'reachedNetwork': reaches_network(args, env) if STUB_NETWORK in args else None,
+        'slowest': [
+            {'module': module, 'selfMs': round(self_us / 1000, 1), 'cumulativeMs': round(cumulative_us / 1000, 1)}
+            for module, self_us, cumulative_us in sorted(profile, key=lambda entry: -entry[2])[:top]
+        ],
+    }
+
+
+def run(runs=15, budget_ms=DEFAULT_BUDGET_MS, top=10):
+    """Measure every entry point: {'budgetMs', 'results', 'failures'}"""
+    env = environment()
+    results = [measure(name, script, env, max(1, runs), top) for name, script in ENTRY_POINTS]
+
+    failures = []
+    for result in results:
+        if result['startupMs'] > budget_ms:
+            failures.append(f"{result['name']}: startup {result['startupMs']}ms is over the {budget_ms:g}ms budget")
+        if result['deferredLoaded']:
+            failures.append(f"{result['name']}: imports {', '.join(result['deferredLoaded'])} at startup")
+        if result['reachedNetwork'] is False:
+            failures.append(f"{result['name']}: exited before its first network call, so the job path was not timed")
+    return {'budgetMs': budget_ms, 'results': results, 'failures': failures}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the cold-start time of the scraper entry points')
+    parser.add_argument('--runs', type=int, default=15, help='timed starts per entry point (default 15)')
+    parser.add_argument('--budget-ms', type=float, default=float(os.environ.get('SCRAPER_STARTUP_BUDGET_MS',
+                                                                                DEFAULT_BUDGET_MS)),
+                        help=f'allowed startup over a bare interpreter (default {DEFAULT_BUDGET_MS})')
+    parser.add_argument('--top', type=int, default=10, help='slowest imports to list per entry point')
+    parser.add_argument('--json', action='store_true', help='print raw results as JSON instead of a report')
+    args = parser.parse_args(argv)
+
+    report = run(args.runs, args.budget_ms, args.top)
+    results, failures = report['results'], report['failures']
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for result in results:
+            print(f"{result['name']}: {result['startupMs']}ms over a {result['interpreterMs']}ms interpreter "
+                  f"(median {result['medianMs']}ms, min {result['minMs']}ms)")
+            for entry in result['slowest']:
+                print(f"  {entry['cumulativeMs']:8.1f}ms  {entry['selfMs']:7.1f}ms self  {entry['module']}")
+        for failure in failures:
+            print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -32,8 +32,8 @@ export function ResultsTable({ jobId }: ResultsTableProps) {
     queryKey: [`/api/jobs/${jobId}`],
     enabled: !!jobId,
     refetchInterval: (data) => {
-      // Stop polling if job is completed or failed
-      return data?.status === "processing" || data?.status === "pending" ? 2000 : false;
+      // Poll while the job runs so its streamed progress shows up; stop once it is completed or failed
+      return data?.status === "processing" || data?.status === "pending" ? 1000 : false;
     },
   });
 
@@ -235,6 +235,12 @@ export function ResultsTable({ jobId }: ResultsTableProps) {
                 {jobData.processingTime && (
                   <span className="text-sm">• {(jobData.processingTime / 1000).toFixed(1)}s</span>
                 )}
+                {jobData.status === "processing" && jobData.progress && (
+                  <span className="text-sm">
+                    {jobData.progress.phase && `• ${jobData.progress.phase}`}
+                    {jobData.progress.attempt && ` • attempt ${jobData.progress.attempt}/${jobData.progress.maxAttempts}`}
+                  </span>
+                )}
               </div>
               {jobData.errorMessage && (
                 <AlertDescription className="mt-2">
@@ -254,7 +260,12 @@ export function ResultsTable({ jobId }: ResultsTableProps) {
                   </TableRow>
                 </TableHeader>
                 <TableBody>
-                  {renderProductData(jobData.transactions)}
+                  {/* Fields extracted so far stand in until the job's results are stored */}
+                  {renderProductData(
+                    jobData.status === "processing" && jobData.progress && Object.keys(jobData.progress.fields).length
+                      ? [jobData.progress.fields]
+                      : jobData.transactions
+                  )}
                 </TableBody>
               </Table>
             </div>
@@ -2,6 +2,7 @@ import type { Express } from "express";
 import { createServer, type Server } from "http";
 import { storage } from "./storage";
 import { insertScrapingJobSchema, urlValidationSchema } from "@shared/schema";
+import { createScraperPool, type ScrapeEvent } from "./workers";
 import { spawn } from "child_process";
 import path from "path";
 import { fileURLToPath } from 'url';
@@ -9,6 +10,10 @@ import { fileURLToPath } from 'url';
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = path.dirname(__filename);
 
+// Long-lived Python workers, so jobs don't pay interpreter startup and imports
+const scraperPool = createScraperPool(path.join(__dirname, "services", "scraper.py"));
+const blobStoreScript = path.join(__dirname, "services", "blob_store.py");
+
 export async function registerRoutes(app: Express): Promise<Server> {
   // Validate URL endpoint
   app.post("/api/validate-url", async (req, res) => {
@@ -68,6 +73,57 @@ export async function registerRoutes(app: Express): Promise<Server> {
     res.json({ ...job, transactions });
   });
 
+  // Get the raw HTML a job scraped (kept out of band in the blob store)
+  app.get("/api/jobs/:id/html", async (req, res) => {
+    const jobId = parseInt(req.params.id);
+    const job = await storage.getScrapingJob(jobId);
+
+    if (!job) {
+      return res.status(404).json({ error: "Job not found" });
+    }
+    if (job.rawHtml) {
+      res.setHeader('Content-Type', 'text/html; charset=utf-8');
+      return res.send(job.rawHtml);
+    }
+    if (!job.rawHtmlRef) {
+      return res.status(404).json({ error: "No HTML stored for this job" });
+    }
+
+    const reader = spawn('python', [blobStoreScript, 'get', job.rawHtmlRef]);
+    let started = false;
+    reader.stdout.on('data', (chunk) => {
+      if (!started) {
+        started = true;
+        res.setHeader('Content-Type', 'text/html; charset=utf-8');
+      }
+      res.write(chunk);
+    });
+    reader.on('error', () => {
+      if (!res.headersSent) res.status(500).json({ error: "Failed to read stored HTML" });
+    });
+    reader.on('close', (code) => {
+      if (started) return res.end();
+      if (!res.headersSent) {
+        res.status(code === 1 ? 404 : 500).json({ error: code === 1 ? "Stored HTML not found" : "Failed to read stored HTML" });
+      }
+    });
+  });
+
+  // Scraper phase timings aggregated across workers: Prometheus text, or JSON with ?format=json
+  app.get("/api/metrics", async (req, res) => {
+    const format = req.query.format === "json" ? "json" : "prometheus";
+    try {
+      const exported = await scraperPool.run({ op: "metrics", format });
+      if (format === "json") {
+        return res.json(exported.metrics);
+      }
+      res.setHeader('Content-Type', 'text/plain; version=0.0.4; charset=utf-8');
+      res.send(exported.text);
+    } catch (error) {
+      res.status(500).json({ error: "Failed to collect metrics" });
+    }
+  });
+
   // Get recent jobs
   app.get("/api/jobs", async (req, res) => {
     const limit = req.query.limit ? parseInt(req.query.limit as string) : 10;
@@ -110,6 +166,39 @@ export async function registerRoutes(app: Express): Promise<Server> {
   return httpServer;
 }
 
+// What a running job has reported so far, kept on the job as `progress`
+interface JobProgress {
+  phase: string | null;
+  method?: string;
+  attempt?: number;
+  maxAttempts?: number;
+  fields: Record<string, string>;
+}
+
+function applyEvent(progress: JobProgress, event: ScrapeEvent) {
+  switch (event.type) {
+    case "phase":
+      if (event.state === "started") {
+        progress.phase = event.name;
+      } else if (progress.phase === event.name) {
+        progress.phase = null;
+      }
+      break;
+    case "method":
+      progress.method = event.method;
+      break;
+    case "retry":
+      // A new attempt extracts from scratch
+      progress.attempt = event.attempt;
+      progress.maxAttempts = event.maxAttempts;
+      progress.fields = {};
+      break;
+    case "field":
+      progress.fields[event.name] = event.value;
+      break;
+  }
+}
+
 // Background scraping function
 async function runScrapingJob(jobId: number, url: string, method: string) {
   const startTime = Date.now();
@@ -121,65 +210,55 @@ async function runScrapingJob(jobId: number, url: string, method: string) {
       startedAt: new Date()
     });
 
-    // Run Python scraper
-    const scraperPath = path.join(__dirname, "services", "scraper.py");
-    const pythonProcess = spawn("python", [scraperPath, url, method], {
-      stdio: ["pipe", "pipe", "pipe"]
-    });
+    // Run Python scraper on a pooled worker, publishing its progress as it streams in
+    const progress: JobProgress = { phase: null, fields: {} };
+    let progressWrites: Promise<unknown> = Promise.resolve();
+    const onEvent = (event: ScrapeEvent) => {
+      applyEvent(progress, event);
+      const snapshot = { ...progress, fields: { ...progress.fields } };
+      progressWrites = progressWrites
+        .then(() => storage.updateScrapingJob(jobId, { progress: snapshot }))
+        .catch(() => undefined);
+    };
 
-    let output = "";
-    let errorOutput = "";
+    let result: any;
+    try {
+      result = await scraperPool.run({ url, method }, onEvent);
+    } catch (error) {
+      await progressWrites;
+      await storage.updateScrapingJob(jobId, {
+        status: "failed",
+        completedAt: new Date(),
+        errorMessage: error instanceof Error && error.message ? error.message : "Scraping process failed",
+        processingTime: Date.now() - startTime
+      });
+      return;
+    }
 
-    pythonProcess.stdout.on("data", (data) => {
-      output += data.toString();
-    });
+    const processingTime = Date.now() - startTime;
+    await progressWrites;
 
-    pythonProcess.stderr.on("data", (data) => {
-      errorOutput += data.toString();
+    // Update job with success
+    await storage.updateScrapingJob(jobId, {
+      status: "completed",
+      completedAt: new Date(),
+      rawHtml: result.rawHtml ?? null,
+      rawHtmlRef: result.rawHtmlRef ?? null,
+      rawHtmlSize: result.rawHtmlSize ?? null,
+      extractedData: result.extractedData,
+      processingTime,
+      phaseTimings: result.timings ?? null
     });
 
-    pythonProcess.on("close", async (code) => {
-      const processingTime = Date.now() - startTime;
-
-      if (code === 0) {
-        try {
-          const result = JSON.parse(output);
-          
-          // Update job with success
-          await storage.updateScrapingJob(jobId, {
-            status: "completed",
-            completedAt: new Date(),
-            rawHtml: result.rawHtml,
-            extractedData: result.extractedData,
-            processingTime
-          });
-
-          // Create transaction records
-          if (result.extractedData && result.extractedData.transactions) {
-            for (const txData of result.extractedData.transactions) {
-              await storage.createTransaction({
-                jobId,
-                ...txData
-              });
-            }
-          }
-        } catch (parseError) {
-          await storage.updateScrapingJob(jobId, {
-            status: "failed",
-            completedAt: new Date(),
-            errorMessage: "Failed to parse scraper output",
-            processingTime
-          });
-        }
-      } else {
-        await storage.updateScrapingJob(jobId, {
-          status: "failed",
-          completedAt: new Date(),
-          errorMessage: errorOutput || "Scraping process failed",
-          processingTime
+    // Create transaction records
+    if (result.extractedData && result.extractedData.transactions) {
+      for (const txData of result.extractedData.transactions) {
+        await storage.createTransaction({
+          jobId,
+          ...txData
         });
       }
-    });
+    }
 
   } catch (error) {
     const processingTime = Date.now() - startTime;
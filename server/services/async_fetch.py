@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+asyncio fetch engine for the static page and receipt API paths
+A single event loop thread keeps thousands of requests in flight, bounded
+overall and per host, each with its own timeout and cancelled cleanly when
+its job no longer needs it. aiohttp is an optional dependency; without it
+callers stay on the threaded `requests` path.
+"""
+
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import http_pool
+import metrics
+import scheduler
+
+AVAILABLE = importlib.util.find_spec('aiohttp') is not None
+
+DEFAULT_CONCURRENCY = int(os.environ.get('SCRAPER_ASYNC_CONCURRENCY', 1000))
+DEFAULT_PER_HOST = int(os.environ.get('SCRAPER_ASYNC_PER_HOST', 20))
+
+
+class HTTPStatusError(Exception):
+    pass
+
+
+class Response:
+    """The parts of a requests.Response the scrapers use, filled from an aiohttp reply"""
+
+    def __init__(self, url, status_code, reason, headers, content, encoding, truncated=False):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding
+        self.truncated = truncated
+        self._text = None
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.content.decode(self.encoding, errors='replace')
+        return self._text
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if 400 <= self.status_code < 500:
+            raise HTTPStatusError(f'{self.status_code} Client Error: {self.reason} for url: {self.url}')
+        if 500 <= self.status_code < 600:
+            raise HTTPStatusError(f'{self.status_code} Server Error: {self.reason} for url: {self.url}')
+
+
+def _trace_config():
+    """Report connection setup as the job's 'connect' phase"""
+    import aiohttp
+
+    async def on_start(session, ctx, params):
+        ctx.connect_started = time.perf_counter()
+
+    async def on_end(session, ctx, params):
+        metrics.add('connect', time.perf_counter() - ctx.connect_started)
+
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_start.append(on_start)
+    trace.on_connection_create_end.append(on_end)
+    return trace
+
+
+class AsyncFetcher:
+    """One aiohttp session with bounded connections; use as `async with AsyncFetcher() as fetcher`"""
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST):
+        if not AVAILABLE:
+            raise RuntimeError('The async engine needs aiohttp (pip install aiohttp)')
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.session = None
+
+    async def __aenter__(self):
+        import aiohttp
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host,
+                                         ttl_dns_cache=300)
+        # Jobs share connections, not cookies, as on the threaded path
+        self.session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.DummyCookieJar(),
+                                             trace_configs=[_trace_config()])
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def request(self, method, url, headers=None, timeout=None, max_bytes=None):
+        """Fetch url within `timeout` (capped by the job deadline) and return a Response
+
+        With max_bytes, at most that much of the body is read (response.truncated says if more was left).
+        """
+        import aiohttp
+        connect, read = http_pool.resolve_timeout(timeout)
+        budget = scheduler.current_deadline().cap(connect + read)
+        started = time.perf_counter()
+        connecting = metrics.elapsed('connect')
+        async with asyncio.timeout(budget):
+            async with self.session.request(
+                method, url, headers=headers,
+                timeout=aiohttp.ClientTimeout(total=None, connect=connect, sock_read=read),
+            ) as reply:
+                headers_at = time.perf_counter()
+                truncated = False
+                if max_bytes is None:
+                    content = await reply.read()
+                else:
+                    chunks = []
+                    size = 0
+                    async for chunk in reply.content.iter_chunked(64 * 1024):
+                        chunks.append(chunk)
+                        size += len(chunk)
+                        if size > max_bytes:
+                            truncated = True
+                            break
+                    content = b''.join(chunks)[:max_bytes]
+                response = Response(str(reply.url), reply.status, reply.reason, reply.headers, content,
+                                    reply.charset or 'utf-8', truncated)
+        metrics.add('ttfb', max(0.0, headers_at - started - (metrics.elapsed('connect') - connecting)))
+        metrics.add('download', time.perf_counter() - headers_at)
+        return response
+
+    async def get(self, url, headers=None, timeout=None, max_bytes=None):
+        return await self.request('GET', url, headers=headers, timeout=timeout, max_bytes=max_bytes)
+
+
+async def run_batch(handler, jobs, writer, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST,
+                    backlog=None):
+    """Run `await handler(job, fetcher)` for every job, writing batch-format result lines
+
+    At most `concurrency` jobs run at once and at most `per_host` against one
+    host; jobs are read from the (blocking) iterator only as fast as the
+    backlog drains, so memory stays flat on huge inputs.
+    """
+    running = asyncio.Semaphore(max(1, concurrency))
+    ahead = asyncio.Semaphore(max(1, concurrency) + (backlog if backlog is not None else concurrency * 8))
+    hosts = defaultdict(lambda: asyncio.Semaphore(max(1, per_host)))
+    tasks = set()
+
+    async def run_one(job, fetcher):
+        try:
+            async with hosts[urlparse(job.get('url', '')).hostname or ''], running:
+                try:
+                    result = await handler(job, fetcher)
+                    writer.write({'index': job.get('index'), 'url': job.get('url'), 'result': result})
+                except Exception as e:
+                    writer.write({'index': job.get('index'), 'url': job.get('url'), 'error': str(e)})
+        finally:
+            ahead.release()
+
+    async with AsyncFetcher(concurrency, per_host) as fetcher:
+        jobs = iter(jobs)
+        while True:
+            await ahead.acquire()
+            # Reading input may block (stdin), so keep it off the loop
+            job = await asyncio.to_thread(next, jobs, None)
+            if job is None:
+                ahead.release()
+                break
+            task = asyncio.create_task(run_one(job, fetcher))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+def run_many(handler, jobs, concurrency=DEFAULT_CONCURRENCY, per_host=DEFAULT_PER_HOST):
+    """Synchronous wrapper: run every job on the async engine and return results in input order"""
+    jobs = [dict(job, index=job.get('index', index)) for index, job in enumerate(jobs)]
+    collected = {}
+
+    class Collector:
+        def write(self, message):
+            collected[message['index']] = message
+
+    asyncio.run(run_batch(handler, jobs, Collector(), concurrency, per_host))
+    return [collected[job['index']] for job in jobs]
+
+
+def check_available():
+    """Exit with a clear message when the async engine was requested without aiohttp"""
+    if not AVAILABLE:
+        print("The async engine needs aiohttp: pip install aiohttp", file=sys.stderr)
+        sys.exit(2)
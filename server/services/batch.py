@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Batch mode for the scraper entry points
+Fetches many URLs concurrently under a global and a per-host concurrency limit
+and streams one NDJSON line per URL as soon as it finishes
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import scheduler
+from worker import LineWriter
+
+DEFAULT_CONCURRENCY = 16
+DEFAULT_PER_HOST = 2
+
+
+class BatchRunner:
+    """Run jobs concurrently while keeping at most per_host of them on any one host"""
+
+    def __init__(self, handler, writer, concurrency=DEFAULT_CONCURRENCY,
+                 per_host=DEFAULT_PER_HOST, backlog=None):
+        self.handler = handler
+        self.writer = writer
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        # Jobs parked behind a busy host; bounds how far ahead of the workers we read
+        self.backlog = backlog if backlog is not None else self.concurrency * 8
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.cond = threading.Condition()
+        self.active = defaultdict(int)
+        self.waiting = {}
+        self.in_flight = 0
+        self.parked = 0
+        # Jobs waiting out a backoff or rate limit; they keep their host slot but not a thread
+        self.deferred = 0
+
+    def submit(self, job):
+        """Queue a job, blocking while the batch is saturated"""
+        host = urlparse(job.get('url', '')).hostname or ''
+        with self.cond:
+            while self.in_flight + self.parked + self.deferred >= self.concurrency + self.backlog:
+                self.cond.wait()
+            if self.in_flight < self.concurrency and self.active[host] < self.per_host:
+                self._start(job, host)
+            else:
+                self.waiting.setdefault(host, deque()).append(job)
+                self.parked += 1
+
+    def join(self):
+        """Wait for every submitted job to finish"""
+        with self.cond:
+            while self.in_flight or self.parked or self.deferred:
+                self.cond.wait()
+        self.executor.shutdown()
+
+    def _start(self, job, host):
+        self.active[host] += 1
+        self.in_flight += 1
+        self.executor.submit(self._run, job, host)
+
+    def _run(self, job, host, state=None):
+        state = {} if state is None else state
+        rescheduled = None
+        try:
+            with scheduler.resumable(state):
+                result = self.handler(job)
+            self.writer.write({'index': job.get('index'), 'url': job.get('url'), 'result': result})
+        except scheduler.Reschedule as e:
+            rescheduled = e
+        except Exception as e:
+            self.writer.write({'index': job.get('index'), 'url': job.get('url'), 'error': str(e)})
+        finally:
+            with self.cond:
+                self.in_flight -= 1
+                if rescheduled is None:
+                    self.active[host] -= 1
+                    if not self.active[host]:
+                        del self.active[host]
+                else:
+                    self.deferred += 1
+                self._drain()
+                self.cond.notify_all()
+        if rescheduled is not None:
+            scheduler.resume_later(rescheduled, self._resume, job, host, state)
+
+    def _resume(self, job, host, state):
+        with self.cond:
+            self.deferred -= 1
+            self.in_flight += 1
+        self.executor.submit(self._run, job, host, state)
+
+    def _drain(self):
+        """Start parked jobs whose host has capacity again"""
+        for host in list(self.waiting):
+            queue = self.waiting[host]
+            while queue and self.in_flight < self.concurrency and self.active[host] < self.per_host:
+                self.parked -= 1
+                self._start(queue.popleft(), host)
+            if not queue:
+                del self.waiting[host]
+            if self.in_flight >= self.concurrency:
+                break
+
+
+def read_jobs(infile, default_method):
+    """Yield jobs from lines of `<url>`, `<url> <method>` or JSON objects"""
+    for index, line in enumerate(infile):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('{'):
+            try:
+                job = json.loads(line)
+            except ValueError:
+                print(f"Skipping invalid line {index + 1}", file=sys.stderr)
+                continue
+        else:
+            parts = line.split()
+            job = {'url': parts[0], 'method': parts[1] if len(parts) > 1 else default_method}
+        job.setdefault('method', default_method)
+        job.setdefault('index', index)
+        yield job
+
+
+def batch_main(handler, argv, default_method='auto', async_handler=None, stages=None):
+    """Parse batch flags and stream results for every URL in the input
+
+    `async_handler(job, fetcher)` is the coroutine used with `--engine async`,
+    `stages` the (fetch, done) pair used with `--engine pipeline`.
+    """
+    parser = argparse.ArgumentParser(description='Scrape many URLs concurrently, streaming NDJSON results')
+    parser.add_argument('input', nargs='?', default='-', help='file of URLs, one per line (default: stdin)')
+    parser.add_argument('--method', default=default_method, help='method for lines that do not name one')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='maximum jobs in flight overall (default 16 with threads, 1000 with async; '
+                             'pipeline: fetch threads, unless --fetch-workers is given)')
+    parser.add_argument('--per-host', type=int, default=None,
+                        help='maximum jobs in flight against one host (default 2 with threads and pipeline, '
+                             '20 with async)')
+    parser.add_argument('--engine', choices=['threads', 'async', 'pipeline'],
+                        default=os.environ.get('SCRAPER_BATCH_ENGINE', 'threads'),
+                        help='threads: one blocking job per thread; async: static and API fetches on one event loop; '
+                             'pipeline: fetch threads feeding a process pool that parses and extracts')
+    parser.add_argument('--fetch-workers', type=int, default=None, help='pipeline: fetch threads (default 16)')
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help='pipeline: extraction processes (default: one per core)')
+    parser.add_argument('--queue-size', type=int, default=None,
+                        help='pipeline: fetched pages that may wait for extraction before fetchers block')
+    parser.add_argument('--ordered', action='store_true', help='pipeline: write results in input order')
+    args = parser.parse_args(argv)
+
+    infile = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    if args.engine == 'async' and async_handler is not None:
+        import asyncio
+        import async_fetch
+        async_fetch.check_available()
+        concurrency = args.concurrency or async_fetch.DEFAULT_CONCURRENCY
+        try:
+            asyncio.run(async_fetch.run_batch(async_handler, read_jobs(infile, args.method),
+                                              LineWriter(sys.stdout), concurrency,
+                                              args.per_host or async_fetch.DEFAULT_PER_HOST))
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+        return
+
+    if args.engine == 'pipeline' and stages is not None:
+        from pipeline import Pipeline, DEFAULT_FETCH_WORKERS, DEFAULT_PARSE_WORKERS
+        fetch, done = stages
+        runner = Pipeline(fetch, done, LineWriter(sys.stdout),
+                          fetch_workers=args.fetch_workers or args.concurrency or DEFAULT_FETCH_WORKERS,
+                          parse_workers=args.parse_workers or DEFAULT_PARSE_WORKERS,
+                          queue_size=args.queue_size, ordered=args.ordered,
+                          per_host=args.per_host or int(os.environ.get('SCRAPER_BATCH_PER_HOST', DEFAULT_PER_HOST)))
+        try:
+            for job in read_jobs(infile, args.method):
+                runner.submit(job)
+        finally:
+            if infile is not sys.stdin:
+                infile.close()
+            runner.join()
+        return
+
+    concurrency = args.concurrency or int(os.environ.get('SCRAPER_BATCH_CONCURRENCY', DEFAULT_CONCURRENCY))
+    per_host = args.per_host or int(os.environ.get('SCRAPER_BATCH_PER_HOST', DEFAULT_PER_HOST))
+    runner = BatchRunner(handler, LineWriter(sys.stdout), concurrency, per_host)
+    try:
+        for job in read_jobs(infile, args.method):
+            runner.submit(job)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        runner.join()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Content-addressed, compressed storage for raw page HTML
+Results carry a small reference instead of the page itself; identical pages
+are stored once. Usage: python blob_store.py get <ref>  (writes the HTML to stdout)
+"""
+
+import gzip
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
+
+import store
+
+BLOB_DIR = os.environ.get('SCRAPER_BLOB_DIR', os.path.join(store.STATE_DIR, 'blobs'))
+# gzip is readable everywhere; zstd is smaller and faster when `zstandard` is installed
+CODEC = os.environ.get('SCRAPER_BLOB_CODEC', 'gzip')
+# Set SCRAPER_INLINE_HTML=1 to keep the old behaviour of embedding rawHtml in results
+INLINE_HTML = os.environ.get('SCRAPER_INLINE_HTML', '0') == '1'
+
+_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def _codec():
+    if CODEC == 'zstd' and importlib.util.find_spec('zstandard') is not None:
+        return 'zstd'
+    return 'gzip'
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def _path(digest, codec):
+    return os.path.join(BLOB_DIR, digest[:2], digest + _EXTENSIONS[codec])
+
+
+def put(html):
+    """Store html (deduplicated by hash) and return {'ref', 'size', 'storedSize'}"""
+    data = html.encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()
+
+    # Reuse whatever copy already exists, whichever codec wrote it
+    for codec in _EXTENSIONS:
+        path = _path(digest, codec)
+        if os.path.exists(path):
+            return {'ref': f'sha256:{digest}', 'size': len(data), 'storedSize': os.path.getsize(path)}
+
+    codec = _codec()
+    path = _path(digest, codec)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    compressed = _compress(data, codec)
+    # Write then rename so concurrent writers and readers never see a partial blob
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return {'ref': f'sha256:{digest}', 'size': len(data), 'storedSize': len(compressed)}
+
+
+def _digest(ref):
+    algorithm, _, digest = ref.partition(':')
+    if algorithm != 'sha256' or len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+        raise ValueError(f'Invalid blob reference: {ref}')
+    return digest
+
+
+def exists(ref):
+    """Whether the blob for a reference returned by put() is still stored"""
+    digest = _digest(ref)
+    return any(os.path.exists(_path(digest, codec)) for codec in _EXTENSIONS)
+
+
+def get(ref):
+    """HTML for a reference returned by put(), or None if it is not stored"""
+    digest = _digest(ref)
+    for codec in _EXTENSIONS:
+        path = _path(digest, codec)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return _decompress(f.read(), codec).decode('utf-8')
+    return None
+
+
+def externalize(result):
+    """Move result['rawHtml'] into the blob store, leaving a reference and sizes"""
+    html = result.get('rawHtml')
+    if INLINE_HTML or not html:
+        return result
+    try:
+        blob = put(html)
+    except Exception as e:
+        print(f"Blob store write failed, keeping HTML inline: {e}", file=sys.stderr)
+        return result
+    del result['rawHtml']
+    result['rawHtmlRef'] = blob['ref']
+    result['rawHtmlSize'] = blob['size']
+    result['rawHtmlStoredSize'] = blob['storedSize']
+    return result
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'get':
+        print("Usage: python blob_store.py get <ref>", file=sys.stderr)
+        sys.exit(2)
+    try:
+        html = get(sys.argv[2])
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(2)
+    if html is None:
+        print(f"Blob not found: {sys.argv[2]}", file=sys.stderr)
+        sys.exit(1)
+    sys.stdout.write(html)
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Warm headless-browser pools for the chromium and selenium paths
+Each pooled browser lives on its own thread and serves one page at a time in a
+fresh context (chromium) or tab (selenium); browsers are recycled after a page
+count or memory limit and their whole process group is killed on retirement
+"""
+
+import atexit
+import contextvars
+import importlib.util
+import os
+import queue
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import metrics
+import readiness
+import resource_filter
+
+CHROMIUM_PATH = os.environ.get(
+    'CHROMIUM_PATH',
+    '/nix/store/zi4f80l169xlmivz8vja8wlphq74qqk0-chromium-125.0.6422.141/bin/chromium',
+)
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.6422.141 Safari/537.36'
+
+POOL_SIZE = int(os.environ.get('SCRAPER_BROWSERS', 2))
+MAX_PAGES = int(os.environ.get('SCRAPER_BROWSER_MAX_PAGES', 50))
+MAX_RSS_MB = int(os.environ.get('SCRAPER_BROWSER_MAX_RSS_MB', 1024))
+LAUNCH_TIMEOUT = 15
+
+CHROMIUM_FLAGS = [
+    '--headless=new',
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-gpu',
+    '--ignore-certificate-errors',
+    '--disable-blink-features=AutomationControlled',
+    '--disable-extensions',
+    '--window-size=1920,1080',
+    f'--user-agent={USER_AGENT}',
+]
+
+_enabled = os.environ.get('SCRAPER_BROWSER_POOL', '0') == '1'
+
+
+class PoolUnavailable(Exception):
+    """The pool cannot serve this job; callers fall back to a one-off browser or chromium --dump-dom"""
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+def enable(flag=True):
+    """Turn pooling on for long-lived processes (worker and batch modes)"""
+    global _enabled
+    _enabled = flag
+
+
+def enabled():
+    return _enabled
+
+
+def process_group_rss_mb(pgid):
+    """Resident memory of every process in a process group, in MB (Linux only)"""
+    total_kb = 0
+    try:
+        pids = [entry for entry in os.listdir('/proc') if entry.isdigit()]
+    except OSError:
+        return 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/stat') as f:
+                stat = f.read()
+            # Fields after the parenthesised command name: state, ppid, pgrp, ...
+            if int(stat.rsplit(')', 1)[1].split()[2]) != pgid:
+                continue
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+        except (OSError, ValueError, IndexError):
+            continue
+    return total_kb / 1024
+
+
+def kill_process_group(process):
+    """Kill a browser and every helper process it spawned, then reap it"""
+    if process is None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    try:
+        process.wait(timeout=5)
+    except Exception:
+        pass
+
+
+class PooledChromium:
+    """A chromium process launched once and driven over CDP by playwright"""
+
+    def __init__(self):
+        import subprocess
+        from playwright.sync_api import sync_playwright
+
+        self.user_data_dir = tempfile.mkdtemp(prefix='scraper-chromium-')
+        self.process = subprocess.Popen(
+            [CHROMIUM_PATH, *CHROMIUM_FLAGS, '--remote-debugging-port=0',
+             f'--user-data-dir={self.user_data_dir}', 'about:blank'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True,
+        )
+        self.playwright = None
+        try:
+            port = self._wait_for_devtools_port()
+            self.playwright = sync_playwright().start()
+            self.browser = self.playwright.chromium.connect_over_cdp(f'http://127.0.0.1:{port}')
+        except Exception:
+            self.close()
+            raise
+
+    def _wait_for_devtools_port(self):
+        port_file = os.path.join(self.user_data_dir, 'DevToolsActivePort')
+        deadline = time.monotonic() + LAUNCH_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise PoolUnavailable(f'chromium exited during launch (code {self.process.returncode})')
+            try:
+                with open(port_file) as f:
+                    port = f.readline().strip()
+                if port:
+                    return int(port)
+            except (OSError, ValueError):
+                pass
+            time.sleep(0.05)
+        raise PoolUnavailable('chromium did not expose a DevTools port in time')
+
+    def alive(self):
+        return self.process.poll() is None and self.browser.is_connected()
+
+    def rss_mb(self):
+        return process_group_rss_mb(self.process.pid)
+
+    def new_context(self, **kwargs):
+        kwargs.setdefault('user_agent', USER_AGENT)
+        kwargs.setdefault('viewport', {'width': 1920, 'height': 1080})
+        kwargs.setdefault('ignore_https_errors', True)
+        return self.browser.new_context(**kwargs)
+
+    def close(self):
+        try:
+            if self.playwright is not None:
+                self.playwright.stop()
+        except Exception:
+            pass
+        kill_process_group(self.process)
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+class PooledSelenium:
+    """A webdriver.Chrome session kept open across jobs"""
+
+    def __init__(self):
+        from selenium import webdriver
+        from selenium.webdriver.chrome.options import Options
+        from selenium.webdriver.chrome.service import Service
+
+        options = Options()
+        options.add_argument('--headless')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--window-size=1920,1080')
+        resource_filter.selenium_options(options)
+
+        try:
+            service = Service(popen_kw={'start_new_session': True})
+        except TypeError:
+            service = Service()
+        self.driver = webdriver.Chrome(options=options, service=service)
+        self.process = getattr(self.driver.service, 'process', None)
+        self.home_window = self.driver.current_window_handle
+
+    def alive(self):
+        try:
+            self.driver.current_window_handle
+            return True
+        except Exception:
+            return False
+
+    def rss_mb(self):
+        # Only meaningful when chromedriver leads its own process group
+        return process_group_rss_mb(self.process.pid) if self.process is not None else 0
+
+    def new_tab(self):
+        """Open an isolated tab for one job; close it with close_tab()"""
+        self.driver.switch_to.new_window('tab')
+        return self.driver
+
+    def close_tab(self):
+        try:
+            self.driver.delete_all_cookies()
+            self.driver.close()
+        finally:
+            self.driver.switch_to.window(self.home_window)
+
+    def close(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        # Chrome children outlive chromedriver if quit() failed half way
+        kill_process_group(self.process)
+
+
+class BrowserPool:
+    """Fixed number of browser threads, each owning one warm browser instance"""
+
+    def __init__(self, name, launcher, size=POOL_SIZE, max_pages=MAX_PAGES, max_rss_mb=MAX_RSS_MB):
+        self.name = name
+        self.launcher = launcher
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.jobs = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.closed = False
+        self.launch_error = None
+
+    def run(self, fn, timeout=None):
+        """Run fn(browser) on a pooled browser and return its result"""
+        if self.closed:
+            raise PoolUnavailable(f'{self.name} pool is shut down')
+        if self.launch_error is not None:
+            raise PoolUnavailable(self.launch_error)
+        self._ensure_threads()
+        future = Future()
+        # The browser thread runs fn in the caller's context, so job timings land on the job
+        self.jobs.put((contextvars.copy_context(), fn, future))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise RenderTimeout(f'{self.name} job exceeded {timeout}s')
+
+    def shutdown(self):
+        self.closed = True
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join(timeout=10)
+
+    def _ensure_threads(self):
+        with self.lock:
+            while len(self.threads) < self.size:
+                thread = threading.Thread(target=self._loop, name=f'{self.name}-{len(self.threads)}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _launch(self):
+        try:
+            with metrics.phase('browser_launch'):
+                return self.launcher()
+        except ImportError as e:
+            # Missing optional dependency: stop trying and let callers fall back
+            self.launch_error = str(e)
+            raise PoolUnavailable(self.launch_error)
+
+    def _retire(self, browser, reason):
+        print(f"Recycling {self.name} browser: {reason}", file=sys.stderr)
+        browser.close()
+
+    def _loop(self):
+        browser = None
+        pages = 0
+        try:
+            while True:
+                item = self.jobs.get()
+                if item is None:
+                    break
+                context, fn, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                try:
+                    if browser is not None and not browser.alive():
+                        self._retire(browser, 'crashed')
+                        browser = None
+                    if browser is None:
+                        browser = context.run(self._launch)
+                        pages = 0
+                    future.set_result(context.run(fn, browser))
+                except Exception as e:
+                    future.set_exception(e)
+
+                if browser is None:
+                    continue
+                pages += 1
+                if not browser.alive():
+                    self._retire(browser, 'crashed')
+                    browser = None
+                elif pages >= self.max_pages:
+                    self._retire(browser, f'served {pages} pages')
+                    browser = None
+                elif self.max_rss_mb and browser.rss_mb() > self.max_rss_mb:
+                    self._retire(browser, f'memory above {self.max_rss_mb} MB')
+                    browser = None
+        finally:
+            if browser is not None:
+                browser.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name):
+    """Return the shared 'chromium' or 'selenium' pool"""
+    launchers = {'chromium': PooledChromium, 'selenium': PooledSelenium}
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = BrowserPool(name, launchers[name])
+        return _pools[name]
+
+
+def chromium_available():
+    return os.path.exists(CHROMIUM_PATH) and importlib.util.find_spec('playwright') is not None
+
+
+def _render_in(context, url, budget_ms, timeout):
+    """Load url in a playwright context and return its DOM once the page is ready"""
+    readiness.prepare(context)
+    resource_filter.install_route(context, url)
+    page = context.new_page()
+    page.goto(url, wait_until='domcontentloaded', timeout=timeout * 1000)
+    readiness.wait_until_ready(page, url, budget_ms)
+    return page.content()
+
+
+def render(url, budget_ms=15000, timeout=35):
+    """Render url and return the DOM as soon as it is ready, within budget_ms
+
+    Uses a fresh context on a warm pooled chromium when pooling is on, and a
+    one-off playwright-driven chromium otherwise, so both exit early on
+    readiness. Raises PoolUnavailable when neither can run; callers then fall
+    back to chromium --dump-dom, which always waits out the budget.
+    """
+    if not chromium_available():
+        raise PoolUnavailable('playwright or chromium not installed')
+    if not _enabled:
+        return _render_once(url, budget_ms, timeout)
+
+    def job(browser):
+        context = browser.new_context()
+        try:
+            with metrics.phase('render'):
+                return _render_in(context, url, budget_ms, timeout)
+        finally:
+            context.close()
+
+    return get_pool('chromium').run(job, timeout=timeout)
+
+
+def _render_once(url, budget_ms, timeout):
+    if not readiness.ENABLED:
+        raise PoolUnavailable('readiness checks disabled')
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as playwright:
+        with metrics.phase('browser_launch'):
+            browser = playwright.chromium.launch(
+                executable_path=CHROMIUM_PATH, headless=True,
+                args=[flag for flag in CHROMIUM_FLAGS if not flag.startswith('--headless')],
+            )
+        try:
+            context = browser.new_context(user_agent=USER_AGENT, viewport={'width': 1920, 'height': 1080},
+                                          ignore_https_errors=True)
+            with metrics.phase('render'):
+                return _render_in(context, url, budget_ms, timeout)
+        finally:
+            browser.close()
+
+
+def run_in_tab(fn, timeout=None):
+    """Run fn(driver) in a fresh tab on a warm selenium browser"""
+    if not _enabled:
+        raise PoolUnavailable('selenium pool disabled')
+
+    def job(browser):
+        driver = browser.new_tab()
+        try:
+            return fn(driver)
+        finally:
+            browser.close_tab()
+
+    return get_pool('selenium').run(job, timeout=timeout)
+
+
+def shutdown():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+atexit.register(shutdown)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Parse-once page model shared by the extractors
+A Document parses its HTML at most once and caches every derived view
+(text, re-serialized HTML, selector lookups, pattern scanners) on first use.
+Large pages are handled lean: patterns scan the raw source instead of a
+re-serialized tree, and only the regions an extractor asks for are parsed.
+"""
+
+import importlib.util
+import os
+
+import metrics
+from extractors import Scanner
+
+# 'lxml' is noticeably faster on large DOMs but normalizes markup slightly
+# differently, so it is opt-in; html.parser keeps output identical to before
+DEFAULT_PARSER = os.environ.get('SCRAPER_HTML_PARSER', 'html.parser')
+
+# 'auto' goes lean for pages of at least LEAN_THRESHOLD characters; '1' always, '0' never
+LEAN_PARSE = os.environ.get('SCRAPER_LEAN_PARSE', 'auto')
+LEAN_THRESHOLD = int(float(os.environ.get('SCRAPER_LEAN_THRESHOLD_MB', 1)) * 1024 * 1024)
+
+_MISSING = object()
+
+
+def resolve_parser(parser=None):
+    """Requested parser backend, falling back to html.parser when lxml is not installed"""
+    parser = parser or DEFAULT_PARSER
+    if parser.startswith('lxml') and importlib.util.find_spec('lxml') is None:
+        return 'html.parser'
+    return parser
+
+
+def resolve_lean(source, lean=None):
+    """Whether a page of this source should be parsed lean"""
+    if lean is not None:
+        return lean
+    if source is None or LEAN_PARSE == '0':
+        return False
+    return LEAN_PARSE == '1' or len(source) >= LEAN_THRESHOLD
+
+
+def selector_regions(selectors):
+    """(ids, classes, tag names) of the outermost element each simple CSS selector can match in"""
+    ids, classes, tags = set(), set(), set()
+    for selector in selectors:
+        outer = selector.split()[0].split('>')[0]
+        name, _, rest = outer.partition('#') if '#' in outer else outer.partition('.')
+        if '#' in outer:
+            ids.add(rest.split('.')[0])
+        elif '.' in outer:
+            classes.add(rest.split('.')[0])
+        elif name:
+            tags.add(name.lower())
+    return ids, classes, tags
+
+
+def region_strainer(selectors):
+    """A parse_only filter that keeps just the subtrees the selectors can match in"""
+    from bs4 import SoupStrainer
+
+    ids, classes, tags = selector_regions(selectors)
+
+    def wanted(name, attrs):
+        attrs = attrs or {}
+        if name in tags or attrs.get('id') in ids:
+            return True
+        names = attrs.get('class') or ()
+        if isinstance(names, str):
+            names = names.split()
+        return any(cls in classes for cls in names)
+
+    if hasattr(SoupStrainer, 'allow_tag_creation'):  # bs4 >= 4.13
+        class RegionStrainer(SoupStrainer):
+            def allow_tag_creation(self, nsprefix, name, attrs):
+                return wanted(name, attrs)
+
+            def allow_string_creation(self, string):
+                return False
+
+        return RegionStrainer(name=True)
+    return SoupStrainer(wanted)
+
+
+class Document:
+    """One fetched page: raw source plus lazily computed, cached views of it"""
+
+    def __init__(self, source, url=None, parser=None, soup=None, lean=None):
+        self.source = source
+        self.url = url
+        self.parser = resolve_parser(parser)
+        self.lean = resolve_lean(source, lean)
+        self._regions = None
+        self._soup = soup
+        self._text = None
+        self._text_lower = None
+        self._serialized = None
+        self._scanners = {}
+        self._selections = {}
+
+    @classmethod
+    def from_soup(cls, soup, url=None):
+        """Wrap an already parsed BeautifulSoup tree"""
+        return cls(None, url=url, soup=soup)
+
+    def focus(self, selectors):
+        """Declare the selectors an extractor will use; a lean document parses only their regions"""
+        if self._soup is None:
+            self._regions = list(selectors)
+        return self
+
+    @property
+    def soup(self):
+        if self._soup is None:
+            from bs4 import BeautifulSoup
+            with metrics.phase('parse'):
+                if self.lean and self._regions:
+                    self._soup = BeautifulSoup(self.source, self.parser, parse_only=region_strainer(self._regions))
+                else:
+                    self._soup = BeautifulSoup(self.source, self.parser)
+        return self._soup
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.soup.get_text()
+        return self._text
+
+    @property
+    def text_lower(self):
+        if self._text_lower is None:
+            self._text_lower = self.text.lower()
+        return self._text_lower
+
+    @property
+    def serialized(self):
+        """The parsed tree written back out as HTML (what str(soup) returns); a lean document's raw source"""
+        if self._serialized is None:
+            if self.lean and self.source is not None:
+                return self.source
+            self._serialized = str(self.soup)
+        return self._serialized
+
+    def scanner(self, view='serialized'):
+        """Cached pattern Scanner over the 'serialized' tree or the raw 'source'"""
+        if view not in self._scanners:
+            html = self.source if view == 'source' and self.source is not None else self.serialized
+            self._scanners[view] = Scanner(html)
+        return self._scanners[view]
+
+    def select_one(self, selector):
+        element = self._selections.get(selector, _MISSING)
+        if element is _MISSING:
+            element = self.soup.select_one(selector)
+            self._selections[selector] = element
+        return element
+
+    def release(self):
+        """Drop every cached view; a tree this document parsed itself is torn down at once"""
+        if self._soup is not None and self.source is not None:
+            # bs4 trees are full of parent/sibling cycles that would otherwise wait for the cycle collector
+            self._soup.decompose()
+        self._soup = None
+        self._text = None
+        self._text_lower = None
+        self._serialized = None
+        self._scanners.clear()
+        self._selections.clear()
+
+
+def as_document(page, url=None):
+    """Accept a Document, a BeautifulSoup tree or an HTML string"""
+    if isinstance(page, Document):
+        return page
+    if isinstance(page, str):
+        return Document(page, url=url)
+    return Document.from_soup(page, url=url)
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Per-host health records for receipt API endpoint templates
+Remembers which endpoint template served data for a host so later lookups
+try it first, and which templates keep failing so they can be skipped
+"""
+
+import os
+import sys
+import time
+
+import store
+
+# A template that failed this many times in a row is treated as dead...
+DEAD_AFTER = int(os.environ.get('SCRAPER_ENDPOINT_DEAD_AFTER', 5))
+# ...until this many seconds have passed since its last failure
+DEAD_RETRY_AFTER = float(os.environ.get('SCRAPER_ENDPOINT_RETRY_AFTER', 6 * 3600))
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS endpoint_health (
+        host TEXT NOT NULL,
+        template TEXT NOT NULL,
+        successes INTEGER NOT NULL DEFAULT 0,
+        failures INTEGER NOT NULL DEFAULT 0,
+        consecutive_failures INTEGER NOT NULL DEFAULT 0,
+        last_success REAL,
+        last_failure REAL,
+        last_latency REAL,
+        PRIMARY KEY (host, template)
+    )''',
+]
+
+
+def _conn():
+    store.ensure_schema('endpoint_health', SCHEMA)
+    return store.connect()
+
+
+def health(host):
+    """{template: record} for every template seen on host"""
+    rows = _conn().execute(
+        'SELECT template, successes, failures, consecutive_failures, last_success, last_failure, last_latency '
+        'FROM endpoint_health WHERE host = ?', (host,),
+    ).fetchall()
+    keys = ('successes', 'failures', 'consecutive_failures', 'last_success', 'last_failure', 'last_latency')
+    return {row[0]: dict(zip(keys, row[1:])) for row in rows}
+
+
+def plan(host, templates):
+    """Split templates into (preferred, others): the last known winner, then live templates"""
+    try:
+        records = health(host)
+    except Exception:
+        return None, list(templates)
+
+    now = time.time()
+    winner = None
+    live = []
+    for template in templates:
+        record = records.get(template)
+        if record and record['consecutive_failures'] >= DEAD_AFTER \
+                and now - (record['last_failure'] or 0) < DEAD_RETRY_AFTER:
+            continue
+        live.append(template)
+        if record and record['last_success'] and record['consecutive_failures'] == 0:
+            if winner is None or record['last_success'] > records[winner]['last_success']:
+                winner = template
+
+    if not live:
+        # Everything looks dead (the host may have been down); probe them all again
+        live = list(templates)
+    if winner is not None:
+        live.remove(winner)
+    return winner, live
+
+
+def record(host, template, ok, latency=None):
+    now = time.time()
+    try:
+        if ok:
+            _conn().execute(
+                'INSERT INTO endpoint_health (host, template, successes, consecutive_failures, last_success, last_latency) '
+                'VALUES (?, ?, 1, 0, ?, ?) '
+                'ON CONFLICT(host, template) DO UPDATE SET successes = successes + 1, '
+                'consecutive_failures = 0, last_success = excluded.last_success, last_latency = excluded.last_latency',
+                (host, template, now, latency),
+            )
+        else:
+            _conn().execute(
+                'INSERT INTO endpoint_health (host, template, failures, consecutive_failures, last_failure, last_latency) '
+                'VALUES (?, ?, 1, 1, ?, ?) '
+                'ON CONFLICT(host, template) DO UPDATE SET failures = failures + 1, '
+                'consecutive_failures = consecutive_failures + 1, last_failure = excluded.last_failure, '
+                'last_latency = excluded.last_latency',
+                (host, template, now, latency),
+            )
+    except Exception as e:
+        print(f"Endpoint health write failed: {e}", file=sys.stderr)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Progress events for a running job
+A job that asks for events reports what it is doing while it runs: phases
+starting and finishing, retry attempts, the method picked, and each field as
+it is extracted. The worker frames them as lines ahead of the job's result;
+anywhere else emitting is a no-op.
+"""
+
+import contextlib
+import contextvars
+import time
+
+_current = contextvars.ContextVar('scraper_events', default=None)
+
+
+@contextlib.contextmanager
+def stream(send, started=None):
+    """Deliver the events emitted by the code in this block (one job) to send(event)
+
+    `started` is the perf_counter() the elapsed times count from (default: now).
+    """
+    if started is None:
+        started = time.perf_counter()
+
+    def timestamped(event):
+        event['elapsedMs'] = round((time.perf_counter() - started) * 1000, 1)
+        send(event)
+
+    token = _current.set(timestamped)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def enabled():
+    """Whether anyone is listening to the current job's events"""
+    return _current.get() is not None
+
+
+def emit(kind, **data):
+    """Report one event of the current job (no-op when the job did not ask for events)"""
+    send = _current.get()
+    if send is not None:
+        send({'type': kind, **data})
+
+
+def field(name, value):
+    """Report one extracted field"""
+    emit('field', name=name, value=value)
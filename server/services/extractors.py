@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Compiled extraction patterns for every scraper
+Each pattern is compiled once, on first use rather than at import, and also
+carries the literal text any match must contain, so a document is only
+scanned by the patterns that can possibly match it
+"""
+
+import re
+
+import events
+import metrics
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# Characters that case-insensitively match an ASCII letter but do not lower() to it
+_FOLD_FIXUPS = str.maketrans({'\u0131': 'i', '\u017f': 's', '\u0307': None})
+
+
+class FieldPattern:
+    """A compiled pattern plus literal sets a match must contain (one literal from each set)"""
+
+    __slots__ = ('pattern', 'flags', '_regex', '_literals')
+
+    def __init__(self, pattern, flags):
+        self.pattern = pattern
+        self.flags = flags
+        self._regex = None
+        self._literals = None
+
+    @property
+    def regex(self):
+        if self._regex is None:
+            self._regex = re.compile(self.pattern, self.flags)
+        return self._regex
+
+    @property
+    def literals(self):
+        if self._literals is None:
+            self._literals = required_literals(self.pattern, self.flags)
+        return self._literals
+
+    def __repr__(self):
+        return f'FieldPattern({self.pattern!r}, literals={self.literals!r})'
+
+
+def _best(candidates):
+    """Pick the candidate whose shortest alternative is longest"""
+    if not candidates:
+        return None
+    return max(candidates, key=lambda alternatives: min(len(text) for text in alternatives))
+
+
+def _literal_candidates(items):
+    """Collect literal runs that every match of the parsed sequence must contain"""
+    candidates = []
+    run = []
+
+    def flush():
+        if run:
+            candidates.append((''.join(run),))
+            run.clear()
+
+    for op, arg in items:
+        name = str(op)
+        if name == 'LITERAL':
+            run.append(chr(arg))
+        elif name == 'SUBPATTERN':
+            sub = list(arg[-1])
+            if sub and all(str(sub_op) == 'LITERAL' for sub_op, _ in sub):
+                run.extend(chr(sub_arg) for _, sub_arg in sub)
+            else:
+                flush()
+                best = _best(_literal_candidates(sub))
+                if best:
+                    candidates.append(best)
+        elif name == 'BRANCH':
+            flush()
+            alternatives = []
+            for branch in arg[1]:
+                best = _best(_literal_candidates(list(branch)))
+                if not best:
+                    alternatives = None
+                    break
+                alternatives.extend(best)
+            if alternatives:
+                candidates.append(tuple(alternatives))
+        elif name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') and arg[0] >= 1:
+            flush()
+            best = _best(_literal_candidates(list(arg[2])))
+            if best:
+                candidates.append(best)
+        else:
+            flush()
+    flush()
+    return candidates
+
+
+def required_literals(pattern, flags=0, limit=4):
+    """Lower-cased literal sets that every match contains (one alternative of each set)"""
+    try:
+        parsed = sre_parse.parse(pattern, flags)
+    except Exception:
+        return ()
+    candidates = {}
+    for alternatives in _literal_candidates(list(parsed)):
+        alternatives = tuple(dict.fromkeys(text.lower().translate(_FOLD_FIXUPS) for text in alternatives))
+        candidates[alternatives] = min(len(text) for text in alternatives)
+    ranked = sorted(candidates, key=candidates.get, reverse=True)
+    # Very short literals are nearly always present; keep them only when nothing better exists
+    selective = [alternatives for alternatives in ranked if candidates[alternatives] >= 3]
+    return tuple((selective or ranked)[:limit])
+
+
+def compile_fields(spec, flags=re.IGNORECASE):
+    """Compile {field: [pattern, ...]} into {field: [FieldPattern, ...]}, keeping order"""
+    return {field: [FieldPattern(pattern, flags) for pattern in patterns]
+            for field, patterns in spec.items()}
+
+
+class Scanner:
+    """A document plus a lazily built lower-cased copy used for literal prefiltering"""
+
+    def __init__(self, html):
+        self.html = html
+        self._folded = None
+
+    @property
+    def folded(self):
+        if self._folded is None:
+            folded = self.html.lower()
+            if '\u0131' in folded or '\u017f' in folded or '\u0307' in folded:
+                folded = folded.translate(_FOLD_FIXUPS)
+            self._folded = folded
+        return self._folded
+
+    def may_match(self, field_pattern):
+        if not field_pattern.literals:
+            return True
+        folded = self.folded
+        return all(any(literal in folded for literal in alternatives)
+                   for alternatives in field_pattern.literals)
+
+    def first(self, field_patterns):
+        """group(1) of the first pattern that matches, in precedence order"""
+        for field_pattern in field_patterns:
+            if not self.may_match(field_pattern):
+                continue
+            match = field_pattern.regex.search(self.html)
+            if match:
+                return match.group(1)
+        return None
+
+    def values(self, field_patterns):
+        """Lazily yield group(1) of every match, pattern by pattern, in document order"""
+        for field_pattern in field_patterns:
+            if not self.may_match(field_pattern):
+                continue
+            for match in field_pattern.regex.finditer(self.html):
+                yield match.group(1)
+
+    def extract(self, fields):
+        """First match for every field of a compiled table, stripped"""
+        extracted = {}
+        for field, field_patterns in fields.items():
+            with metrics.phase(f'extract.{field}'):
+                value = self.first(field_patterns)
+            if value is not None:
+                extracted[field] = value.strip()
+                events.field(field, extracted[field])
+        return extracted
+
+
+# Generic fallback in extract_product_data
+PRODUCT_FIELDS = compile_fields({
+    'title': [
+        r'<title[^>]*>([^<]+)</title>',
+        r'product[_\s]*title[^>]*>([^<]+)<',
+        r'item[_\s]*name[^>]*>([^<]+)<'
+    ],
+    'price': [
+        r'\$([0-9,]+\.?[0-9]*)',
+        r'price[^>]*>\$?([0-9,]+\.?[0-9]*)',
+        r'([0-9,]+\.?[0-9]*)\s*USD'
+    ],
+    'rating': [
+        r'rating[^>]*>([0-9\.]+)',
+        r'([0-9\.]+)\s*out\s*of\s*5',
+        r'([0-9\.]+)\s*stars?'
+    ],
+    'availability': [
+        r'(in\s*stock|out\s*of\s*stock|available|unavailable)',
+        r'availability[^>]*>([^<]+)<'
+    ]
+})
+
+# extract_ebay_data
+EBAY_FIELDS = compile_fields({
+    'title': [
+        r'<h1[^>]*>([^<]+)</h1>',
+        r'item[_\s]*title[^>]*>([^<]+)<'
+    ],
+    'price': [
+        r'US\s*\$([0-9,]+\.?[0-9]*)',
+        r'\$([0-9,]+\.?[0-9]*)',
+        r'price[^>]*>\$?([0-9,]+\.?[0-9]*)'
+    ]
+})
+
+# extract_real_product_data, per site
+RENDERED_FIELDS = {
+    'amazon.com': compile_fields({
+        'title': [
+            r'<span[^>]*id="productTitle"[^>]*>([^<]+)</span>',
+            r'"title":"([^"]+)"',
+            r'<h1[^>]*>([^<]+)</h1>'
+        ],
+        'price': [
+            r'<span[^>]*class="[^"]*a-price-whole[^"]*"[^>]*>([^<]+)</span>',
+            r'"price":"([^"]+)"',
+            r'\$([0-9,]+\.?[0-9]*)',
+            r'<span[^>]*>\$([0-9,]+\.?[0-9]*)</span>'
+        ],
+        'rating': [
+            r'<span[^>]*class="[^"]*a-icon-alt[^"]*"[^>]*>([0-9\.]+)[^<]*</span>',
+            r'"rating":([0-9\.]+)',
+            r'([0-9\.]+) out of 5'
+        ],
+        'availability': [
+            r'<div[^>]*id="availability"[^>]*>.*?<span[^>]*>([^<]+)</span>',
+            r'"availability":"([^"]+)"',
+            r'(In Stock|Out of Stock|Available|Unavailable)'
+        ]
+    }, re.IGNORECASE | re.DOTALL),
+    'ebay.com': compile_fields({
+        'title': [
+            r'<h1[^>]*id="x-title-label-lbl"[^>]*>([^<]+)</h1>',
+            r'"title":"([^"]+)"',
+            r'<h1[^>]*>([^<]+)</h1>'
+        ],
+        'price': [
+            r'<span[^>]*class="[^"]*notranslate[^"]*"[^>]*>US \$([^<]+)</span>',
+            r'US \$([0-9,]+\.?[0-9]*)',
+            r'\$([0-9,]+\.?[0-9]*)'
+        ],
+        'condition': [
+            r'<div[^>]*class="[^"]*u-flL[^"]*"[^>]*>([^<]+)</div>',
+            r'"condition":"([^"]+)"'
+        ],
+        'availability': [
+            r'<span[^>]*class="[^"]*vi-acc-del-range[^"]*"[^>]*>([^<]+)</span>',
+            r'"availability":"([^"]+)"'
+        ]
+    }, re.IGNORECASE | re.DOTALL),
+    # Generic e-commerce patterns
+    None: compile_fields({
+        'title': [
+            r'<h1[^>]*>([^<]+)</h1>',
+            r'"title":"([^"]+)"',
+            r'<title>([^<]+)</title>'
+        ],
+        'price': [
+            r'\$([0-9,]+\.?[0-9]*)',
+            r'"price":"([^"]+)"',
+            r'<span[^>]*class="[^"]*price[^"]*"[^>]*>([^<]+)</span>'
+        ],
+        'rating': [
+            r'([0-9\.]+) out of 5',
+            r'"rating":([0-9\.]+)',
+            r'<span[^>]*class="[^"]*rating[^"]*"[^>]*>([^<]+)</span>'
+        ],
+        'availability': [
+            r'(In Stock|Out of Stock|Available|Unavailable)',
+            r'"availability":"([^"]+)"'
+        ]
+    }, re.IGNORECASE | re.DOTALL),
+}
+
+# extract_data_from_rendered_content (Bank of Abyssinia receipts)
+RECEIPT_FIELDS = compile_fields({
+    'amount': [
+        r'ETB\s+([\d,]+\.?\d*)',
+        r'Amount[:\s]+([\d,]+\.?\d*)',
+        r'Transferred\s+amount[:\s]+ETB\s+([\d,]+\.?\d*)',
+    ],
+    'account': [
+        r'Account[:\s]+(\d+\*+\d+)',
+        r'Receiver.*Account[:\s]+(\d+\*+\d+)',
+    ],
+    'name': [
+        r'Receiver.*Name[:\s]+([A-Z\s]+)',
+        r'Name[:\s]+([A-Z\s]+)',
+    ],
+    'date': [
+        r'(\d{2}/\d{2}/\d{2,4}\s+\d{2}:\d{2})',
+        r'Date[:\s]+(\d{2}/\d{2}/\d{2,4}\s+\d{2}:\d{2})',
+    ]
+})
+
+
+def rendered_fields_for(hostname):
+    """Pick the extract_real_product_data table for a hostname"""
+    for site, fields in RENDERED_FIELDS.items():
+        if site and site in hostname:
+            return fields
+    return RENDERED_FIELDS[None]
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Hedged requests for slow receipt hosts and browser renders
+When a request has not answered within a high percentile of the latencies
+recently seen for its host, a duplicate is fired; the first good answer wins
+and the other is cancelled. Duplicates are paid for out of a per-host budget
+that only grows with ordinary traffic, so hedging can never add more than a
+fixed share of load on an origin. Off unless SCRAPER_HEDGE=1.
+"""
+
+import collections
+import contextvars
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import events
+import metrics
+import resource_filter
+import scheduler
+
+ENABLED = os.environ.get('SCRAPER_HEDGE', '0') == '1'
+# Hedge once a request is slower than this percentile of its host's recent good answers
+PERCENTILE = float(os.environ.get('SCRAPER_HEDGE_PERCENTILE', 95))
+# At most this many hedges per request to a host, over time
+MAX_RATE = float(os.environ.get('SCRAPER_HEDGE_MAX_RATE', 0.1))
+# Good answers seen on a host before its percentile is trusted
+MIN_SAMPLES = int(os.environ.get('SCRAPER_HEDGE_MIN_SAMPLES', 20))
+# Never hedge sooner than this, whatever the percentile says
+MIN_DELAY = float(os.environ.get('SCRAPER_HEDGE_MIN_MS', 50)) / 1000
+# Recent latencies kept per host and kind of request
+WINDOW = 200
+# Hedges a quiet host can have saved up
+BURST = 2.0
+# How often a hedged subprocess checks whether it lost
+POLL = 0.1
+
+# Runs only the duplicates; the first attempt stays on the caller's thread
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('SCRAPER_HEDGE_THREADS', 16)),
+                               thread_name_prefix='hedge')
+
+_cancel = contextvars.ContextVar('scraper_hedge_cancel', default=None)
+
+
+class Cancel:
+    """Set once a hedged attempt has lost; runs the callbacks that stop its blocking work"""
+
+    def __init__(self):
+        self._set = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def is_set(self):
+        return self._set
+
+    def set(self):
+        # Callbacks run under the lock, so once discard() returns, its callback is not running
+        with self._lock:
+            if self._set:
+                return
+            self._set = True
+            for callback in self._callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    print(f"Hedge cancel callback failed: {e}", file=sys.stderr)
+            self._callbacks.clear()
+
+    def on_set(self, callback):
+        """Run callback when the attempt loses (now, if it already has)"""
+        with self._lock:
+            if not self._set:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+class HostLatency:
+    """Recent good-answer latencies and the hedge budget for one host and kind of request"""
+
+    def __init__(self):
+        self.samples = collections.deque(maxlen=WINDOW)
+        self.budget = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def threshold(self):
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        with self.lock:
+            if len(self.samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * PERCENTILE / 100))
+        return max(MIN_DELAY, ordered[index])
+
+    def earn(self):
+        with self.lock:
+            self.budget = min(BURST, self.budget + MAX_RATE)
+
+    def spend(self):
+        with self.lock:
+            if self.budget < 1:
+                return False
+            self.budget -= 1
+            return True
+
+
+_hosts = {}
+_lock = threading.Lock()
+_stats = {'requests': 0, 'hedged': 0, 'hedgeWins': 0, 'overBudget': 0}
+
+
+def _latency(host, kind):
+    with _lock:
+        entry = _hosts.get((host, kind))
+        if entry is None:
+            entry = _hosts[(host, kind)] = HostLatency()
+        return entry
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def stats():
+    """Hedging counters, plus the current hedge delay per host and kind in ms"""
+    with _lock:
+        entries = dict(_hosts)
+        counters = dict(_stats)
+    delays = {}
+    for (host, kind), entry in entries.items():
+        threshold = entry.threshold()
+        if threshold is not None:
+            delays[f'{kind}:{host}'] = round(threshold * 1000, 1)
+    return dict(counters, enabled=ENABLED, delayMs=delays)
+
+
+def cancelled():
+    """Whether the hedged attempt running this code has lost and should stop"""
+    event = _cancel.get()
+    return event is not None and event.is_set()
+
+
+def current():
+    """The Cancel of the hedged attempt running this code, or None outside one"""
+    return _cancel.get()
+
+
+def run_process(cmd, timeout):
+    """subprocess.run(cmd, capture_output=True, text=True, timeout=timeout) that stops early once this attempt loses"""
+    import signal
+    import subprocess
+    expires = time.monotonic() + timeout
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                          start_new_session=True) as process:
+        while True:
+            try:
+                stdout, stderr = process.communicate(timeout=min(POLL, max(0.0, expires - time.monotonic())))
+                return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+            except subprocess.TimeoutExpired:
+                if not cancelled() and time.monotonic() < expires:
+                    continue
+            # Chromium forks helpers; take down the whole group
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+            process.communicate()
+            if cancelled():
+                return subprocess.CompletedProcess(cmd, -signal.SIGKILL, '', '')
+            raise subprocess.TimeoutExpired(cmd, timeout)
+
+
+def _should_hedge(entry):
+    if entry.spend():
+        return True
+    _count('overBudget')
+    return False
+
+
+def _isolated(fn):
+    """fn() with its render time and blocked requests counted apart from the job's: (answer, timings, blocked)"""
+    with metrics.separate() as timings, resource_filter.collect() as blocked:
+        return fn(), timings, blocked
+
+
+def _adopt(timings, blocked):
+    # Only the winning attempt's render time and blocked requests count towards the job
+    metrics.merge(timings)
+    resource_filter.merge(blocked)
+
+
+def call(host, kind, fn, is_good=bool):
+    """fn(), duplicated if it is slow for host; the first good answer wins
+
+    The first attempt runs on the calling thread; only the duplicate takes an
+    executor thread. Losing attempts see cancelled() turn true. If no attempt
+    is good, the first attempt's answer (or exception) is returned.
+    """
+    entry = _latency(host, kind)
+    entry.earn()
+    _count('requests')
+    threshold = entry.threshold() if ENABLED else None
+
+    def attempt(cancel):
+        _cancel.set(cancel)
+        started = time.monotonic()
+        answer, timings, blocked = _isolated(fn)
+        if is_good(answer):
+            entry.add(time.monotonic() - started)
+        return answer, timings, blocked
+
+    if threshold is None:
+        # Not hedging: still time good answers so the host's percentile builds up
+        started = time.monotonic()
+        answer = fn()
+        if is_good(answer):
+            entry.add(time.monotonic() - started)
+        return answer
+
+    primary_cancel, hedge_cancel = Cancel(), Cancel()
+    lock = threading.Lock()
+    flight = {'primaryDone': False, 'hedge': None}
+
+    def hedge_won(future):
+        if future.exception() is None and is_good(future.result()[0]):
+            primary_cancel.set()
+
+    def launch():
+        # Runs on the scheduler's timer thread once the threshold has passed
+        with lock:
+            if flight['primaryDone'] or not _should_hedge(entry):
+                return
+            _count('hedged')
+            print(f"Hedging {kind} request to {host} after {threshold * 1000:.0f}ms", file=sys.stderr)
+            events.emit('hedge', request=kind, afterMs=round(threshold * 1000, 1))
+            flight['hedge'] = _executor.submit(contextvars.copy_context().run, attempt, hedge_cancel)
+        flight['hedge'].add_done_callback(hedge_won)
+
+    scheduler.call_later(threshold, contextvars.copy_context().run, launch)
+    answer = timings = blocked = error = None
+    try:
+        answer, timings, blocked = contextvars.copy_context().run(attempt, primary_cancel)
+    except Exception as e:
+        error = e
+    finally:
+        with lock:
+            flight['primaryDone'] = True
+            hedged = flight['hedge']
+
+    primary_good = error is None and is_good(answer)
+    if hedged is not None and (not primary_good or primary_cancel.is_set()):
+        # The duplicate answered first (and the primary was told to stop), or the primary was no good
+        try:
+            hedge_answer, hedge_timings, hedge_blocked = hedged.result()
+            if is_good(hedge_answer):
+                _count('hedgeWins')
+                _adopt(hedge_timings, hedge_blocked)
+                return hedge_answer
+        except Exception:
+            pass
+    elif hedged is not None:
+        hedge_cancel.set()
+        hedged.cancel()
+    if error is not None:
+        raise error
+    _adopt(timings, blocked)
+    return answer
+
+
+async def call_async(host, kind, fn, is_good=bool):
+    """call() for a coroutine function; the losing attempt's task is cancelled outright"""
+    import asyncio
+    entry = _latency(host, kind)
+    entry.earn()
+    _count('requests')
+    threshold = entry.threshold() if ENABLED else None
+
+    async def attempt():
+        # Each task has its own context, so this keeps the attempts' render times and blocked requests apart
+        with metrics.separate() as timings, resource_filter.collect() as blocked:
+            started = time.monotonic()
+            answer = await fn()
+        if is_good(answer):
+            entry.add(time.monotonic() - started)
+        return answer, timings, blocked
+
+    if threshold is None:
+        started = time.monotonic()
+        answer = await fn()
+        if is_good(answer):
+            entry.add(time.monotonic() - started)
+        return answer
+
+    tasks = [asyncio.ensure_future(attempt())]
+    done, _ = await asyncio.wait(tasks, timeout=threshold)
+    if not done and _should_hedge(entry):
+        _count('hedged')
+        print(f"Hedging {kind} request to {host} after {threshold * 1000:.0f}ms", file=sys.stderr)
+        events.emit('hedge', request=kind, afterMs=round(threshold * 1000, 1))
+        tasks.append(asyncio.ensure_future(attempt()))
+
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and is_good(task.result()[0]):
+                    if task is not tasks[0]:
+                        _count('hedgeWins')
+                    answer, timings, blocked = task.result()
+                    _adopt(timings, blocked)
+                    return answer
+        answer, timings, blocked = tasks[0].result()
+        _adopt(timings, blocked)
+        return answer
+    finally:
+        for task in tasks:
+            task.cancel()
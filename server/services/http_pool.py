@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Shared pooled HTTP session for every scraper fetch path
+Keeps connections alive per host so repeat requests to the same bank or shop
+skip the TCP+TLS handshake, and counts pool hits and misses. `requests` is
+imported with the session, on the first request, so paths that never fetch
+over HTTP (browser rendering, cache hits) do not pay for it.
+"""
+
+import contextvars
+import os
+import threading
+import time
+
+import metrics
+
+DEFAULT_POOL_SIZE = int(os.environ.get('SCRAPER_POOL_SIZE', 10))
+MAX_POOLS = int(os.environ.get('SCRAPER_MAX_POOLS', 50))
+CONNECT_TIMEOUT = float(os.environ.get('SCRAPER_CONNECT_TIMEOUT', 10))
+READ_TIMEOUT = float(os.environ.get('SCRAPER_READ_TIMEOUT', 30))
+# Page bodies past this size are cut off rather than held in memory whole
+MAX_BODY_BYTES = int(float(os.environ.get('SCRAPER_MAX_BODY_MB', 10)) * 1024 * 1024)
+
+# Hosts we hit constantly get bigger pools; everything else gets DEFAULT_POOL_SIZE
+HOST_POOL_SIZES = {
+    'cs.bankofabyssinia.com': 20,
+    'apps.bankofabyssinia.com': 20,
+    'apps.cbe.com.et': 20,
+}
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def count(host, key):
+    """Count a pool checkout for host as 'hits' or 'misses'"""
+    with _stats_lock:
+        host_stats = _stats.setdefault(host, {'hits': 0, 'misses': 0})
+        host_stats[key] += 1
+
+
+class RequestCancelled(Exception):
+    """The request was abandoned because the attempt it belonged to was cancelled"""
+
+
+# (cancel, interrupts) for the request running in this context; the pool registers
+# an interrupt on it for every connection the request checks out
+_cancel = contextvars.ContextVar('http_pool_cancel', default=None)
+
+
+def watch(conn):
+    """Shut conn's socket down if the request that checked it out is cancelled"""
+    state = _cancel.get()
+    if state is None:
+        return
+    cancel, interrupts = state
+
+    def interrupt():
+        # Wakes a read blocked on the socket in the request's thread
+        sock = getattr(conn, 'sock', None)
+        if sock is not None:
+            import socket
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    interrupts.append(interrupt)
+    cancel.on_set(interrupt)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                from http.cookiejar import DefaultCookiePolicy
+                import requests
+                from pooled_adapter import PooledAdapter
+                session = requests.Session()
+                # Jobs share connections, not cookies; redirects within one request still keep theirs
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = PooledAdapter(pool_connections=MAX_POOLS, pool_maxsize=DEFAULT_POOL_SIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+
+def resolve_timeout(timeout=None):
+    """Turn a single read budget into a (connect, read) pair"""
+    if timeout is None:
+        return (CONNECT_TIMEOUT, READ_TIMEOUT)
+    if isinstance(timeout, (int, float)):
+        return (min(CONNECT_TIMEOUT, timeout), timeout)
+    return timeout
+
+
+def request(method, url, timeout=None, max_bytes=None, cancel=None, **kwargs):
+    """Send a request on the shared session; with max_bytes the body is streamed and capped
+
+    `cancel` (a hedge.Cancel) interrupts the request when it is set: its
+    connection is shut down and RequestCancelled raised.
+    """
+    # The first call builds the session (importing requests); that is not network time
+    session = get_session()
+    started = time.perf_counter()
+    connecting = metrics.elapsed('connect')
+    if max_bytes is not None:
+        kwargs['stream'] = True
+    if cancel is None:
+        response = session.request(method, url, timeout=resolve_timeout(timeout), **kwargs)
+        if max_bytes is not None:
+            read_capped(response, max_bytes)
+    else:
+        response = _cancellable(session, cancel, method, url, timeout, max_bytes, kwargs)
+    # response.elapsed runs from sending the request to parsing the headers;
+    # whatever follows it is the body download
+    headers_at = response.elapsed.total_seconds()
+    metrics.add('ttfb', max(0.0, headers_at - (metrics.elapsed('connect') - connecting)))
+    metrics.add('download', max(0.0, time.perf_counter() - started - headers_at))
+    return response
+
+
+def _cancellable(session, cancel, method, url, timeout, max_bytes, kwargs):
+    if cancel.is_set():
+        raise RequestCancelled(url)
+    interrupts = []
+    token = _cancel.set((cancel, interrupts))
+    try:
+        response = session.request(method, url, timeout=resolve_timeout(timeout), **kwargs)
+        if max_bytes is not None:
+            read_capped(response, max_bytes)
+    except Exception:
+        if cancel.is_set():
+            raise RequestCancelled(url) from None
+        raise
+    finally:
+        _cancel.reset(token)
+        for interrupt in interrupts:
+            cancel.discard(interrupt)
+    # A shut-down socket can also end the body early without an error
+    if cancel.is_set():
+        response.close()
+        raise RequestCancelled(url)
+    return response
+
+
+def read_capped(response, max_bytes):
+    """Read a streamed body, keeping at most max_bytes; sets response.truncated"""
+    chunks = []
+    size = 0
+    response.truncated = False
+    for chunk in response.iter_content(64 * 1024):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            response.truncated = True
+            break
+    # requests serves .content and .text from _content once a body has been read
+    response._content = b''.join(chunks)[:max_bytes]
+    response.close()
+    return response
+
+
+def get(url, timeout=None, **kwargs):
+    return request('GET', url, timeout=timeout, **kwargs)
+
+
+def head(url, timeout=None, **kwargs):
+    return request('HEAD', url, timeout=timeout, **kwargs)
+
+
+def pool_stats():
+    """Pool hit/miss counters, overall and per host"""
+    with _stats_lock:
+        hosts = {host: dict(counts) for host, counts in _stats.items()}
+    return {
+        'hits': sum(counts['hits'] for counts in hosts.values()),
+        'misses': sum(counts['misses'] for counts in hosts.values()),
+        'hosts': hosts,
+    }
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+In-flight request coalescing
+A job whose key (transaction ID, or URL and method) is already being scraped
+in this process attaches to the running scrape instead of starting its own,
+and gets a copy of the same result. Each waiter keeps its own deadline: one
+that runs out gives up alone while the scrape carries on for the others. On
+the async engine a scrape nobody is waiting for any more is cancelled.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import metrics
+import scheduler
+
+ENABLED = os.environ.get('SCRAPER_COALESCE', '1') != '0'
+
+
+class Flight:
+    """One running scrape and the jobs waiting on it"""
+
+    # On the async engine `result` holds the scrape's task
+    __slots__ = ('done', 'result', 'error', 'waiters', 'callbacks')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+        # Called when the flight lands, to resume waiters that gave their thread back
+        self.callbacks = []
+
+
+_flights = {}
+_lock = threading.Lock()
+_stats = {'leaders': 0, 'coalesced': 0, 'abandoned': 0, 'cancelled': 0}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def stats():
+    """How many scrapes ran, and how many jobs attached to one instead"""
+    with _lock:
+        return dict(_stats, inFlight=len(_flights) + len(_async_flights))
+
+
+def _copy(result, coalesced=False):
+    # Every waiter gets its own result, like a cache hit, since jobs annotate theirs
+    copied = json.loads(json.dumps(result))
+    if coalesced and isinstance(copied, dict):
+        copied['coalesced'] = True
+    return copied
+
+
+def _timed_out(seconds):
+    return {'success': False, 'error': f'Timed out after {seconds:g}s waiting for an identical request in flight'}
+
+
+def _when_landed(flight, callback):
+    """Call callback() once the flight has landed (now, if it already has)"""
+    with _lock:
+        if not flight.done.is_set():
+            flight.callbacks.append(callback)
+            return
+    callback()
+
+
+def _attached(flight, key):
+    """Waiter side of call(): wait until the flight lands or this job's deadline passes
+
+    A resumable job does not wait on its thread, which the leader may need
+    to resume on: it is rescheduled and woken when the flight lands.
+    """
+    deadline = scheduler.current_deadline()
+    if scheduler.is_resumable():
+        state = scheduler.job_state()
+        state['attached'] = (key, flight)
+        waiting_since = state.setdefault('attachedAt', time.perf_counter())
+        if not flight.done.is_set() and deadline.remaining() > 0:
+            raise scheduler.Reschedule(deadline.remaining(), wake=lambda resume: _when_landed(flight, resume))
+        landed = flight.done.is_set()
+        metrics.add('coalesced', time.perf_counter() - waiting_since)
+    else:
+        with metrics.phase('coalesced'):
+            landed = flight.done.wait(deadline.remaining())
+    with _lock:
+        flight.waiters -= 1
+        if not landed:
+            _stats['abandoned'] += 1
+    if not landed:
+        print(f"Gave up waiting on in-flight {key}", file=sys.stderr)
+        return _timed_out(deadline.seconds)
+    if flight.error is not None:
+        raise flight.error
+    return _copy(flight.result, coalesced=True)
+
+
+def call(key, fn):
+    """fn(), shared with every concurrent call for the same key"""
+    if not ENABLED:
+        return fn()
+    state = scheduler.job_state()
+    attached = state.get('attached')
+    if attached is not None and attached[0] == key:
+        # A waiter resuming: back to the flight it joined, even if that has landed since
+        return _attached(attached[1], key)
+    with _lock:
+        flight = _flights.get(key)
+        # A leader resuming after a reschedule takes its own flight back
+        leader = flight is None or state.get('leads') is flight
+        if flight is None:
+            flight = _flights[key] = Flight()
+            _stats['leaders'] += 1
+        elif not leader:
+            flight.waiters += 1
+            _stats['coalesced'] += 1
+    if not leader:
+        return _attached(flight, key)
+
+    # This job leads: it runs the scrape in its own thread, deadline and timings
+    try:
+        result = fn()
+        flight.result = _copy(result)
+    except scheduler.Reschedule:
+        # Still in flight: the waiters stay attached until the job resumes and lands it
+        state['leads'] = flight
+        raise
+    except BaseException as e:
+        flight.error = e
+        _land(key, flight)
+        raise
+    _land(key, flight)
+    return result
+
+
+def _land(key, flight):
+    with _lock:
+        del _flights[key]
+        flight.done.set()
+        callbacks, flight.callbacks = flight.callbacks, []
+    for callback in callbacks:
+        callback()
+
+
+_async_flights = {}
+
+
+async def call_async(key, fn):
+    """call() for a coroutine function, on one event loop"""
+    if not ENABLED:
+        return await fn()
+    import asyncio
+    flight = _async_flights.get(key)
+    leader = flight is None
+    if leader:
+        # The task runs in a copy of this job's context, so its timings and events are the leader's
+        flight = _async_flights[key] = Flight()
+        flight.result = asyncio.ensure_future(fn())
+        flight.result.add_done_callback(lambda _: _async_flights.pop(key, None))
+        _count('leaders')
+    else:
+        _count('coalesced')
+    task = flight.result
+    flight.waiters += 1
+
+    deadline = scheduler.current_deadline()
+    try:
+        # Shielded, so one waiter giving up (or being cancelled) leaves the scrape running for the rest
+        if leader:
+            result = await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+        else:
+            with metrics.phase('coalesced'):
+                result = await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+    except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+        flight.waiters -= 1
+        if not flight.waiters and not task.done():
+            task.cancel()
+            _count('cancelled')
+        if isinstance(e, asyncio.CancelledError):
+            raise
+        _count('abandoned')
+        return _timed_out(deadline.seconds)
+    flight.waiters -= 1
+    return _copy(result, coalesced=not leader)
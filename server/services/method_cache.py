@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Remembered auto-detection outcomes
+Caches the method `auto` picked for a host and leading path segment, so repeat
+URLs on a known site skip the detection probe entirely
+"""
+
+import os
+import sys
+import time
+from urllib.parse import urlparse
+
+import store
+
+TTL = float(os.environ.get('SCRAPER_METHOD_CACHE_TTL', 6 * 3600))
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS method_decisions (
+        pattern TEXT PRIMARY KEY,
+        method TEXT NOT NULL,
+        expires REAL NOT NULL
+    )''',
+]
+
+
+def url_pattern(url):
+    """host plus first path segment, e.g. shop.example.com/products"""
+    parsed = urlparse(url)
+    segment = parsed.path.strip('/').split('/', 1)[0]
+    return f'{(parsed.hostname or "").lower()}/{segment}'
+
+
+def _conn():
+    store.ensure_schema('method_cache', SCHEMA)
+    return store.connect()
+
+
+def get(url):
+    """Previously detected method for url's pattern, or None"""
+    if not TTL:
+        return None
+    try:
+        row = _conn().execute(
+            'SELECT method FROM method_decisions WHERE pattern = ? AND expires > ?',
+            (url_pattern(url), time.time()),
+        ).fetchone()
+    except Exception as e:
+        print(f"Method cache unavailable: {e}", file=sys.stderr)
+        return None
+    return row[0] if row else None
+
+
+def put(url, method):
+    if not TTL:
+        return
+    try:
+        _conn().execute(
+            'INSERT OR REPLACE INTO method_decisions (pattern, method, expires) VALUES (?, ?, ?)',
+            (url_pattern(url), method, time.time() + TTL),
+        )
+    except Exception as e:
+        print(f"Method cache write failed: {e}", file=sys.stderr)
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Per-phase timing for scrape jobs
+Code marks phases (detect, connect, ttfb, download, browser_launch, render,
+parse, extract.<field>) with `phase(name)`; each job's timings are attached to
+its result and aggregated, per method and host, into counters and histograms
+in the shared state database so every worker contributes to one view. Each
+job also reports the process's peak RSS while it ran.
+
+Usage: python metrics.py [--json]  (prints Prometheus text, or a JSON snapshot)
+"""
+
+import argparse
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import events
+import scheduler
+import store
+
+ENABLED = os.environ.get('SCRAPER_METRICS', '1') != '0'
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS metric_jobs (
+        method TEXT NOT NULL,
+        host TEXT NOT NULL,
+        outcome TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (method, host, outcome)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS metric_phases (
+        phase TEXT NOT NULL,
+        method TEXT NOT NULL,
+        host TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        sum REAL NOT NULL,
+        PRIMARY KEY (phase, method, host)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS metric_memory (
+        method TEXT NOT NULL,
+        host TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        sum REAL NOT NULL,
+        max REAL NOT NULL,
+        PRIMARY KEY (method, host)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS metric_phase_buckets (
+        phase TEXT NOT NULL,
+        method TEXT NOT NULL,
+        host TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (phase, method, host, bucket)
+    )''',
+]
+
+
+class Timings:
+    """Seconds spent in each phase of one job; repeated phases accumulate"""
+
+    def __init__(self):
+        self.phases = {}
+        self.total = None
+        self.peak_rss_mb = None
+        # Peak RSS of the process pool worker that parsed the page, in pipeline runs
+        self.parse_peak_rss_mb = None
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def elapsed(self, name):
+        return self.phases.get(name, 0.0)
+
+    def as_ms(self):
+        """{phase: milliseconds} as attached to results, plus the job's wall time as 'total'"""
+        with self.lock:
+            timings = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+        if self.total is not None:
+            timings['total'] = round(self.total * 1000, 1)
+        return timings
+
+
+_current = contextvars.ContextVar('scraper_timings', default=None)
+
+_memory_lock = threading.Lock()
+_jobs_running = 0
+
+
+def peak_rss_mb():
+    """The process's RSS high-water mark in MB"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss is in KB on Linux (bytes on macOS, where this is only a rough figure)
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _job_started():
+    """Reset the RSS high-water mark when no other job is running, so the next peak is this job's"""
+    global _jobs_running
+    with _memory_lock:
+        if _jobs_running == 0:
+            try:
+                with open('/proc/self/clear_refs', 'w') as f:
+                    f.write('5')
+            except OSError:
+                pass
+        _jobs_running += 1
+
+
+def _job_finished():
+    global _jobs_running
+    peak = peak_rss_mb()
+    with _memory_lock:
+        _jobs_running -= 1
+    return peak
+
+
+class phase:
+    """Time the enclosed block as `name` in the current job (no-op outside a job)"""
+
+    __slots__ = ('name', 'timings', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = _current.get()
+        if self.timings is not None:
+            self.started = time.perf_counter()
+            # Sub-phases (extract.<field>) are reported as field events instead
+            if '.' not in self.name:
+                events.emit('phase', name=self.name, state='started')
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            seconds = time.perf_counter() - self.started
+            self.timings.add(self.name, seconds)
+            if '.' not in self.name:
+                events.emit('phase', name=self.name, state='finished', ms=round(seconds * 1000, 1),
+                            failed=exc_info[0] is not None)
+        return False
+
+
+def add(name, seconds):
+    """Record time measured elsewhere against the current job"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def elapsed(name):
+    """Time the current job has spent in `name` so far"""
+    timings = _current.get()
+    return timings.elapsed(name) if timings is not None else 0.0
+
+
+@contextlib.contextmanager
+def job_scope():
+    """Collect the phases of the code in this block (one job) into a Timings, across its resumed runs"""
+    timings = scheduler.once('timings', Timings)
+    token = _current.set(timings)
+    started = scheduler.once('jobStarted', time.perf_counter)
+    _job_started()
+    try:
+        yield timings
+    finally:
+        timings.total = time.perf_counter() - started
+        timings.peak_rss_mb = _job_finished()
+        _current.reset(token)
+
+
+@contextlib.contextmanager
+def separate():
+    """Collect the phases of the code in this block into a Timings of its own instead of the job's"""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def merge(timings):
+    """Add the phases of a separate() block to the current job's"""
+    current = _current.get()
+    if current is None:
+        return
+    for name, seconds in timings.phases.items():
+        current.add(name, seconds)
+
+
+def observe_job(url, method, fn, is_success):
+    """Run fn() as one job, attach its timings to the result and aggregate them"""
+    with job_scope() as timings:
+        result = fn()
+    return finish_job(url, method, result, timings, is_success)
+
+
+async def observe_job_async(url, method, fn, is_success):
+    """observe_job for a coroutine function; the aggregate write runs off the event loop"""
+    import asyncio
+    with job_scope() as timings:
+        result = await fn()
+    return await asyncio.to_thread(finish_job, url, method, result, timings, is_success)
+
+
+def finish_job(url, method, result, timings, is_success):
+    """Attach timings and peak memory to a job's result and aggregate them"""
+    result['timings'] = timings.as_ms()
+    if timings.peak_rss_mb is not None:
+        # Concurrent jobs in one process share this figure; a lone job's is its own
+        result['memory'] = {'peakRssMb': timings.peak_rss_mb}
+        if timings.parse_peak_rss_mb is not None:
+            result['memory']['parsePeakRssMb'] = timings.parse_peak_rss_mb
+    if result.get('cached'):
+        outcome = 'cached'
+    else:
+        outcome = 'success' if is_success(result) else 'failure'
+    record((urlparse(url).hostname or '').lower(), result.get('method') or method or '', outcome, timings)
+    return result
+
+
+def _conn():
+    store.ensure_schema('metrics', SCHEMA)
+    return store.connect()
+
+
+def record(host, method, outcome, timings):
+    """Fold one job's timings into the shared counters and histograms"""
+    if not ENABLED:
+        return
+    phases = dict(timings.phases)
+    if timings.total is not None:
+        phases['total'] = timings.total
+    try:
+        conn = _conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT INTO metric_jobs (method, host, outcome, count) VALUES (?, ?, ?, 1) '
+                'ON CONFLICT(method, host, outcome) DO UPDATE SET count = count + 1',
+                (method, host, outcome),
+            )
+            if timings.peak_rss_mb is not None:
+                conn.execute(
+                    'INSERT INTO metric_memory (method, host, count, sum, max) VALUES (?, ?, 1, ?, ?) '
+                    'ON CONFLICT(method, host) DO UPDATE SET count = count + 1, sum = sum + excluded.sum, '
+                    'max = MAX(max, excluded.max)',
+                    (method, host, timings.peak_rss_mb, timings.peak_rss_mb),
+                )
+            for name, seconds in phases.items():
+                conn.execute(
+                    'INSERT INTO metric_phases (phase, method, host, count, sum) VALUES (?, ?, ?, 1, ?) '
+                    'ON CONFLICT(phase, method, host) DO UPDATE SET count = count + 1, sum = sum + excluded.sum',
+                    (name, method, host, seconds),
+                )
+                conn.execute(
+                    'INSERT INTO metric_phase_buckets (phase, method, host, bucket, count) VALUES (?, ?, ?, ?, 1) '
+                    'ON CONFLICT(phase, method, host, bucket) DO UPDATE SET count = count + 1',
+                    (name, method, host, bisect.bisect_left(BUCKETS, seconds)),
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    except Exception as e:
+        print(f"Metrics write failed: {e}", file=sys.stderr)
+
+
+def _bucket_label(index):
+    return '+Inf' if index >= len(BUCKETS) else repr(float(BUCKETS[index]))
+
+
+def snapshot():
+    """Every counter and histogram as plain data"""
+    conn = _conn()
+    jobs = [
+        {'method': method, 'host': host, 'outcome': outcome, 'count': count}
+        for method, host, outcome, count in conn.execute(
+            'SELECT method, host, outcome, count FROM metric_jobs ORDER BY method, host, outcome')
+    ]
+    buckets = {}
+    for name, method, host, bucket, count in conn.execute(
+            'SELECT phase, method, host, bucket, count FROM metric_phase_buckets'):
+        buckets.setdefault((name, method, host), {})[bucket] = count
+
+    phases = []
+    for name, method, host, count, total in conn.execute(
+            'SELECT phase, method, host, count, sum FROM metric_phases ORDER BY phase, method, host'):
+        counts = buckets.get((name, method, host), {})
+        cumulative = {}
+        running = 0
+        for index in range(len(BUCKETS) + 1):
+            running += counts.get(index, 0)
+            cumulative[_bucket_label(index)] = running
+        phases.append({'phase': name, 'method': method, 'host': host,
+                       'count': count, 'sum': total, 'buckets': cumulative})
+    memory = [
+        {'method': method, 'host': host, 'count': count, 'sum': total, 'max': peak}
+        for method, host, count, total, peak in conn.execute(
+            'SELECT method, host, count, sum, max FROM metric_memory ORDER BY method, host')
+    ]
+    return {'jobs': jobs, 'phases': phases, 'memory': memory}
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def prometheus(data=None):
+    """Render a snapshot in the Prometheus text exposition format"""
+    data = data or snapshot()
+    lines = [
+        '# HELP scraper_jobs_total Scrape jobs finished, by method, host and outcome',
+        '# TYPE scraper_jobs_total counter',
+    ]
+    for job in data['jobs']:
+        lines.append(f"scraper_jobs_total{_labels(method=job['method'], host=job['host'], outcome=job['outcome'])} "
+                     f"{job['count']}")
+    lines += [
+        '# HELP scraper_phase_seconds Time spent in each scrape phase',
+        '# TYPE scraper_phase_seconds histogram',
+    ]
+    for entry in data['phases']:
+        labels = {'phase': entry['phase'], 'method': entry['method'], 'host': entry['host']}
+        for le, count in entry['buckets'].items():
+            lines.append(f"scraper_phase_seconds_bucket{_labels(**labels, le=le)} {count}")
+        lines.append(f"scraper_phase_seconds_sum{_labels(**labels)} {entry['sum']}")
+        lines.append(f"scraper_phase_seconds_count{_labels(**labels)} {entry['count']}")
+    lines += [
+        '# HELP scraper_job_peak_rss_megabytes Process peak RSS while each job ran',
+        '# TYPE scraper_job_peak_rss_megabytes summary',
+    ]
+    for entry in data.get('memory', []):
+        labels = {'method': entry['method'], 'host': entry['host']}
+        lines.append(f"scraper_job_peak_rss_megabytes_sum{_labels(**labels)} {entry['sum']}")
+        lines.append(f"scraper_job_peak_rss_megabytes_count{_labels(**labels)} {entry['count']}")
+    lines += [
+        '# HELP scraper_job_peak_rss_megabytes_max Largest peak RSS seen for a job',
+        '# TYPE scraper_job_peak_rss_megabytes_max gauge',
+    ]
+    for entry in data.get('memory', []):
+        lines.append(f"scraper_job_peak_rss_megabytes_max{_labels(method=entry['method'], host=entry['host'])} "
+                     f"{entry['max']}")
+    return '\n'.join(lines) + '\n'
+
+
+def export(fmt='prometheus'):
+    """Worker op payload: {'format': 'prometheus', 'text'} or {'format': 'json', 'metrics'}"""
+    if fmt == 'json':
+        return {'format': 'json', 'metrics': snapshot()}
+    return {'format': 'prometheus', 'text': prometheus()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print the aggregated scraper timing metrics')
+    parser.add_argument('--json', action='store_true', help='print a JSON snapshot instead of Prometheus text')
+    args = parser.parse_args()
+    if args.json:
+        print(json.dumps(snapshot(), indent=2))
+    else:
+        sys.stdout.write(prometheus())
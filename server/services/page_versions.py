@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Last seen version of every monitored page
+Keeps each URL's HTTP validators (ETag, Last-Modified), a hash of its content
+and its last extraction, so a repeat scrape can revalidate with a conditional
+request, skip extraction when nothing changed, and report which fields did
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+import store
+
+ENABLED = os.environ.get('SCRAPER_CONDITIONAL_FETCH', '1') != '0'
+
+# Fields that differ on every run and say nothing about the page
+VOLATILE_FIELDS = {'extractedAt'}
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS page_versions (
+        url TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        content_hash TEXT NOT NULL,
+        size INTEGER,
+        extracted TEXT NOT NULL,
+        changed REAL NOT NULL,
+        checked REAL NOT NULL
+    )''',
+]
+
+
+def _conn():
+    store.ensure_schema('page_versions', SCHEMA)
+    return store.connect()
+
+
+def content_hash(html):
+    """sha256 of the page text, the same digest the blob store files it under"""
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def get(url):
+    """Previous version of url as a dict, or None"""
+    if not ENABLED:
+        return None
+    try:
+        row = _conn().execute(
+            'SELECT etag, last_modified, content_hash, size, extracted, changed, checked '
+            'FROM page_versions WHERE url = ?', (url,),
+        ).fetchone()
+    except Exception as e:
+        print(f"Page version store unavailable: {e}", file=sys.stderr)
+        return None
+    if row is None:
+        return None
+    return {
+        'etag': row[0],
+        'lastModified': row[1],
+        'contentHash': row[2],
+        'size': row[3],
+        'extracted': json.loads(row[4]),
+        'changed': row[5],
+        'checked': row[6],
+    }
+
+
+def conditional_headers(previous):
+    """If-None-Match / If-Modified-Since for revalidating a previous version"""
+    headers = {}
+    if previous:
+        if previous['etag']:
+            headers['If-None-Match'] = previous['etag']
+        if previous['lastModified']:
+            headers['If-Modified-Since'] = previous['lastModified']
+    return headers
+
+
+def save(url, headers, digest, size, extracted):
+    """Record a newly extracted version of url, with its response headers' validators"""
+    if not ENABLED:
+        return
+    now = time.time()
+    try:
+        _conn().execute(
+            'INSERT OR REPLACE INTO page_versions '
+            '(url, etag, last_modified, content_hash, size, extracted, changed, checked) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (url, headers.get('ETag'), headers.get('Last-Modified'),
+             digest, size, json.dumps(extracted), now, now),
+        )
+    except Exception as e:
+        print(f"Page version write failed: {e}", file=sys.stderr)
+
+
+def touch(url, response=None):
+    """Mark url as checked and unchanged, picking up any new validators"""
+    if not ENABLED:
+        return
+    try:
+        if response is not None and response.status_code != 304:
+            _conn().execute(
+                'UPDATE page_versions SET etag = ?, last_modified = ?, checked = ? WHERE url = ?',
+                (response.headers.get('ETag'), response.headers.get('Last-Modified'), time.time(), url),
+            )
+        else:
+            _conn().execute('UPDATE page_versions SET checked = ? WHERE url = ?', (time.time(), url))
+    except Exception as e:
+        print(f"Page version write failed: {e}", file=sys.stderr)
+
+
+def _flatten(value, prefix, out):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key not in VOLATILE_FIELDS:
+                _flatten(item, f'{prefix}.{key}' if prefix else key, out)
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            _flatten(item, f'{prefix}[{index}]', out)
+    else:
+        out[prefix] = value
+    return out
+
+
+def changed_fields(previous, current):
+    """{path: {'old', 'new'}} for every leaf that differs, e.g. 'transactions[0].price'"""
+    before = _flatten(previous or {}, '', {})
+    after = _flatten(current or {}, '', {})
+    return {
+        path: {'old': before.get(path), 'new': after.get(path)}
+        for path in sorted(before.keys() | after.keys())
+        if before.get(path) != after.get(path)
+    }
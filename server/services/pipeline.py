@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Staged scrape pipeline: network fetch and CPU-bound extraction on separate workers
+Fetch threads download or render pages and hand them over a bounded queue to
+a process pool that parses and extracts on every core, so parsing never holds
+the GIL the fetchers need. A full queue blocks the fetchers (backpressure),
+and results can be written in input order.
+"""
+
+import importlib
+import os
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import metrics
+
+DEFAULT_FETCH_WORKERS = int(os.environ.get('SCRAPER_PIPELINE_FETCH_WORKERS', 16))
+DEFAULT_PARSE_WORKERS = int(os.environ.get('SCRAPER_PIPELINE_PARSE_WORKERS', os.cpu_count() or 2))
+
+# Extraction functions the parse stage may run, by name: (module, function)
+EXTRACTORS = {
+    'product': ('scraper', 'extract_product_data'),
+    'rendered_product': ('scraper', 'extract_real_product_data'),
+}
+
+
+class PendingExtraction:
+    """A fetched page still waiting for its CPU-bound extraction
+
+    `finish(extracted)` runs back in the fetching process and turns the
+    extractor's output into the job's result.
+    """
+
+    __slots__ = ('extractor', 'html', 'args', 'method', 'finish')
+
+    def __init__(self, extractor, html, args, method, finish):
+        self.extractor = extractor
+        self.html = html
+        self.args = args
+        self.method = method
+        self.finish = finish
+
+
+def host_of(job):
+    return urlparse(job.get('url', '')).hostname or ''
+
+
+def run_extractor(name, html, *args):
+    module, function = EXTRACTORS[name]
+    return getattr(importlib.import_module(module), function)(html, *args)
+
+
+def complete(stage):
+    """Finish a fetch stage inline: run its pending extraction, if any, in this process"""
+    if not isinstance(stage, PendingExtraction):
+        return stage
+    try:
+        return stage.finish(run_extractor(stage.extractor, stage.html, *stage.args))
+    except Exception as e:
+        return {'success': False, 'method': stage.method, 'error': str(e)}
+
+
+def extract_in_worker(name, html, args):
+    """Parse-stage entry point, run in a pool process: (extracted, phase timings, peak RSS in MB)"""
+    with metrics.job_scope() as timings:
+        extracted = run_extractor(name, html, *args)
+        # File the page in the blob store while it is here, so the parent only has to hash it
+        import blob_store
+        if not blob_store.INLINE_HTML and html:
+            blob_store.put(html)
+    return extracted, dict(timings.phases), timings.peak_rss_mb
+
+
+class Pipeline:
+    """fetch threads -> bounded queue -> extraction processes -> writer
+
+    `fetch(job)` returns (result or PendingExtraction, timings or None);
+    `done(job, result, timings)` post-processes each finished result before
+    it is written (caching, blob storage, metrics). With `per_host`, at most
+    that many fetches run against one host; the rest wait without a thread.
+    """
+
+    def __init__(self, fetch, done, writer, fetch_workers=DEFAULT_FETCH_WORKERS,
+                 parse_workers=DEFAULT_PARSE_WORKERS, queue_size=None, ordered=False, per_host=None):
+        # Only batch runs build a pipeline; single jobs import this module just for complete()
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self.fetch = fetch
+        self.done = done
+        self.writer = writer
+        self.ordered = ordered
+        self.fetch_workers = max(1, fetch_workers)
+        self.parse_workers = max(1, parse_workers)
+        self.per_host = max(1, per_host) if per_host else None
+        self.active = defaultdict(int)
+        # Jobs parked behind a busy host, with their sequence numbers; they hold no intake slot
+        self.waiting = {}
+        self.parked = 0
+        self.backlog = self.fetch_workers * 8
+        self.fetchers = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix='pipeline-fetch')
+        # spawn, not fork: the parent has browser and pool threads that must not be forked mid-flight
+        self.parsers = ProcessPoolExecutor(max_workers=self.parse_workers,
+                                           mp_context=multiprocessing.get_context('spawn'))
+        # Extracted pages are finished (caching, blob storage, metrics) off the pool's callback thread
+        self.finishers = ThreadPoolExecutor(max_workers=2, thread_name_prefix='pipeline-finish')
+        self.pages = queue.Queue(maxsize=queue_size or self.parse_workers * 2)
+        # Jobs read but not yet fetched; bounds how far ahead of the fetchers the input is read
+        self.intake = threading.BoundedSemaphore(self.fetch_workers * 2)
+        # Pages handed to the process pool but not yet extracted
+        self.parsing = threading.BoundedSemaphore(self.parse_workers * 2)
+        self.lock = threading.Condition()
+        # In ordered mode, how many results may wait behind a slow earlier job
+        self.window = self.fetch_workers * 4 + self.pages.maxsize + self.parse_workers * 2
+        self.outstanding = 0
+        self.next_seq = 0
+        self.next_to_write = 0
+        self.held = {}
+        self.dispatcher = threading.Thread(target=self._dispatch, name='pipeline-dispatch', daemon=True)
+        self.dispatcher.start()
+
+    def submit(self, job):
+        """Queue a job, blocking while the fetch stage is saturated"""
+        with self.lock:
+            while ((self.ordered and self.next_seq - self.next_to_write >= self.window)
+                   or self.parked >= self.backlog):
+                self.lock.wait()
+            seq = self.next_seq
+            self.next_seq += 1
+            self.outstanding += 1
+            if self.per_host is not None:
+                host = host_of(job)
+                if self.active[host] >= self.per_host:
+                    self.waiting.setdefault(host, deque()).append((seq, job))
+                    self.parked += 1
+                    return
+                self.active[host] += 1
+        self.intake.acquire()
+        self.fetchers.submit(self._fetch, seq, job)
+
+    def join(self):
+        """Wait for every submitted job, then stop the stages"""
+        with self.lock:
+            while self.outstanding:
+                self.lock.wait()
+        self.pages.put(None)
+        self.dispatcher.join()
+        self.fetchers.shutdown()
+        self.parsers.shutdown()
+        self.finishers.shutdown()
+
+    def _fetch(self, seq, job):
+        started = time.perf_counter()
+        try:
+            stage, timings = self.fetch(job)
+        except Exception as e:
+            stage, timings = {'success': False, 'error': str(e)}, None
+        finally:
+            if self.per_host is None or not self._release_host(host_of(job)):
+                self.intake.release()
+        # Blocks while the parse stage is behind
+        self.pages.put((seq, job, stage, timings, started))
+
+    def _release_host(self, host):
+        """Hand a finished fetch's host slot, and its intake slot, to the next job parked behind it"""
+        with self.lock:
+            parked = self.waiting.get(host)
+            if not parked:
+                self.active[host] -= 1
+                if not self.active[host]:
+                    del self.active[host]
+                return False
+            seq, job = parked.popleft()
+            if not parked:
+                del self.waiting[host]
+            self.parked -= 1
+            self.lock.notify_all()
+        self.fetchers.submit(self._fetch, seq, job)
+        return True
+
+    def _dispatch(self):
+        while True:
+            item = self.pages.get()
+            if item is None:
+                return
+            seq, job, stage, timings, started = item
+            if not isinstance(stage, PendingExtraction):
+                self._finish(seq, job, stage, timings, started)
+                continue
+            self.parsing.acquire()
+            try:
+                future = self.parsers.submit(extract_in_worker, stage.extractor, stage.html, stage.args)
+            except Exception as e:
+                self.parsing.release()
+                self._finish(seq, job, {'success': False, 'method': stage.method, 'error': str(e)}, timings, started)
+                continue
+            future.add_done_callback(lambda future, item=item: self._parsed(future, item))
+
+    def _parsed(self, future, item):
+        self.parsing.release()
+        self.finishers.submit(self._extracted, future, *item)
+
+    def _extracted(self, future, seq, job, stage, timings, started):
+        try:
+            extracted, phases, peak_rss_mb = future.result()
+            if timings is not None:
+                for name, seconds in phases.items():
+                    timings.add(name, seconds)
+                timings.parse_peak_rss_mb = peak_rss_mb
+            result = stage.finish(extracted)
+        except Exception as e:
+            result = {'success': False, 'method': stage.method, 'error': str(e)}
+        self._finish(seq, job, result, timings, started)
+
+    def _finish(self, seq, job, result, timings, started):
+        try:
+            if timings is not None:
+                timings.total = time.perf_counter() - started
+            message = {'index': job.get('index'), 'url': job.get('url'),
+                       'result': self.done(job, result, timings)}
+        except Exception as e:
+            message = {'index': job.get('index'), 'url': job.get('url'), 'error': str(e)}
+
+        with self.lock:
+            if not self.ordered:
+                self.writer.write(message)
+            else:
+                self.held[seq] = message
+                while self.next_to_write in self.held:
+                    self.writer.write(self.held.pop(self.next_to_write))
+                    self.next_to_write += 1
+            self.outstanding -= 1
+            self.lock.notify_all()
+
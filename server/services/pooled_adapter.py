@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+requests/urllib3 plumbing behind http_pool's shared session
+Host-sized connection pools that count hits and misses and time connection
+setup. Kept apart from http_pool so `requests` and `urllib3` are only
+imported when the first HTTP request is made, not on every cold start.
+"""
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.poolmanager import PoolManager
+
+import http_pool
+import metrics
+
+
+class _CountingPoolMixin:
+    """Count each checkout as a hit (reused connection) or a miss (new connection)"""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        # A reused connection already has a socket; a fresh one does not
+        http_pool.count(self.host, 'hits' if getattr(conn, 'sock', None) is not None else 'misses')
+        http_pool.watch(conn)
+        return conn
+
+
+class _TimedConnectMixin:
+    """Record TCP (and TLS) setup as the job's 'connect' phase"""
+
+    def connect(self):
+        with metrics.phase('connect'):
+            super().connect()
+
+
+class TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class HostSizedPoolManager(PoolManager):
+    """PoolManager that sizes each host's pool from http_pool.HOST_POOL_SIZES"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        if request_context is None:
+            request_context = self.connection_pool_kw.copy()
+        request_context['maxsize'] = http_pool.HOST_POOL_SIZES.get(
+            host, request_context.get('maxsize', http_pool.DEFAULT_POOL_SIZE))
+        return super()._new_pool(scheme, host, port, request_context=request_context)
+
+
+class PooledAdapter(HTTPAdapter):
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+        self.poolmanager = HostSizedPoolManager(num_pools=connections, maxsize=maxsize,
+                                                block=block, **pool_kwargs)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Readiness conditions for headless renders
+A rendered page is taken as soon as it is ready, not when a fixed time
+budget runs out: when a site-specific selector or text pattern shows up,
+when the network and DOM have both gone quiet, or when the DOM has stayed
+unchanged long enough despite background traffic. The budget is only the
+upper bound.
+"""
+
+import json
+import os
+import sys
+import time
+
+import hedge
+
+ENABLED = os.environ.get('SCRAPER_READINESS', '1') != '0'
+# How long the DOM must go without mutations to count as stable
+STABLE_MS = int(os.environ.get('SCRAPER_READY_STABLE_MS', 500))
+# How long no new resource may finish loading to count as network idle
+IDLE_MS = int(os.environ.get('SCRAPER_READY_IDLE_MS', 500))
+POLL_MS = 100
+# Pages that keep polling in the background never go network idle; a DOM this still is done anyway
+SETTLED_MS = STABLE_MS * 4
+
+# Host substring -> what a finished page shows. Selectors need non-empty text;
+# text patterns are JavaScript regexes matched case-insensitively against the page text.
+READY_RULES = {
+    'amazon.': {'selectors': ['#productTitle', '#corePrice_feature_div .a-offscreen', '.a-price .a-offscreen']},
+    'ebay.': {'selectors': ['.x-item-title__mainTitle', '.x-price-primary']},
+    'bankofabyssinia.com': {'text': [r'ETB\s+[\d,]+', r'Amount[:\s]+[\d,]+']},
+    'cbe.com.et': {'text': [r'ETB\s+[\d,]+', r'Amount[:\s]+[\d,]+']},
+}
+
+# Extra rules as JSON, e.g. {"shop.example.com": {"selectors": [".price"]}}
+if os.environ.get('SCRAPER_READY_RULES'):
+    READY_RULES.update(json.loads(os.environ['SCRAPER_READY_RULES']))
+
+# Installed before any page script runs: remembers when the DOM last changed
+TRACKER_SCRIPT = '''(() => {
+  if (window.__scraperReadiness) return;
+  const state = window.__scraperReadiness = {mutated: performance.now(), resources: 0, loaded: performance.now()};
+  new MutationObserver(() => { state.mutated = performance.now(); })
+    .observe(document, {subtree: true, childList: true, characterData: true, attributes: true});
+})()'''
+
+PROBE_SCRIPT = '''([selectors, patterns]) => {
+  const state = window.__scraperReadiness;
+  const now = performance.now();
+  for (const selector of selectors) {
+    const element = document.querySelector(selector);
+    if (element && element.textContent.trim()) return {ready: 'selector'};
+  }
+  if (patterns.length && document.body) {
+    const text = document.body.textContent;
+    if (patterns.some(pattern => new RegExp(pattern, 'i').test(text))) return {ready: 'text'};
+  }
+  if (!state) return {ready: null, complete: false};
+  const resources = performance.getEntriesByType('resource').length;
+  if (resources !== state.resources) { state.resources = resources; state.loaded = now; }
+  return {ready: null, complete: document.readyState === 'complete',
+          domQuiet: now - state.mutated, networkQuiet: now - state.loaded};
+}'''
+
+
+def rules_for(url):
+    """(selectors, text patterns) that mark url's page as ready"""
+    selectors, patterns = [], []
+    for site, rules in READY_RULES.items():
+        if site in url:
+            selectors += rules.get('selectors', [])
+            patterns += rules.get('text', [])
+    return selectors, patterns
+
+
+def check(status):
+    """Readiness reason for one probe result, or None while the page is still settling"""
+    if status.get('ready'):
+        return status['ready']
+    if not status.get('complete'):
+        return None
+    if status['domQuiet'] >= STABLE_MS and status['networkQuiet'] >= IDLE_MS:
+        return 'network_idle'
+    if status['domQuiet'] >= SETTLED_MS:
+        return 'dom_stable'
+    return None
+
+
+def prepare(context):
+    """Install the DOM tracker on a playwright context before its first page loads"""
+    context.add_init_script(TRACKER_SCRIPT)
+
+
+def wait_until_ready(page, url, budget_ms):
+    """Wait until a playwright page is ready or budget_ms has passed; return why it stopped"""
+    started = time.monotonic()
+    if not ENABLED:
+        try:
+            page.wait_for_load_state('networkidle', timeout=budget_ms)
+            return 'network_idle'
+        except Exception:
+            return 'budget'
+
+    rules = list(rules_for(url))
+    deadline = started + budget_ms / 1000
+    # Unless a signal turns up, the budget runs out and the caller takes the DOM as it is,
+    # like --virtual-time-budget does
+    reason = 'budget'
+    while time.monotonic() < deadline:
+        if hedge.cancelled():
+            # A hedged duplicate already answered; free the browser
+            reason = 'cancelled'
+            break
+        try:
+            found = check(page.evaluate(PROBE_SCRIPT, rules))
+        except Exception:
+            # Mid-navigation (a redirect or script reload); look again on the next poll
+            found = None
+        if found:
+            reason = found
+            break
+        page.wait_for_timeout(POLL_MS)
+    print(f"Render ready ({reason}) after {(time.monotonic() - started) * 1000:.0f}ms of {budget_ms}ms budget",
+          file=sys.stderr)
+    return reason
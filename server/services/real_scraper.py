@@ -4,13 +4,23 @@ Real scraper for Bank of Abyssinia transaction receipts
 Attempts multiple methods to extract actual transaction data
 """
 
-import requests
+import http_pool
+import browser_pool
+import inflight
+import result_cache
+import endpoint_health
+import hedge
+import metrics
+import resource_filter
+import contextvars
 import json
-import re
 import time
-import subprocess
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import parse_qs, urlparse
+from extractors import RECEIPT_FIELDS
+from document import as_document
 
 def extract_transaction_from_url(url):
     """Extract transaction ID from URL parameters"""
@@ -18,45 +28,139 @@ def extract_transaction_from_url(url):
     params = parse_qs(parsed.query)
     return params.get('trx', [None])[0]
 
-def try_api_endpoints(transaction_id):
-    """Try to find API endpoints that might serve transaction data"""
-    base_url = "https://cs.bankofabyssinia.com"
-    
-    possible_endpoints = [
-        f"/api/slip/{transaction_id}",
-        f"/api/transaction/{transaction_id}",
-        f"/api/receipt/{transaction_id}",
-        f"/slip/api/transaction/{transaction_id}",
-        f"/slip/data/{transaction_id}",
-        f"/data/{transaction_id}.json",
-    ]
-    
-    session = requests.Session()
-    session.headers.update({
+API_BASE_URL = "https://cs.bankofabyssinia.com"
+
+API_ENDPOINT_TEMPLATES = [
+    "/api/slip/{trx}",
+    "/api/transaction/{trx}",
+    "/api/receipt/{trx}",
+    "/slip/api/transaction/{trx}",
+    "/slip/data/{trx}",
+    "/data/{trx}.json",
+]
+
+# Shared by every probe so concurrent lookups don't each spin up threads
+_probe_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('SCRAPER_PROBE_THREADS', 16)),
+                                     thread_name_prefix='endpoint-probe')
+
+def probe_endpoint(template, transaction_id, headers):
+    """Fetch one candidate endpoint; return its transaction data or None"""
+    host = urlparse(API_BASE_URL).hostname
+    started = time.monotonic()
+    data = None
+    try:
+        response = http_pool.get(API_BASE_URL + template.format(trx=transaction_id), headers=headers, timeout=10,
+                                 cancel=hedge.current())
+        data = transaction_data_from(response, transaction_id)
+    except http_pool.RequestCancelled:
+        # Another attempt already answered; this one is neither healthy nor dead
+        return None
+    except:
+        data = None
+    endpoint_health.record(host, template, bool(data), time.monotonic() - started)
+    return data or None
+
+async def probe_endpoint_async(template, transaction_id, headers, fetcher):
+    """probe_endpoint on the async engine"""
+    import asyncio
+    host = urlparse(API_BASE_URL).hostname
+    started = time.monotonic()
+    data = None
+    try:
+        response = await fetcher.get(API_BASE_URL + template.format(trx=transaction_id), headers=headers, timeout=10)
+        data = transaction_data_from(response, transaction_id)
+    except asyncio.CancelledError:
+        # Another endpoint already answered; this one is neither healthy nor dead
+        raise
+    except Exception:
+        data = None
+    await asyncio.to_thread(endpoint_health.record, host, template, bool(data), time.monotonic() - started)
+    return data or None
+
+def transaction_data_from(response, transaction_id):
+    """Transaction data in an endpoint response, or None"""
+    if response.status_code != 200:
+        return None
+    try:
+        return response.json()
+    except:
+        # Check if response contains transaction data
+        if transaction_id in response.text:
+            return {"raw_response": response.text}
+    return None
+
+def api_headers(transaction_id):
+    return {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
         'Accept': 'application/json, text/plain, */*',
         'Accept-Language': 'en-US,en;q=0.9',
         'Referer': f'https://cs.bankofabyssinia.com/slip/?trx={transaction_id}',
-    })
-    
-    for endpoint in possible_endpoints:
-        try:
-            response = session.get(base_url + endpoint, timeout=10)
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    return data
-                except:
-                    # Check if response contains transaction data
-                    if transaction_id in response.text:
-                        return {"raw_response": response.text}
-        except:
-            continue
+    }
+
+def try_api_endpoints(transaction_id):
+    """Try to find API endpoints that might serve transaction data"""
+    headers = api_headers(transaction_id)
+    
+    # The endpoint that worked last time goes first, on its own
+    host = urlparse(API_BASE_URL).hostname
+    winner, candidates = endpoint_health.plan(host, API_ENDPOINT_TEMPLATES)
+    if winner:
+        # Hedged when the host is slow to answer (and hedging is on)
+        data = hedge.call(host, 'api', lambda: probe_endpoint(winner, transaction_id, headers))
+        if data:
+            return data
+    
+    # Probe the rest concurrently; the first valid answer wins
+    # Each probe runs in the job's context so its timings count towards this job
+    futures = [_probe_executor.submit(contextvars.copy_context().run, probe_endpoint, template, transaction_id, headers)
+               for template in candidates]
+    try:
+        for future in as_completed(futures):
+            data = future.result()
+            if data:
+                return data
+    finally:
+        for future in futures:
+            future.cancel()
+    
+    return None
+
+async def try_api_endpoints_async(transaction_id, fetcher):
+    """try_api_endpoints on the async engine; the losing probes are cancelled as soon as one answers"""
+    import asyncio
+    headers = api_headers(transaction_id)
+    
+    host = urlparse(API_BASE_URL).hostname
+    winner, candidates = await asyncio.to_thread(endpoint_health.plan, host, API_ENDPOINT_TEMPLATES)
+    if winner:
+        data = await hedge.call_async(host, 'api', lambda: probe_endpoint_async(winner, transaction_id, headers, fetcher))
+        if data:
+            return data
+    
+    tasks = [asyncio.create_task(probe_endpoint_async(template, transaction_id, headers, fetcher))
+             for template in candidates]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            data = await next_done
+            if data:
+                return data
+    finally:
+        for task in tasks:
+            task.cancel()
     
     return None
 
 def try_chromium_headless(url):
     """Try using chromium directly to render and extract content"""
+    # Returns as soon as the receipt is on the page; 10s is only the upper bound.
+    # Whatever goes wrong with the pooled render, a one-off chromium still gets a go
+    try:
+        return browser_pool.render(url, budget_ms=10000, timeout=30)
+    except browser_pool.PoolUnavailable as e:
+        print(f"Browser pool unavailable ({e}), launching chromium", file=sys.stderr)
+    except Exception as e:
+        print(f"Pooled render failed ({e}), launching chromium", file=sys.stderr)
+
     try:
         # Use chromium with minimal flags
         cmd = [
@@ -65,13 +169,15 @@ def try_chromium_headless(url):
             '--disable-gpu',
             '--no-sandbox',
             '--disable-dev-shm-usage',
+            *resource_filter.chromium_flags(),
             '--virtual-time-budget=10000',  # Wait 10 seconds for JS
             '--run-all-compositor-stages-before-draw',
             '--dump-dom',
             url
         ]
         
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+        with metrics.phase('render'):
+            result = hedge.run_process(cmd, timeout=30)
         
         if result.returncode == 0:
             return result.stdout
@@ -79,80 +185,92 @@ def try_chromium_headless(url):
             return None
             
     except Exception as e:
-        print(f"Chromium error: {e}")
+        print(f"Chromium error: {e}", file=sys.stderr)
         return None
 
-def extract_data_from_rendered_content(html_content, transaction_id):
-    """Extract transaction data from rendered HTML content"""
+def extract_data_from_rendered_content(page, transaction_id):
+    """Extract transaction data from rendered HTML content (a string or Document)"""
+    document = as_document(page)
+    html_content = document.source if document.source is not None else document.serialized
     if not html_content or len(html_content) < 1000:
         return None
     
     # Look for common patterns in transaction receipts
-    patterns = {
-        'amount': [
-            r'ETB\s+([\d,]+\.?\d*)',
-            r'Amount[:\s]+([\d,]+\.?\d*)',
-            r'Transferred\s+amount[:\s]+ETB\s+([\d,]+\.?\d*)',
-        ],
-        'account': [
-            r'Account[:\s]+(\d+\*+\d+)',
-            r'Receiver.*Account[:\s]+(\d+\*+\d+)',
-        ],
-        'name': [
-            r'Receiver.*Name[:\s]+([A-Z\s]+)',
-            r'Name[:\s]+([A-Z\s]+)',
-        ],
-        'date': [
-            r'(\d{2}/\d{2}/\d{2,4}\s+\d{2}:\d{2})',
-            r'Date[:\s]+(\d{2}/\d{2}/\d{2,4}\s+\d{2}:\d{2})',
-        ]
-    }
-    
     extracted = {'transactionId': transaction_id}
-    
-    for field, field_patterns in patterns.items():
-        for pattern in field_patterns:
-            match = re.search(pattern, html_content, re.IGNORECASE)
-            if match:
-                extracted[field] = match.group(1).strip()
-                break
+    extracted.update(document.scanner('source').extract(RECEIPT_FIELDS))
+    if document is not page:
+        document.release()
     
     return extracted if len(extracted) > 1 else None
 
+def is_success(result):
+    return bool(result.get('success'))
+
 def scrape_real_transaction_data(url):
-    """Main function to attempt real data extraction"""
+    """Main function to attempt real data extraction, served from the result cache when possible"""
+    return metrics.observe_job(
+        url, 'real',
+        lambda: result_cache.cached_call(url, None, lambda: fetch_real_transaction_data(url), is_success,
+                                        source='real'),
+        is_success,
+    )
+
+def fetch_real_transaction_data(url):
+    """Probe the API endpoints, then fall back to rendering the receipt"""
     transaction_id = extract_transaction_from_url(url)
     if not transaction_id:
         return {"error": "Could not extract transaction ID from URL"}
     
-    print(f"Attempting to scrape transaction: {transaction_id}")
+    print(f"Attempting to scrape transaction: {transaction_id}", file=sys.stderr)
     
     # Method 1: Try to find API endpoints
-    print("Trying API endpoints...")
+    print("Trying API endpoints...", file=sys.stderr)
     api_data = try_api_endpoints(transaction_id)
     if api_data:
-        print("Found data via API!")
+        print("Found data via API!", file=sys.stderr)
         return {"success": True, "method": "api", "data": api_data}
     
+    return render_transaction_data(url, transaction_id)
+
+async def fetch_real_transaction_data_async(url, fetcher):
+    """fetch_real_transaction_data with the API probes on the async engine"""
+    import asyncio
+    transaction_id = extract_transaction_from_url(url)
+    if not transaction_id:
+        return {"error": "Could not extract transaction ID from URL"}
+    
+    print(f"Attempting to scrape transaction: {transaction_id}", file=sys.stderr)
+    api_data = await try_api_endpoints_async(transaction_id, fetcher)
+    if api_data:
+        return {"success": True, "method": "api", "data": api_data}
+    
+    # Rendering needs a browser thread
+    return await asyncio.to_thread(render_transaction_data, url, transaction_id)
+
+def render_transaction_data(url, transaction_id):
+    """Render the receipt page and extract from it; the fallback when no API endpoint answers"""
     # Method 2: Try chromium headless
-    print("Trying chromium headless...")
-    html_content = try_chromium_headless(url)
+    print("Trying chromium headless...", file=sys.stderr)
+    with resource_filter.collect() as blocked:
+        # A slow render gets a duplicate (when hedging is on); the first full receipt page wins
+        html_content = hedge.call(urlparse(url).hostname, 'render', lambda: try_chromium_headless(url),
+                                  is_good=lambda html: bool(html) and len(html) >= 1000)
     if html_content:
-        print(f"Got rendered HTML ({len(html_content)} chars)")
+        print(f"Got rendered HTML ({len(html_content)} chars)", file=sys.stderr)
         
         # Extract data from rendered content
         extracted_data = extract_data_from_rendered_content(html_content, transaction_id)
         if extracted_data:
-            print("Successfully extracted transaction data!")
-            return {
+            print("Successfully extracted transaction data!", file=sys.stderr)
+            return resource_filter.report({
                 "success": True, 
                 "method": "chromium_headless",
                 "data": extracted_data,
                 "raw_html_preview": html_content[:1000]
-            }
+            }, blocked)
     
     # Method 3: Network analysis (check for XHR requests)
-    print("Checking for XHR patterns...")
+    print("Checking for XHR patterns...", file=sys.stderr)
     # This would require more sophisticated network monitoring
     
     return {
@@ -162,10 +280,45 @@ def scrape_real_transaction_data(url):
         "note": "The Bank of Abyssinia receipt system likely requires authentication or has anti-bot protection"
     }
 
+async def scrape_real_transaction_data_async(url, fetcher):
+    """scrape_real_transaction_data on the async engine (an async_fetch.AsyncFetcher)"""
+    return await metrics.observe_job_async(
+        url, 'real',
+        lambda: result_cache.cached_call_async(url, None, lambda: fetch_real_transaction_data_async(url, fetcher),
+                                               is_success, source='real'),
+        is_success,
+    )
+
+def handle_worker_job(job):
+    """Worker handler: a job is {"id", "url"} or {"id", "op": "stats" | "metrics"}"""
+    if job.get('op') == 'stats':
+        return {'pool': http_pool.pool_stats(), 'cache': result_cache.stats(), 'inflight': inflight.stats(),
+                'hedge': hedge.stats()}
+    if job.get('op') == 'metrics':
+        return metrics.export(job.get('format', 'prometheus'))
+    return scrape_real_transaction_data(job['url'])
+
+async def handle_bulk_job_async(job, fetcher):
+    """Bulk handler for the async engine"""
+    return await scrape_real_transaction_data_async(job['url'], fetcher)
+
 if __name__ == "__main__":
-    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        from worker import worker_main
+        browser_pool.enable()
+        worker_main(handle_worker_job, sys.argv[2:],
+                    job_key=lambda job: result_cache.cache_key(job['url'], source='real'))
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--bulk':
+        from receipts_bulk import bulk_main
+        browser_pool.enable()
+        bulk_main(handle_worker_job, handle_bulk_job_async, sys.argv[2:])
+        sys.exit(0)
+    
     if len(sys.argv) != 2:
-        print("Usage: python real_scraper.py <url>")
+        print("Usage: python real_scraper.py <url> | python real_scraper.py --worker [--concurrency N] [--socket PATH]"
+              " | python real_scraper.py --bulk [FILE] --output OUT [--resume]")
         sys.exit(1)
     
     url = sys.argv[1]
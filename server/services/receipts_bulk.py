@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Bulk receipt verification for real_scraper
+Reads receipt URLs or bare transaction IDs, drops duplicates, verifies them
+concurrently over the shared HTTP session and browser pool, and appends one
+NDJSON line per receipt to the output file. The output doubles as the
+checkpoint: rerunning with --resume skips every receipt already verified
+and tries the failed ones again.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import result_cache
+from batch import BatchRunner
+from worker import LineWriter
+
+RECEIPT_URL = 'https://cs.bankofabyssinia.com/slip/?trx={trx}'
+DEFAULT_CONCURRENCY = 32
+PROGRESS_EVERY = 10  # seconds between progress lines
+
+
+def receipt_url(line):
+    """URL for an input line holding a receipt URL or a bare transaction ID"""
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if '://' in line:
+        return line
+    return RECEIPT_URL.format(trx=line)
+
+
+def read_receipts(infile):
+    """[(key, url)] in input order with duplicate receipts removed, and the duplicate count"""
+    seen = set()
+    receipts = []
+    duplicates = 0
+    for line in infile:
+        url = receipt_url(line)
+        if url is None:
+            continue
+        key = result_cache.cache_key(url, source='real')
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        receipts.append((key, url))
+    return receipts, duplicates
+
+
+def completed_keys(path):
+    """Keys of the receipts verified in an output file, which is rewritten to hold only those
+
+    Failed receipts (and a torn last line from a run that died mid-write) are
+    dropped so a resumed run verifies them again and the file keeps exactly
+    one line per receipt.
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb') as f:
+        data = f.read()
+    kept = []
+    for line in data.splitlines(keepends=True):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not line.endswith(b'\n') or not record.get('url') or not (record.get('result') or {}).get('success'):
+            continue
+        key = result_cache.cache_key(record['url'], source='real')
+        if key not in done:
+            done.add(key)
+            kept.append(line)
+    if len(kept) < len(data.splitlines()):
+        # Write then rename, so a crash here leaves the old checkpoint intact
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.writelines(kept)
+        os.replace(tmp_path, path)
+    return done
+
+
+class ProgressWriter:
+    """LineWriter that also counts outcomes and reports progress on stderr"""
+
+    def __init__(self, stream, total):
+        self.lines = LineWriter(stream)
+        self.total = total
+        self.done = 0
+        self.verified = 0
+        self.started = time.monotonic()
+        self.reported = self.started
+        self.lock = threading.Lock()
+
+    def write(self, message):
+        self.lines.write(message)
+        with self.lock:
+            self.done += 1
+            if (message.get('result') or {}).get('success'):
+                self.verified += 1
+            now = time.monotonic()
+            if now - self.reported >= PROGRESS_EVERY or self.done == self.total:
+                self.reported = now
+                self.report(now)
+
+    def report(self, now):
+        rate = self.done / max(now - self.started, 1e-9)
+        print(f"{self.done}/{self.total} receipts, {self.verified} verified, {rate:.1f}/s", file=sys.stderr)
+
+
+def bulk_main(handler, async_handler, argv):
+    """Parse bulk flags and verify every receipt in the input"""
+    parser = argparse.ArgumentParser(description='Verify many receipts concurrently, writing NDJSON results')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='file of receipt URLs or transaction IDs, one per line (default: stdin)')
+    parser.add_argument('--output', '-o', help='NDJSON results file, also used as the checkpoint (default: stdout)')
+    parser.add_argument('--resume', action='store_true', help='skip receipts already verified in --output and retry the rest')
+    parser.add_argument('--concurrency', type=int,
+                        default=int(os.environ.get('SCRAPER_BULK_CONCURRENCY', DEFAULT_CONCURRENCY)),
+                        help='receipts verified at once')
+    parser.add_argument('--engine', choices=['threads', 'async'],
+                        default=os.environ.get('SCRAPER_BATCH_ENGINE', 'threads'),
+                        help='async probes the receipt API on one event loop (needs aiohttp)')
+    args = parser.parse_args(argv)
+
+    if args.resume and not args.output:
+        parser.error('--resume needs --output')
+    if args.output and os.path.exists(args.output) and not args.resume:
+        parser.error(f'{args.output} exists; pass --resume to continue it, or remove it')
+
+    infile = sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')
+    try:
+        receipts, duplicates = read_receipts(infile)
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+
+    done = completed_keys(args.output) if args.resume else set()
+    # Indexes count over the deduplicated input, so they stay the same across resumed runs
+    pending = [(index, url) for index, (key, url) in enumerate(receipts) if key not in done]
+    print(f"{len(receipts)} receipts ({duplicates} duplicates dropped), "
+          f"{len(receipts) - len(pending)} already done, {len(pending)} to verify", file=sys.stderr)
+
+    out = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    writer = ProgressWriter(out, len(pending))
+    jobs = ({'index': index, 'url': url} for index, url in pending)
+    try:
+        if args.engine == 'async':
+            import asyncio
+            import async_fetch
+            async_fetch.check_available()
+            # Every receipt lives on the same bank host, so only the overall limit applies
+            asyncio.run(async_fetch.run_batch(async_handler, jobs, writer, args.concurrency, args.concurrency))
+        else:
+            runner = BatchRunner(handler, writer, args.concurrency, per_host=args.concurrency)
+            try:
+                for job in jobs:
+                    runner.submit(job)
+            finally:
+                runner.join()
+    finally:
+        if out is not sys.stdout:
+            out.close()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Resource blocking for browser scrapes
+The extractors only read text and the DOM, so browser renders skip images,
+media, fonts and known tracker domains. Rules can be tuned per host,
+including allow-lists for resources a page needs to render its data. Each
+job counts what it blocked and estimates the bytes that saved.
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import sys
+import threading
+from urllib.parse import urlparse
+
+ENABLED = os.environ.get('SCRAPER_BLOCK_RESOURCES', '1') != '0'
+BLOCK_TYPES = frozenset(filter(None, os.environ.get('SCRAPER_BLOCK_TYPES', 'image,media,font').split(',')))
+
+TRACKER_DOMAINS = (
+    'google-analytics.com', 'googletagmanager.com', 'googleadservices.com', 'googlesyndication.com',
+    'doubleclick.net', 'facebook.net', 'connect.facebook.com', 'hotjar.com', 'clarity.ms',
+    'scorecardresearch.com', 'amazon-adsystem.com', 'adnxs.com', 'criteo.com', 'criteo.net',
+    'taboola.com', 'outbrain.com', 'bat.bing.com', 'quantserve.com', 'newrelic.com', 'nr-data.net',
+)
+
+# Host substring -> rule overrides:
+#   'types': resource types to block instead of BLOCK_TYPES
+#   'block': extra URL substrings to block
+#   'allow': URL substrings that are never blocked (wins over everything else)
+HOST_RULES = {}
+
+# Extra rules as JSON, e.g. {"shop.example.com": {"allow": ["cdn.shop.example.com/app.js"]}}
+if os.environ.get('SCRAPER_BLOCK_RULES'):
+    HOST_RULES.update(json.loads(os.environ['SCRAPER_BLOCK_RULES']))
+
+# Typical transfer size of one response of each kind, for the bytes-saved estimate
+# (blocked requests are never made, so their real size is unknown)
+TYPICAL_BYTES = {
+    'image': 40_000,
+    'media': 500_000,
+    'font': 35_000,
+    'tracker': 30_000,
+    'stylesheet': 15_000,
+    'script': 25_000,
+}
+DEFAULT_TYPICAL_BYTES = 10_000
+
+# URL patterns standing in for resource types where only URLs can be matched (CDP setBlockedURLs)
+TYPE_EXTENSIONS = {
+    'image': ('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp'),
+    'media': ('mp4', 'webm', 'ogg', 'mp3', 'm4a', 'wav', 'mov', 'm3u8'),
+    'font': ('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    'stylesheet': ('css',),
+}
+
+
+class Policy:
+    """What to block while rendering one page"""
+
+    def __init__(self, types, block, allow):
+        self.types = frozenset(types)
+        self.block = tuple(block)
+        self.allow = tuple(allow)
+
+    def blocks(self, url, resource_type):
+        """'tracker', the blocked resource type, or None to let the request through"""
+        if any(pattern in url for pattern in self.allow):
+            return None
+        host = (urlparse(url).hostname or '').lower()
+        if any(host == domain or host.endswith('.' + domain) for domain in TRACKER_DOMAINS):
+            return 'tracker'
+        if any(pattern in url for pattern in self.block):
+            return resource_type or 'other'
+        if resource_type in self.types:
+            return resource_type
+        return None
+
+    def url_patterns(self):
+        """Wildcard URL patterns approximating this policy, for Network.setBlockedURLs"""
+        patterns = []
+        for resource_type in sorted(self.types):
+            for extension in TYPE_EXTENSIONS.get(resource_type, ()):
+                patterns += [f'*.{extension}', f'*.{extension}?*']
+        for domain in TRACKER_DOMAINS:
+            # setBlockedURLs has no exceptions, so an allowed tracker is left out entirely
+            if not any(domain in pattern for pattern in self.allow):
+                patterns.append(f'*://*{domain}/*')
+        patterns += [f'*{pattern}*' for pattern in self.block]
+        return patterns
+
+
+def policy_for(url):
+    """Blocking policy for a page, or None when blocking is off"""
+    if not ENABLED:
+        return None
+    types, block, allow = set(BLOCK_TYPES), [], []
+    for site, rules in HOST_RULES.items():
+        if site in url:
+            if 'types' in rules:
+                types = set(rules['types'])
+            block += rules.get('block', [])
+            allow += rules.get('allow', [])
+    return Policy(types, block, allow)
+
+
+class BlockStats:
+    """Requests blocked during one job, by kind"""
+
+    def __init__(self):
+        self.by_kind = {}
+        self.lock = threading.Lock()
+
+    def record(self, kind):
+        with self.lock:
+            self.by_kind[kind] = self.by_kind.get(kind, 0) + 1
+
+    @property
+    def requests(self):
+        return sum(self.by_kind.values())
+
+    def as_dict(self):
+        with self.lock:
+            by_kind = dict(self.by_kind)
+        return {
+            'requests': sum(by_kind.values()),
+            'byType': by_kind,
+            'estimatedBytesSaved': sum(count * TYPICAL_BYTES.get(kind, DEFAULT_TYPICAL_BYTES)
+                                       for kind, count in by_kind.items()),
+        }
+
+
+_current = contextvars.ContextVar('scraper_blocked', default=None)
+
+
+@contextlib.contextmanager
+def collect():
+    """Count the requests blocked by the browser renders in this block into a BlockStats"""
+    stats = BlockStats()
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+def merge(stats):
+    """Add the requests counted by an inner collect() block to the enclosing one"""
+    current = _current.get()
+    if current is None:
+        return
+    with stats.lock:
+        by_kind = dict(stats.by_kind)
+    with current.lock:
+        for kind, count in by_kind.items():
+            current.by_kind[kind] = current.by_kind.get(kind, 0) + count
+
+
+def report(result, stats):
+    """Attach a job's blocking summary to its result"""
+    if stats.requests:
+        result['blockedResources'] = stats.as_dict()
+    return result
+
+
+def install_route(context, url):
+    """Abort blocked requests on a playwright context rendering url"""
+    policy = policy_for(url)
+    if policy is None:
+        return
+    stats = _current.get()
+
+    def handle(route):
+        request = route.request
+        kind = policy.blocks(request.url, request.resource_type)
+        if kind and request.resource_type != 'document':
+            if stats is not None:
+                stats.record(kind)
+            route.abort('blockedbyclient')
+        else:
+            route.continue_()
+
+    context.route('**/*', handle)
+
+
+def selenium_options(options):
+    """Enable the performance log the blocked-request counts are read from"""
+    if ENABLED:
+        options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    return options
+
+
+def block_in_selenium(driver, url):
+    """Block this page's unwanted requests in a selenium tab over CDP"""
+    policy = policy_for(url)
+    if policy is None:
+        return None
+    try:
+        # Drop log entries left over from the tab's previous page
+        driver.get_log('performance')
+    except Exception:
+        pass
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': policy.url_patterns()})
+    return policy
+
+
+def count_selenium_blocked(driver, policy):
+    """Count the requests CDP blocked on the page just loaded"""
+    stats = _current.get()
+    if policy is None or stats is None:
+        return
+    try:
+        entries = driver.get_log('performance')
+    except Exception as e:
+        print(f"Blocked request counts unavailable: {e}", file=sys.stderr)
+        return
+    requests = {}
+    for entry in entries:
+        message = json.loads(entry['message'])['message']
+        params = message.get('params', {})
+        if message.get('method') == 'Network.requestWillBeSent':
+            requests[params.get('requestId')] = (params.get('request', {}).get('url', ''),
+                                                 params.get('type', 'Other').lower())
+        elif message.get('method') == 'Network.loadingFailed' and params.get('blockedReason'):
+            url, resource_type = requests.get(params.get('requestId'), ('', 'other'))
+            stats.record(policy.blocks(url, resource_type) or resource_type)
+
+
+def chromium_flags():
+    """Flags that approximate the default policy for a one-off chromium --dump-dom run"""
+    if ENABLED and 'image' in BLOCK_TYPES:
+        return ['--blink-settings=imagesEnabled=false']
+    return []
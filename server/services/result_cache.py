@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Persistent result cache shared by all scraper processes
+Receipts are keyed by their transaction ID, everything else by URL and method;
+entries expire by per-host TTL and the table is trimmed least-recently-used first.
+A miss for a key that is already being scraped waits for that scrape (inflight).
+"""
+
+import json
+import os
+import sys
+import time
+from urllib.parse import urlparse, parse_qs
+
+import inflight
+import metrics
+import store
+
+ENABLED = os.environ.get('SCRAPER_CACHE', '1') != '0'
+MAX_ENTRIES = int(os.environ.get('SCRAPER_CACHE_MAX_ENTRIES', 50000))
+# Hosts without a policy are not cached unless SCRAPER_CACHE_TTL says otherwise
+DEFAULT_TTL = float(os.environ.get('SCRAPER_CACHE_TTL', 0))
+NEGATIVE_TTL = float(os.environ.get('SCRAPER_CACHE_NEGATIVE_TTL', 60))
+
+# Issued receipts never change, so keep them for a long time
+HOST_TTLS = {
+    'cs.bankofabyssinia.com': 30 * 24 * 3600,
+    'apps.bankofabyssinia.com': 30 * 24 * 3600,
+    'apps.cbe.com.et': 30 * 24 * 3600,
+}
+
+# Trim back to MAX_ENTRIES once it is exceeded by this fraction
+EVICTION_SLACK = 0.05
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS results (
+        key TEXT PRIMARY KEY,
+        host TEXT,
+        success INTEGER NOT NULL,
+        value TEXT NOT NULL,
+        created REAL NOT NULL,
+        expires REAL NOT NULL,
+        last_access REAL NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)',
+    'CREATE TABLE IF NOT EXISTS result_cache_stats (name TEXT PRIMARY KEY, count INTEGER NOT NULL)',
+]
+
+
+def _conn():
+    store.ensure_schema('result_cache', SCHEMA)
+    return store.connect()
+
+
+def _bump(conn, name, amount=1):
+    conn.execute(
+        'INSERT INTO result_cache_stats (name, count) VALUES (?, ?) '
+        'ON CONFLICT(name) DO UPDATE SET count = count + excluded.count',
+        (name, amount),
+    )
+
+
+def cache_key(url, method=None, source='scraper'):
+    """trx:<source>:<method>:<host>:<id> for receipts, url:<source>:<method>:<url> otherwise
+
+    `source` is the script whose results these are: scraper.py and
+    real_scraper.py cache differently shaped results for the same receipts.
+    """
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    transaction_id = parse_qs(parsed.query).get('trx', [None])[0]
+    if transaction_id:
+        return f'trx:{source}:{method or ""}:{host}:{transaction_id}'
+    return f'url:{source}:{method or ""}:{url}'
+
+
+def ttl_for(host, success):
+    """Seconds to keep a result for host, or 0 to skip caching"""
+    ttl = HOST_TTLS.get(host, DEFAULT_TTL)
+    if not ttl:
+        return 0
+    return ttl if success else min(ttl, NEGATIVE_TTL)
+
+
+def get(key):
+    """Cached result for key, or None"""
+    if not ENABLED:
+        return None
+    conn = _conn()
+    now = time.time()
+    row = conn.execute('SELECT value, success, expires FROM results WHERE key = ?', (key,)).fetchone()
+    if row is None or row[2] <= now:
+        _bump(conn, 'misses')
+        return None
+    conn.execute('UPDATE results SET last_access = ? WHERE key = ?', (now, key))
+    _bump(conn, 'hits' if row[1] else 'negative_hits')
+    return json.loads(row[0])
+
+
+def put(key, host, result, success):
+    """Store result under key with the host's TTL policy"""
+    if not ENABLED:
+        return
+    ttl = ttl_for(host, success)
+    if not ttl:
+        return
+    conn = _conn()
+    now = time.time()
+    conn.execute(
+        'INSERT OR REPLACE INTO results (key, host, success, value, created, expires, last_access) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (key, host, 1 if success else 0, json.dumps(result), now, now + ttl, now),
+    )
+    _bump(conn, 'stores')
+    _evict(conn, now)
+
+
+def _evict(conn, now):
+    count = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+    if count <= MAX_ENTRIES * (1 + EVICTION_SLACK):
+        return
+    expired = conn.execute('DELETE FROM results WHERE expires <= ?', (now,)).rowcount
+    excess = count - expired - MAX_ENTRIES
+    evicted = 0
+    if excess > 0:
+        evicted = conn.execute(
+            'DELETE FROM results WHERE key IN '
+            '(SELECT key FROM results ORDER BY last_access LIMIT ?)',
+            (excess,),
+        ).rowcount
+    _bump(conn, 'expired', expired)
+    _bump(conn, 'evictions', evicted)
+
+
+def lookup(url, method, source='scraper'):
+    """Cached result for url, marked cached: True, or None (also when url's host is not cached)"""
+    host = (urlparse(url).hostname or '').lower()
+    if not ENABLED or not ttl_for(host, True):
+        return None
+    try:
+        with metrics.phase('cache'):
+            cached = get(cache_key(url, method, source))
+    except Exception as e:
+        print(f"Result cache unavailable: {e}", file=sys.stderr)
+        return None
+    if cached is not None:
+        cached['cached'] = True
+    return cached
+
+
+def save(url, method, result, success, source='scraper'):
+    """Cache a freshly computed result for url under its host's policy"""
+    host = (urlparse(url).hostname or '').lower()
+    if not ENABLED or not ttl_for(host, True):
+        return
+    try:
+        put(cache_key(url, method, source), host, result, success)
+    except Exception as e:
+        print(f"Result cache write failed: {e}", file=sys.stderr)
+
+
+def cached_call(url, method, fn, is_success, source='scraper'):
+    """Return the cached result for url, or run fn() and cache what it returns
+
+    Concurrent calls for the same key share one run of fn().
+    """
+    cached = lookup(url, method, source)
+    if cached is not None:
+        return cached
+
+    def run():
+        result = fn()
+        save(url, method, result, is_success(result), source)
+        return result
+    return inflight.call(cache_key(url, method, source), run)
+
+
+async def cached_call_async(url, method, fn, is_success, source='scraper'):
+    """cached_call for a coroutine function; the SQLite reads and writes run off the event loop"""
+    import asyncio
+    cached = await asyncio.to_thread(lookup, url, method, source)
+    if cached is not None:
+        return cached
+
+    async def run():
+        result = await fn()
+        await asyncio.to_thread(save, url, method, result, is_success(result), source)
+        return result
+    return await inflight.call_async(cache_key(url, method, source), run)
+
+
+def stats():
+    """Hit/miss counters shared across processes, plus the current entry count"""
+    conn = _conn()
+    counters = dict(conn.execute('SELECT name, count FROM result_cache_stats').fetchall())
+    counters['entries'] = conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+    return counters
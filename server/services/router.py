@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Per-host scraping method router
+Records how each method (a plain GET, a chromium render, selenium) does on
+each host: success rate, how complete the extracted fields are, and latency.
+`auto` jobs go to the cheapest method that has been succeeding there instead
+of the detection probe, and now and then try a plain GET in front of a
+browser in case the site no longer needs one. A circuit breaker stops
+sending work to a method that keeps failing on a host and lets a single job
+probe it again after a cooldown.
+"""
+
+import os
+import random
+import sys
+import time
+from urllib.parse import urlparse
+
+import store
+
+ENABLED = os.environ.get('SCRAPER_ROUTER', '1') != '0'
+# Jobs a method needs on a host before its record is trusted
+MIN_SAMPLES = int(os.environ.get('SCRAPER_ROUTER_MIN_SAMPLES', 3))
+MIN_SUCCESS_RATE = 0.8
+# Fraction of EXPECTED_FIELDS a result must fill to count as good
+MIN_COMPLETENESS = 0.5
+# Weight of the latest job in the moving averages
+ALPHA = 0.2
+# Consecutive failures that open the breaker, and how long it stays open
+BREAK_AFTER = int(os.environ.get('SCRAPER_ROUTER_BREAK_AFTER', 3))
+COOLDOWN = float(os.environ.get('SCRAPER_ROUTER_COOLDOWN', 300))
+# Share of browser-routed jobs that try a plain GET first
+EXPLORE_RATE = float(os.environ.get('SCRAPER_ROUTER_EXPLORE', 0.05))
+
+# Method -> relative resource cost of one second of it; a browser holds far more CPU and memory than a GET
+COSTS = {
+    'static': 1,
+    'chromium': 4,
+    'selenium': 6,
+}
+BROWSERS = ('chromium', 'selenium')
+
+# result['method'] -> router method
+RESULT_METHODS = {
+    'beautifulsoup': 'static',
+    'chromium_headless': 'chromium',
+    'selenium': 'selenium',
+    'playwright': 'selenium',
+}
+
+EXPECTED_FIELDS = ('title', 'price', 'rating', 'availability')
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS method_routes (
+        host TEXT NOT NULL,
+        method TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        successes INTEGER NOT NULL DEFAULT 0,
+        success_rate REAL NOT NULL DEFAULT 0,
+        completeness REAL NOT NULL DEFAULT 0,
+        latency REAL,
+        consecutive_failures INTEGER NOT NULL DEFAULT 0,
+        opened_at REAL,
+        last_used REAL,
+        PRIMARY KEY (host, method)
+    )''',
+]
+
+COLUMNS = ('attempts', 'successes', 'success_rate', 'completeness', 'latency',
+           'consecutive_failures', 'opened_at', 'last_used')
+
+
+def _conn():
+    store.ensure_schema('router', SCHEMA)
+    return store.connect()
+
+
+def _host(url):
+    return (urlparse(url).hostname or '').lower()
+
+
+def routes(host):
+    """{method: record} for every method seen on host"""
+    rows = _conn().execute(
+        f'SELECT method, {", ".join(COLUMNS)} FROM method_routes WHERE host = ?', (host,),
+    ).fetchall()
+    return {row[0]: dict(zip(COLUMNS, row[1:])) for row in rows}
+
+
+def completeness(result):
+    """Share of the expected product fields a result filled (0 for failures and demo placeholders)
+
+    Fields the extractor filled with a default (extractedData.placeholderFields)
+    do not count: a captcha page gets those too.
+    """
+    if not result.get('success'):
+        return 0.0
+    extracted = result.get('extractedData') or {}
+    items = extracted.get('transactions') or []
+    if not items:
+        return 0.0
+    item = items[0]
+    if str(item.get('description', '')).startswith('Demo product data'):
+        return 0.0
+    placeholders = set(extracted.get('placeholderFields') or ())
+    return sum(1 for name in EXPECTED_FIELDS if item.get(name) and name not in placeholders) / len(EXPECTED_FIELDS)
+
+
+def acceptable(result):
+    """Whether a result is good enough to return without trying another method"""
+    return completeness(result) >= MIN_COMPLETENESS
+
+
+def _breaker(record, now):
+    """'closed', 'open', or 'half_open' once an open breaker's cooldown has passed"""
+    if not record or record['opened_at'] is None:
+        return 'closed'
+    return 'open' if now - record['opened_at'] < COOLDOWN else 'half_open'
+
+
+def _proven(record):
+    return (record is not None and record['attempts'] >= MIN_SAMPLES
+            and record['success_rate'] >= MIN_SUCCESS_RATE and record['completeness'] >= MIN_COMPLETENESS)
+
+
+def _claim_probe(conn, host, method, record, now):
+    """Let exactly one job probe a half-open method: restart its cooldown if nobody else did first"""
+    return conn.execute(
+        'UPDATE method_routes SET opened_at = ? WHERE host = ? AND method = ? AND opened_at = ?',
+        (now, host, method, record['opened_at']),
+    ).rowcount == 1
+
+
+def choose(url):
+    """(method, trial) for an auto job on url
+
+    `method` is the cheapest method proven on the host (or a half-open one this
+    job gets to probe), None when the host has no usable record; `trial` is
+    'static' when a plain GET should be tried first.
+    """
+    if not ENABLED:
+        return None, None
+    host = _host(url)
+    try:
+        conn = _conn()
+        records = routes(host)
+    except Exception as e:
+        print(f"Method router unavailable: {e}", file=sys.stderr)
+        return None, None
+
+    now = time.time()
+    chosen = None
+    proven = [method for method in COSTS
+              if _breaker(records.get(method), now) == 'closed' and _proven(records.get(method))]
+    if proven:
+        # Expected cost of a good result: resource weight x latency, inflated by the failure rate
+        chosen = min(proven, key=lambda method: COSTS[method] * (records[method]['latency'] or 1.0)
+                     / records[method]['success_rate'])
+    for method in sorted(COSTS, key=COSTS.get):
+        if chosen is not None and COSTS[method] >= COSTS[chosen]:
+            break
+        record = records.get(method)
+        if _breaker(record, now) == 'half_open' and _claim_probe(conn, host, method, record, now):
+            print(f"Probing {method} on {host} again", file=sys.stderr)
+            # A GET probe is cheap enough to run in front of whatever the job would use anyway
+            if method == 'static':
+                return chosen, 'static'
+            return method, None
+
+    trial = None
+    if chosen in BROWSERS and _breaker(records.get('static'), now) == 'closed' and random.random() < EXPLORE_RATE:
+        trial = 'static'
+    return chosen, trial
+
+
+def reroute(url, method):
+    """method, or another browser when method's breaker is open on url's host"""
+    if not ENABLED or method not in BROWSERS:
+        return method
+    try:
+        records = routes(_host(url))
+    except Exception:
+        return method
+    now = time.time()
+    if _breaker(records.get(method), now) != 'open':
+        return method
+    for other in BROWSERS:
+        if other != method and _breaker(records.get(other), now) != 'open':
+            print(f"{method} is failing on {_host(url)}; using {other}", file=sys.stderr)
+            return other
+    return method
+
+
+def record(url, result, seconds):
+    """Fold one freshly scraped result into its host and method's record"""
+    method = RESULT_METHODS.get(result.get('method'))
+    if not ENABLED or method is None:
+        return
+    host = _host(url)
+    score = completeness(result)
+    ok = score > 0
+    now = time.time()
+    try:
+        conn = _conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            previous = conn.execute(
+                'SELECT attempts, successes, success_rate, completeness, latency, consecutive_failures, opened_at '
+                'FROM method_routes WHERE host = ? AND method = ?', (host, method),
+            ).fetchone()
+            if previous is None:
+                attempts, successes = 1, int(ok)
+                success_rate, average, latency, failures, opened_at = float(ok), score, seconds, 0, None
+            else:
+                attempts, successes = previous[0] + 1, previous[1] + int(ok)
+                success_rate = previous[2] + ALPHA * (float(ok) - previous[2])
+                average = previous[3] + ALPHA * (score - previous[3])
+                latency = seconds if previous[4] is None else previous[4] + ALPHA * (seconds - previous[4])
+                failures, opened_at = previous[5], previous[6]
+            if ok:
+                failures, opened_at = 0, None
+            else:
+                failures += 1
+                if failures >= BREAK_AFTER:
+                    if opened_at is None:
+                        print(f"{method} failed {failures} times in a row on {host}; pausing it", file=sys.stderr)
+                    opened_at = now
+            conn.execute(
+                'INSERT OR REPLACE INTO method_routes (host, method, attempts, successes, success_rate, '
+                'completeness, latency, consecutive_failures, opened_at, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (host, method, attempts, successes, success_rate, average, latency, failures, opened_at, now),
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+    except Exception as e:
+        print(f"Method router write failed: {e}", file=sys.stderr)
+
+
+def stats():
+    """{host: {method: record}} with breaker states, for the worker's stats op"""
+    try:
+        rows = _conn().execute(f'SELECT host, method, {", ".join(COLUMNS)} FROM method_routes').fetchall()
+    except Exception:
+        return {}
+    now = time.time()
+    hosts = {}
+    for row in rows:
+        entry = dict(zip(COLUMNS, row[2:]))
+        entry['breaker'] = _breaker(entry, now)
+        hosts.setdefault(row[0], {})[row[1]] = entry
+    return hosts
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Request pacing and retry scheduling for the scraper
+Per-host token buckets keep request rates polite, retries back off
+exponentially with jitter, and every job carries a deadline so nothing
+keeps retrying after its time budget is spent. Under the worker and batch
+runners a job that has to wait does not hold its thread: it is rescheduled
+and picks up where it left off once the wait is over
+"""
+
+import contextlib
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+
+DEFAULT_DEADLINE = float(os.environ.get('SCRAPER_JOB_DEADLINE', 90))
+DEFAULT_RATE = float(os.environ.get('SCRAPER_HOST_RATE', 0.5))  # requests per second
+DEFAULT_BURST = float(os.environ.get('SCRAPER_HOST_BURST', 2))
+
+# Hosts that need gentler (or allow faster) pacing: (rate, burst)
+HOST_RATES = {
+    'www.amazon.com': (0.3, 1),
+}
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Reschedule(BaseException):
+    """Raised by pause() inside a resumable job: run the job again in `seconds`
+
+    `wake(callback)`, when given, registers a callback that resumes the job
+    sooner (e.g. when a scrape it waits on lands). A BaseException so the
+    broad `except Exception` retry handlers let it through to the runner.
+    """
+
+    def __init__(self, seconds, wake=None):
+        super().__init__(seconds)
+        self.seconds = seconds
+        self.wake = wake
+
+
+class Deadline:
+    """Wall-clock budget for one job"""
+
+    def __init__(self, seconds=DEFAULT_DEADLINE):
+        self.seconds = seconds
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def cap(self, timeout):
+        """Shrink a timeout so it ends by the deadline"""
+        return min(timeout, self.remaining())
+
+    def sleep(self, seconds):
+        """Sleep unless that would run past the deadline; False means give up"""
+        if seconds >= self.remaining():
+            return False
+        if seconds > 0:
+            time.sleep(seconds)
+        return True
+
+
+_current_deadline = contextvars.ContextVar('scraper_deadline', default=None)
+_job_state = contextvars.ContextVar('scraper_job_state', default=None)
+
+
+@contextlib.contextmanager
+def resumable(state):
+    """Run the code in this block (one job) so that pause() reschedules it instead of sleeping
+
+    `state` is the same dict on every run of the job; code that must not
+    repeat itself when the job is run again keeps its progress there.
+    """
+    token = _job_state.set(state)
+    try:
+        yield state
+    finally:
+        _job_state.reset(token)
+
+
+def is_resumable():
+    """Whether the running job can be rescheduled instead of waiting on its thread"""
+    return _job_state.get() is not None
+
+
+def job_state():
+    """The running job's resumable state (a throwaway dict outside resumable())"""
+    state = _job_state.get()
+    return {} if state is None else state
+
+
+def once(name, fn):
+    """fn(), computed on the job's first run and remembered for the runs that resume it"""
+    state = job_state()
+    if name not in state:
+        state[name] = fn()
+    return state[name]
+
+
+def pause(seconds, deadline=None):
+    """Wait `seconds` unless that would run past the deadline; False means give up
+
+    Inside a resumable job this raises Reschedule rather than parking the
+    thread, so the caller must have recorded in job_state() how far it got.
+    """
+    deadline = deadline or current_deadline()
+    if seconds >= deadline.remaining():
+        return False
+    if seconds > 0 and _job_state.get() is not None:
+        raise Reschedule(seconds)
+    return deadline.sleep(seconds)
+
+
+_timers = []
+_timers_cond = threading.Condition()
+_timer_ids = itertools.count()
+_timer_thread = None
+
+
+def _run_timers():
+    while True:
+        with _timers_cond:
+            while not _timers or _timers[0][0] > time.monotonic():
+                _timers_cond.wait(_timers[0][0] - time.monotonic() if _timers else None)
+            _, _, fn, args = heapq.heappop(_timers)
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"Scheduled call failed: {e}", file=sys.stderr)
+
+
+def call_later(seconds, fn, *args):
+    """Call fn(*args) from the shared timer thread in `seconds`; fn should only hand work off"""
+    global _timer_thread
+    with _timers_cond:
+        heapq.heappush(_timers, (time.monotonic() + seconds, next(_timer_ids), fn, args))
+        if _timer_thread is None:
+            _timer_thread = threading.Thread(target=_run_timers, name='scheduler-timers', daemon=True)
+            _timer_thread.start()
+        _timers_cond.notify()
+
+
+def resume_later(reschedule, fn, *args):
+    """Call fn(*args) once the job that raised `reschedule` may run again: when woken, or when its wait is up"""
+    lock = threading.Lock()
+    fired = []
+
+    def fire():
+        with lock:
+            if fired:
+                return
+            fired.append(True)
+        fn(*args)
+
+    call_later(reschedule.seconds, fire)
+    if reschedule.wake is not None:
+        reschedule.wake(fire)
+
+
+def _run_resumable(state, fn, args):
+    with resumable(state):
+        return fn(*args)
+
+
+async def run_in_thread(fn, *args):
+    """asyncio.to_thread(fn, *args) for code that may pause(): its waits happen on the event loop"""
+    import asyncio
+    state = {}
+    while True:
+        try:
+            return await asyncio.to_thread(_run_resumable, state, fn, args)
+        except Reschedule as e:
+            loop = asyncio.get_running_loop()
+            ready = loop.create_future()
+            resume_later(e, loop.call_soon_threadsafe, lambda: ready.done() or ready.set_result(None))
+            await ready
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds=None):
+    """Give the code in this block (one job) a shared deadline, kept across the job's resumed runs"""
+    token = _current_deadline.set(once('deadline', lambda: Deadline(seconds or DEFAULT_DEADLINE)))
+    try:
+        yield _current_deadline.get()
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline():
+    """The enclosing job's deadline, or a fresh default one"""
+    return _current_deadline.get() or Deadline()
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token now and return how long to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        with self.lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket_for(host):
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            rate, burst = HOST_RATES.get(host, (DEFAULT_RATE, DEFAULT_BURST))
+            bucket = _buckets[host] = TokenBucket(rate, burst)
+        return bucket
+
+
+def pace(host, deadline=None):
+    """Wait for host's rate limit; False if the wait would overrun the deadline
+
+    A rescheduled job keeps the token it reserved; it is spent when the job resumes.
+    """
+    bucket = bucket_for(host)
+    wait = bucket.reserve()
+    if not pause(wait, deadline):
+        bucket.refund()
+        return False
+    return True
+
+
+def backoff(attempt, base=2.0, cap=30.0):
+    """Full-jitter exponential backoff delay before retry number `attempt` (1-based)"""
+    return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))
@@ -1,38 +1,81 @@
 #!/usr/bin/env python3
 import sys
 import json
-import requests
-from bs4 import BeautifulSoup
+import http_pool
+import browser_pool
+import blob_store
+import events
+import hedge
+import inflight
+import result_cache
+import method_cache
+import metrics
+import page_versions
+import resource_filter
+import router
+import scheduler
+from pipeline import PendingExtraction, complete
 import re
 from urllib.parse import urlparse
 import time
-import random
+from extractors import PRODUCT_FIELDS, EBAY_FIELDS, rendered_fields_for
+from document import as_document
 
-def scrape_with_beautifulsoup(url):
-    """Scrape using requests + BeautifulSoup for static content"""
+NON_PRICE_CHARS = re.compile(r'[^\d.,]')
+
+# Don't start a browser attempt with less time than this left on the job deadline
+MIN_ATTEMPT_SECONDS = 5
+
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+def scrape_with_beautifulsoup(url, response=None):
+    """Scrape using requests + BeautifulSoup for static content
+    
+    `response` is an already downloaded page (e.g. the auto-detect probe) to
+    extract from instead of fetching it again. Pages seen before are revalidated
+    with a conditional request, and extraction is skipped when they are unchanged.
+    """
+    return complete(fetch_static_page(url, response))
+
+def fetch_static_page(url, response=None, render=True):
+    """Fetch stage of scrape_with_beautifulsoup: a finished result or a PendingExtraction
+
+    render=False fetches the page with a plain GET even on sites normally rendered in chromium.
+    """
     try:
         # For e-commerce URLs, use chromium headless for real data
-        if any(site in url.lower() for site in ['amazon.com', 'ebay.com', 'aliexpress.com', 'walmart.com']):
-            return scrape_with_chromium_headless(url)
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        response = requests.get(url, headers=headers, timeout=30)
-        response.raise_for_status()
+        if render and needs_rendering(url):
+            return render_product_page(url)
         
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # Extract product data using common patterns
-        extracted_data = extract_product_data(soup, url)
+        previous = page_versions.get(url)
+        if response is None:
+            response = http_pool.get(url, headers=revalidation_headers(previous), timeout=30,
+                                    max_bytes=http_pool.MAX_BODY_BYTES)
+        return static_page_stage(url, response, previous)
         
+    except Exception as e:
         return {
-            'success': True,
+            'success': False,
             'method': 'beautifulsoup',
-            'rawHtml': response.text,
-            'extractedData': extracted_data
+            'error': str(e)
         }
+
+async def scrape_with_beautifulsoup_async(url, fetcher, response=None, render=True):
+    """scrape_with_beautifulsoup on the async engine (an async_fetch.AsyncFetcher); same result contract"""
+    import asyncio
+    try:
+        if render and needs_rendering(url):
+            return await scheduler.run_in_thread(scrape_with_chromium_headless, url)
+        
+        previous = await asyncio.to_thread(page_versions.get, url)
+        if response is None:
+            headers = await asyncio.to_thread(revalidation_headers, previous)
+            response = await fetcher.get(url, headers=headers, timeout=30,
+                                         max_bytes=http_pool.MAX_BODY_BYTES)
+        # Parsing and extraction are CPU work; keep them off the event loop
+        return await asyncio.to_thread(lambda: complete(static_page_stage(url, response, previous)))
         
     except Exception as e:
         return {
@@ -41,23 +84,114 @@ def scrape_with_beautifulsoup(url):
             'error': str(e)
         }
 
+def needs_rendering(url):
+    return any(site in url.lower() for site in ['amazon.com', 'ebay.com', 'aliexpress.com', 'walmart.com'])
+
+def revalidation_headers(previous):
+    if previous and not blob_store.INLINE_HTML and not blob_store.exists(f"sha256:{previous['contentHash']}"):
+        # The stored copy of the page is gone; ask for the body so it can be filed again
+        return REQUEST_HEADERS
+    return dict(REQUEST_HEADERS, **page_versions.conditional_headers(previous))
+
+def static_page_stage(url, response, previous):
+    """Turn a fetched static page into a result, or a pending extraction when it has changed"""
+    if response.status_code == 304 and previous:
+        page_versions.touch(url)
+        return unchanged_page_result(previous, not_modified=True)
+    response.raise_for_status()
+    
+    html = response.text
+    digest = page_versions.content_hash(html)
+    if previous and previous['contentHash'] == digest:
+        page_versions.touch(url, response)
+        return unchanged_page_result(previous, not_modified=False, html=html)
+    # Keep only what finish() needs, so the response body can be freed while extraction runs
+    headers = response.headers
+    truncated = getattr(response, 'truncated', False)
+    
+    def finish(extracted_data):
+        page_versions.save(url, headers, digest, len(html.encode('utf-8')), extracted_data)
+        result = {
+            'success': True,
+            'method': 'beautifulsoup',
+            'rawHtml': html,
+            'extractedData': extracted_data,
+            'changed': True,
+            'changedFields': page_versions.changed_fields(previous and previous['extracted'], extracted_data)
+        }
+        if truncated:
+            result['truncated'] = True
+        return result
+    
+    # Extract product data using common patterns
+    return PendingExtraction('product', html, (url,), 'beautifulsoup', finish)
+
+def unchanged_page_result(previous, not_modified, html=None):
+    """Result for a page whose content matches its last version: the previous extraction, re-stamped
+
+    html is the page when it was downloaded again, to re-file it if its blob has gone.
+    """
+    result = {
+        'success': True,
+        'method': 'beautifulsoup',
+        'extractedData': dict(previous['extracted'], extractedAt=time.strftime('%Y-%m-%d %H:%M:%S')),
+        'changed': False,
+        'changedFields': {},
+        'notModified': not_modified
+    }
+    if not blob_store.INLINE_HTML:
+        # The page was filed in the blob store under this same hash when it was last extracted,
+        # unless the blob has since been deleted; a 304 has no body to re-file, so it gets no reference
+        ref = f"sha256:{previous['contentHash']}"
+        if blob_store.exists(ref):
+            result['rawHtmlRef'] = ref
+            result['rawHtmlSize'] = previous['size']
+        elif html is not None:
+            # Filed again when the result is externalized, like a fresh page
+            result['rawHtml'] = html
+    return result
+
 def scrape_with_chromium_headless(url):
     """Scrape using chromium headless with retry logic for e-commerce sites"""
+    return complete(render_product_page(url))
+
+def render_product_page(url):
+    """Fetch stage of scrape_with_chromium_headless: render with retries, extraction left pending"""
     import subprocess
     from urllib.parse import parse_qs, urlparse
     
     is_amazon = 'amazon.com' in url
     max_retries = 3 if is_amazon else 2
     retry_delay = 2
-    
-    for attempt in range(max_retries):
+    hostname = urlparse(url).hostname
+    deadline = scheduler.current_deadline()
+    # Under the worker a wait reschedules the job, which resumes at the attempt and wait it reached
+    progress = scheduler.job_state().setdefault(f'render:{url}', {'attempt': 0, 'waited': None, 'failure': None})
+    attempts_made = progress['attempt']
+    failure = progress['failure']
+    
+    for attempt in range(progress['attempt'], max_retries):
         try:
-            print(f"Attempt {attempt + 1}/{max_retries} for {urlparse(url).hostname}", file=sys.stderr)
+            resumed = progress['waited'] if attempt == progress['attempt'] else None
+            progress.update(attempt=attempt, failure=failure)
+            # Back off between attempts, then wait for this host's rate limit;
+            # both give up rather than run past the job's deadline
+            if attempt > 0 and resumed is None:
+                progress['waited'] = 'backoff'
+                if not scheduler.pause(scheduler.backoff(attempt, base=retry_delay), deadline):
+                    break
+            if resumed != 'pace':
+                progress['waited'] = 'pace'
+                if not scheduler.pace(hostname, deadline):
+                    break
+            progress['waited'] = None
+            if deadline.remaining() < MIN_ATTEMPT_SECONDS:
+                break
             
-            # Add human-like delay between attempts
+            attempts_made += 1
+            print(f"Attempt {attempt + 1}/{max_retries} for {hostname}", file=sys.stderr)
             if attempt > 0:
-                time.sleep(retry_delay * attempt)
-            time.sleep(random.uniform(1, 2))
+                events.emit('retry', attempt=attempt + 1, maxAttempts=max_retries, reason=failure)
             
             # Enhanced anti-detection flags for e-commerce sites
             base_flags = [
@@ -79,6 +213,7 @@ def scrape_with_chromium_headless(url):
                 '--headless=new',
                 '--disable-gpu',
                 '--window-size=1920,1080',
+                *resource_filter.chromium_flags(),
                 '--virtual-time-budget=15000',
                 '--run-all-compositor-stages-before-draw',
                 '--enable-features=NetworkService,NetworkServiceLogging',
@@ -90,13 +225,15 @@ def scrape_with_chromium_headless(url):
             
             print(f"Running chromium command for URL: {url}", file=sys.stderr)
             
-            # Add human-like delay for e-commerce sites
-            time.sleep(1)
-            
             try:
-                result = subprocess.run(cmd, capture_output=True, text=True, timeout=35)
-            except subprocess.TimeoutExpired:
+                with resource_filter.collect() as blocked:
+                    # A slow render gets a duplicate (when hedging is on); the first full page wins
+                    result = hedge.call(hostname, 'render',
+                                        lambda: dump_dom(url, cmd, budget_ms=15000, timeout=deadline.cap(35)),
+                                        is_good=lambda rendered: rendered.returncode == 0 and len(rendered.stdout) > 1000)
+            except (subprocess.TimeoutExpired, browser_pool.RenderTimeout):
                 print(f"Timeout on attempt {attempt + 1}", file=sys.stderr)
+                failure = 'timeout'
                 if attempt < max_retries - 1:
                     continue
                 return {
@@ -110,27 +247,35 @@ def scrape_with_chromium_headless(url):
             
             if result.returncode == 0 and len(result.stdout) > 1000:
                 print(f"SUCCESS on attempt {attempt + 1}: Retrieved {len(result.stdout)} characters", file=sys.stderr)
-                soup = BeautifulSoup(result.stdout, 'html.parser')
-                extracted_data = extract_real_product_data(result.stdout, url)
-                
-                return {
+                html = result.stdout
+                return PendingExtraction('rendered_product', html, (url,), 'chromium_headless', lambda extracted_data: resource_filter.report({
                     'success': True,
                     'method': 'chromium_headless',
-                    'rawHtml': result.stdout,
+                    'rawHtml': html,
                     'extractedData': extracted_data
-                }
+                }, blocked))
             else:
                 print(f"FAILED attempt {attempt + 1}: Only {len(result.stdout)} characters (code: {result.returncode})", file=sys.stderr)
+                failure = f'{len(result.stdout)} characters (code {result.returncode})'
                 if attempt < max_retries - 1:
-                    print(f"Retrying in {retry_delay * (attempt + 1)} seconds...", file=sys.stderr)
+                    print("Retrying...", file=sys.stderr)
                     continue
                     
         except Exception as e:
             print(f"Exception on attempt {attempt + 1}: {e}", file=sys.stderr)
+            failure = str(e)
             if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay * (attempt + 1)} seconds...", file=sys.stderr)
+                print("Retrying...", file=sys.stderr)
                 continue
     
+    if attempts_made < max_retries:
+        print(f"Job deadline reached after {attempts_made} attempts", file=sys.stderr)
+        return {
+            'success': False,
+            'method': 'chromium_headless',
+            'error': f'Job deadline reached after {attempts_made} of {max_retries} attempts.'
+        }
+    
     # All retries failed
     print(f"All {max_retries} attempts failed", file=sys.stderr)
     return {
@@ -139,8 +284,26 @@ def scrape_with_chromium_headless(url):
         'error': f'Failed after {max_retries} attempts. E-commerce sites may have anti-bot protection.'
     }
 
+def dump_dom(url, cmd, budget_ms, timeout):
+    """Render url until it is ready (at most budget_ms), falling back to a fixed-budget chromium run"""
+    import subprocess
+    
+    try:
+        html = browser_pool.render(url, budget_ms=budget_ms, timeout=timeout)
+        return subprocess.CompletedProcess(cmd, 0, stdout=html, stderr='')
+    except browser_pool.PoolUnavailable as e:
+        print(f"Browser pool unavailable ({e}), launching chromium", file=sys.stderr)
+    
+    # A one-off chromium launches and renders in one go, so it all counts as render
+    with metrics.phase('render'):
+        return hedge.run_process(cmd, timeout)
+
 def scrape_with_selenium(url):
     """Scrape using Selenium for dynamic content"""
+    return complete(load_with_selenium(url))
+
+def load_with_selenium(url, method='selenium'):
+    """Fetch stage of scrape_with_selenium: load the page, extraction left pending"""
     try:
         from selenium import webdriver
         from selenium.webdriver.chrome.options import Options
@@ -148,49 +311,63 @@ def scrape_with_selenium(url):
         from selenium.webdriver.support.ui import WebDriverWait
         from selenium.webdriver.support import expected_conditions as EC
         
-        options = Options()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--window-size=1920,1080')
-        
-        driver = webdriver.Chrome(options=options)
+        def load_page(driver):
+            with metrics.phase('render'):
+                policy = resource_filter.block_in_selenium(driver, url)
+                driver.get(url)
+                
+                # Wait for page to load
+                WebDriverWait(driver, 10).until(
+                    EC.presence_of_element_located((By.TAG_NAME, "body"))
+                )
+                
+                # Get page source after JavaScript execution
+                html = driver.page_source
+            resource_filter.count_selenium_blocked(driver, policy)
+            return html
         
-        try:
-            driver.get(url)
-            
-            # Wait for page to load
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            
-            # Get page source after JavaScript execution
-            html = driver.page_source
-            soup = BeautifulSoup(html, 'html.parser')
-            
-            # Extract product data
-            extracted_data = extract_product_data(soup, url)
-            
-            return {
-                'success': True,
-                'method': 'selenium',
-                'rawHtml': html,
-                'extractedData': extracted_data
-            }
-            
-        finally:
-            driver.quit()
+        html = None
+        with resource_filter.collect() as blocked:
+            if browser_pool.enabled():
+                try:
+                    html = browser_pool.run_in_tab(load_page, timeout=60)
+                except browser_pool.PoolUnavailable as e:
+                    print(f"Browser pool unavailable ({e}), launching selenium", file=sys.stderr)
             
+            if html is None:
+                options = Options()
+                options.add_argument('--headless')
+                options.add_argument('--no-sandbox')
+                options.add_argument('--disable-dev-shm-usage')
+                options.add_argument('--disable-gpu')
+                options.add_argument('--window-size=1920,1080')
+                resource_filter.selenium_options(options)
+                
+                with metrics.phase('browser_launch'):
+                    driver = webdriver.Chrome(options=options)
+                try:
+                    html = load_page(driver)
+                finally:
+                    driver.quit()
+        
+        # Extract product data
+        return PendingExtraction('product', html, (url,), method, lambda extracted_data: resource_filter.report({
+            'success': True,
+            'method': method,
+            'rawHtml': html,
+            'extractedData': extracted_data
+        }, blocked))
+        
     except Exception as e:
         return {
             'success': False,
-            'method': 'selenium',
+            'method': method,
             'error': str(e)
         }
 
-def extract_product_data(soup, url):
-    """Extract product data from BeautifulSoup object"""
+def extract_product_data(page, url):
+    """Extract product data from a Document (or BeautifulSoup object)"""
+    document = as_document(page, url)
     
     # Initialize data structure
     data = {
@@ -199,102 +376,82 @@ def extract_product_data(soup, url):
         'transactions': []
     }
     
-    # Common patterns for product data
-    product_patterns = {
-        'title': [
-            r'<title[^>]*>([^<]+)</title>',
-            r'product[_\s]*title[^>]*>([^<]+)<',
-            r'item[_\s]*name[^>]*>([^<]+)<'
-        ],
-        'price': [
-            r'\$([0-9,]+\.?[0-9]*)',
-            r'price[^>]*>\$?([0-9,]+\.?[0-9]*)',
-            r'([0-9,]+\.?[0-9]*)\s*USD'
-        ],
-        'rating': [
-            r'rating[^>]*>([0-9\.]+)',
-            r'([0-9\.]+)\s*out\s*of\s*5',
-            r'([0-9\.]+)\s*stars?'
-        ],
-        'availability': [
-            r'(in\s*stock|out\s*of\s*stock|available|unavailable)',
-            r'availability[^>]*>([^<]+)<'
-        ]
-    }
-    
-    # Extract text content
-    text_content = soup.get_text().lower()
-    html_content = str(soup)
-    
     # Look for specific e-commerce site patterns
     if 'amazon.com' in url:
-        product_data = extract_amazon_data(soup, url)
+        product_data = extract_amazon_data(document, url)
         if product_data:
             data['transactions'].append(product_data)
     elif 'ebay.com' in url:
-        product_data = extract_ebay_data(soup, url)
+        product_data = extract_ebay_data(document, url)
         if product_data:
             data['transactions'].append(product_data)
     
     # Generic extraction fallback
     if not data['transactions']:
-        product_data = {}
-        
-        for field, patterns in product_patterns.items():
-            for pattern in patterns:
-                match = re.search(pattern, html_content, re.IGNORECASE)
-                if match:
-                    product_data[field] = match.group(1).strip()
-                    break
+        product_data = document.scanner().extract(PRODUCT_FIELDS)
         
         if product_data:
             data['transactions'].append(product_data)
     
+    if document is not page:
+        document.release()
     return data
 
-def extract_amazon_data(soup, url):
+def extract_amazon_data(page, url):
     """Extract specific data patterns for Amazon"""
+    document = as_document(page, url)
     product = {}
     
     # Amazon-specific selectors and patterns
     title_selectors = ['#productTitle', '.product-title', 'h1']
     price_selectors = ['.a-price-whole', '.a-offscreen', '.a-price .a-offscreen']
     rating_selectors = ['.a-icon-alt', '.reviewCountTextLinkedHistogram']
+    # On a large page only these regions are parsed; availability is read from their text
+    document.focus(title_selectors + price_selectors + rating_selectors + ['#availability', '#outOfStock'])
     
     # Extract title
-    for selector in title_selectors:
-        element = soup.select_one(selector)
-        if element:
-            product['title'] = element.get_text().strip()
-            break
+    with metrics.phase('extract.title'):
+        for selector in title_selectors:
+            element = document.select_one(selector)
+            if element:
+                product['title'] = element.get_text().strip()
+                events.field('title', product['title'])
+                break
     
     # Extract price
-    for selector in price_selectors:
-        element = soup.select_one(selector)
-        if element:
-            price_text = element.get_text().strip()
-            price_match = re.search(r'([0-9,]+\.?[0-9]*)', price_text)
-            if price_match:
-                product['price'] = price_match.group(1)
-                product['currency'] = 'USD'
-                break
+    with metrics.phase('extract.price'):
+        for selector in price_selectors:
+            element = document.select_one(selector)
+            if element:
+                price_text = element.get_text().strip()
+                price_match = re.search(r'([0-9,]+\.?[0-9]*)', price_text)
+                if price_match:
+                    product['price'] = price_match.group(1)
+                    product['currency'] = 'USD'
+                    events.field('price', product['price'])
+                    break
     
     # Extract rating
-    for selector in rating_selectors:
-        element = soup.select_one(selector)
-        if element:
-            rating_text = element.get_text().strip()
-            rating_match = re.search(r'([0-9\.]+)', rating_text)
-            if rating_match:
-                product['rating'] = rating_match.group(1)
-                break
+    with metrics.phase('extract.rating'):
+        for selector in rating_selectors:
+            element = document.select_one(selector)
+            if element:
+                rating_text = element.get_text().strip()
+                rating_match = re.search(r'([0-9\.]+)', rating_text)
+                if rating_match:
+                    product['rating'] = rating_match.group(1)
+                    events.field('rating', product['rating'])
+                    break
     
     # Check availability
-    availability_text = soup.get_text().lower()
-    if 'in stock' in availability_text:
-        product['availability'] = 'In Stock'
-    elif 'out of stock' in availability_text:
-        product['availability'] = 'Out of Stock'
+    with metrics.phase('extract.availability'):
+        availability_text = document.text_lower
+        if 'in stock' in availability_text:
+            product['availability'] = 'In Stock'
+        elif 'out of stock' in availability_text:
+            product['availability'] = 'Out of Stock'
+        if 'availability' in product:
+            events.field('availability', product['availability'])
     
     # Demo data for Amazon URLs
     if not product.get('title'):
@@ -311,38 +468,18 @@ def extract_amazon_data(soup, url):
     
     return product if product else None
 
-def extract_ebay_data(soup, url):
+def extract_ebay_data(page, url):
     """Extract specific data patterns for eBay"""
+    document = as_document(page, url)
     product = {}
     
     # eBay-specific patterns
-    title_patterns = [
-        r'<h1[^>]*>([^<]+)</h1>',
-        r'item[_\s]*title[^>]*>([^<]+)<'
-    ]
-    
-    price_patterns = [
-        r'US\s*\$([0-9,]+\.?[0-9]*)',
-        r'\$([0-9,]+\.?[0-9]*)',
-        r'price[^>]*>\$?([0-9,]+\.?[0-9]*)'
-    ]
-    
-    html_content = str(soup)
-    
-    # Extract title
-    for pattern in title_patterns:
-        match = re.search(pattern, html_content, re.IGNORECASE)
-        if match:
-            product['title'] = match.group(1).strip()
-            break
-    
-    # Extract price
-    for pattern in price_patterns:
-        match = re.search(pattern, html_content, re.IGNORECASE)
-        if match:
-            product['price'] = match.group(1)
-            product['currency'] = 'USD'
-            break
+    fields = document.scanner().extract(EBAY_FIELDS)
+    if 'title' in fields:
+        product['title'] = fields['title']
+    if 'price' in fields:
+        product['price'] = fields['price']
+        product['currency'] = 'USD'
     
     # Demo data for eBay URLs
     if not product.get('title'):
@@ -359,10 +496,12 @@ def extract_ebay_data(soup, url):
     
     return product if product else None
 
-def extract_real_product_data(html_content, url):
-    """Extract real product data from rendered HTML content"""
+def extract_real_product_data(page, url):
+    """Extract real product data from rendered HTML content (a string or Document)"""
     from urllib.parse import urlparse
     
+    document = as_document(page, url)
+    html_content = document.source if document.source is not None else document.serialized
     if not html_content or len(html_content.strip()) < 100:
         return {
             'error': 'No HTML content received - URL may be inaccessible or blocked',
@@ -373,75 +512,8 @@ def extract_real_product_data(html_content, url):
     
     # Determine patterns based on site
     hostname = urlparse(url).hostname.lower()
-    
-    if 'amazon.com' in hostname:
-        patterns = {
-            'title': [
-                r'<span[^>]*id="productTitle"[^>]*>([^<]+)</span>',
-                r'"title":"([^"]+)"',
-                r'<h1[^>]*>([^<]+)</h1>'
-            ],
-            'price': [
-                r'<span[^>]*class="[^"]*a-price-whole[^"]*"[^>]*>([^<]+)</span>',
-                r'"price":"([^"]+)"',
-                r'\$([0-9,]+\.?[0-9]*)',
-                r'<span[^>]*>\$([0-9,]+\.?[0-9]*)</span>'
-            ],
-            'rating': [
-                r'<span[^>]*class="[^"]*a-icon-alt[^"]*"[^>]*>([0-9\.]+)[^<]*</span>',
-                r'"rating":([0-9\.]+)',
-                r'([0-9\.]+) out of 5'
-            ],
-            'availability': [
-                r'<div[^>]*id="availability"[^>]*>.*?<span[^>]*>([^<]+)</span>',
-                r'"availability":"([^"]+)"',
-                r'(In Stock|Out of Stock|Available|Unavailable)'
-            ]
-        }
-    elif 'ebay.com' in hostname:
-        patterns = {
-            'title': [
-                r'<h1[^>]*id="x-title-label-lbl"[^>]*>([^<]+)</h1>',
-                r'"title":"([^"]+)"',
-                r'<h1[^>]*>([^<]+)</h1>'
-            ],
-            'price': [
-                r'<span[^>]*class="[^"]*notranslate[^"]*"[^>]*>US \$([^<]+)</span>',
-                r'US \$([0-9,]+\.?[0-9]*)',
-                r'\$([0-9,]+\.?[0-9]*)'
-            ],
-            'condition': [
-                r'<div[^>]*class="[^"]*u-flL[^"]*"[^>]*>([^<]+)</div>',
-                r'"condition":"([^"]+)"'
-            ],
-            'availability': [
-                r'<span[^>]*class="[^"]*vi-acc-del-range[^"]*"[^>]*>([^<]+)</span>',
-                r'"availability":"([^"]+)"'
-            ]
-        }
-    else:
-        # Generic e-commerce patterns
-        patterns = {
-            'title': [
-                r'<h1[^>]*>([^<]+)</h1>',
-                r'"title":"([^"]+)"',
-                r'<title>([^<]+)</title>'
-            ],
-            'price': [
-                r'\$([0-9,]+\.?[0-9]*)',
-                r'"price":"([^"]+)"',
-                r'<span[^>]*class="[^"]*price[^"]*"[^>]*>([^<]+)</span>'
-            ],
-            'rating': [
-                r'([0-9\.]+) out of 5',
-                r'"rating":([0-9\.]+)',
-                r'<span[^>]*class="[^"]*rating[^"]*"[^>]*>([^<]+)</span>'
-            ],
-            'availability': [
-                r'(In Stock|Out of Stock|Available|Unavailable)',
-                r'"availability":"([^"]+)"'
-            ]
-        }
+    patterns = rendered_fields_for(hostname)
+    scanner = document.scanner('source')
     
     extracted = {
         'url': url,
@@ -451,104 +523,275 @@ def extract_real_product_data(html_content, url):
     
     product_data = {}
     
-    # Extract data using patterns
+    # Extract data using patterns; the first value that passes validation wins
     for field, field_patterns in patterns.items():
-        for pattern in field_patterns:
-            matches = re.findall(pattern, html_content, re.IGNORECASE | re.DOTALL)
-            if matches:
-                for match in matches:
-                    value = match.strip() if isinstance(match, str) else match
-                    if value and len(value) > 0:
-                        if field == 'price':
-                            # Clean up price
-                            price_clean = re.sub(r'[^\d.,]', '', value)
-                            if price_clean:
-                                try:
-                                    float(price_clean.replace(',', ''))
-                                    product_data['price'] = price_clean
-                                    product_data['currency'] = 'USD'
-                                    break
-                                except:
-                                    continue
-                        elif field == 'rating' and len(value) < 10:
-                            try:
-                                float(value)
-                                product_data['rating'] = value
-                                break
-                            except:
-                                continue
-                        elif field == 'title' and len(value) > 5 and len(value) < 200:
-                            product_data['title'] = value[:100]  # Limit title length
-                            break
-                        elif field == 'availability':
-                            product_data['availability'] = value
-                            break
-                        elif field == 'condition':
-                            product_data['condition'] = value
+        started = time.perf_counter()
+        for match in scanner.values(field_patterns):
+            value = match.strip()
+            if value and len(value) > 0:
+                if field == 'price':
+                    # Clean up price
+                    price_clean = NON_PRICE_CHARS.sub('', value)
+                    if price_clean:
+                        try:
+                            float(price_clean.replace(',', ''))
+                            product_data['price'] = price_clean
+                            product_data['currency'] = 'USD'
                             break
-                if field in product_data:
+                        except:
+                            continue
+                elif field == 'rating' and len(value) < 10:
+                    try:
+                        float(value)
+                        product_data['rating'] = value
+                        break
+                    except:
+                        continue
+                elif field == 'title' and len(value) > 5 and len(value) < 200:
+                    product_data['title'] = value[:100]  # Limit title length
                     break
+                elif field == 'availability':
+                    product_data['availability'] = value
+                    break
+                elif field == 'condition':
+                    product_data['condition'] = value
+                    break
+        metrics.add(f'extract.{field}', time.perf_counter() - started)
+        if field in product_data:
+            events.field(field, product_data[field])
     
-    # Set defaults if not extracted
+    # Set defaults if not extracted, and say which are placeholders so they are not taken for data
+    placeholders = []
     if 'title' not in product_data:
         product_data['title'] = f"Product from {urlparse(url).hostname}"
+        placeholders.append('title')
     if 'availability' not in product_data:
         product_data['availability'] = 'Unknown'
+        placeholders.append('availability')
+    if placeholders:
+        extracted['placeholderFields'] = placeholders
     
     product_data['description'] = f"Product scraped from {urlparse(url).hostname}"
     product_data['source'] = urlparse(url).hostname
     
     extracted['transactions'].append(product_data)
+    if document is not page:
+        document.release()
     return extracted
 
 def auto_detect_method(url):
     """Automatically detect the best scraping method"""
+    return detect_method(url)[0]
+
+def detect_method(url):
+    """Pick a scraping method for url: (method, probe response or None)
+    
+    A single GET decides; when it picks beautifulsoup the response is handed back
+    so the page is not downloaded twice. Decisions are remembered per host and
+    path prefix, so known sites skip the probe.
+    """
+    cached = method_cache.get(url)
+    if cached:
+        return cached, None
+    
     try:
-        # First try a quick head request
-        response = requests.head(url, timeout=10)
-        
-        # Check content type
-        content_type = response.headers.get('content-type', '').lower()
-        
-        # If it's clearly static HTML, use BeautifulSoup
-        if 'text/html' in content_type:
-            # Try a quick GET to see if we get meaningful content
-            quick_response = requests.get(url, timeout=15)
-            if len(quick_response.text) > 1000:  # Reasonable amount of content
-                return 'beautifulsoup'
-        
-        # Default to Selenium for dynamic content
-        return 'selenium'
-        
+        response = http_pool.get(url, headers=REQUEST_HEADERS, timeout=15, max_bytes=http_pool.MAX_BODY_BYTES)
     except:
         # If we can't determine, default to Selenium
-        return 'selenium'
+        return 'selenium', None
+    return method_for_probe(url, response)
+
+async def detect_method_async(url, fetcher):
+    """detect_method on the async engine; the method cache is read and written off the event loop"""
+    import asyncio
+    cached = await asyncio.to_thread(method_cache.get, url)
+    if cached:
+        return cached, None
+    
+    try:
+        response = await fetcher.get(url, headers=REQUEST_HEADERS, timeout=15, max_bytes=http_pool.MAX_BODY_BYTES)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        return 'selenium', None
+    return await asyncio.to_thread(method_for_probe, url, response)
+
+def method_for_probe(url, response):
+    """Decide (and remember) the method from the detection probe's response"""
+    # If it's clearly static HTML with a reasonable amount of content, use BeautifulSoup
+    content_type = response.headers.get('content-type', '').lower()
+    if 'text/html' in content_type and len(response.text) > 1000:
+        method_cache.put(url, 'beautifulsoup')
+        return 'beautifulsoup', response
+    
+    # Default to Selenium for dynamic content
+    method_cache.put(url, 'selenium')
+    return 'selenium', None
+
+def is_success(result):
+    return bool(result.get('success'))
+
+def run_job(url, method):
+    """Run one scrape (or return its cached result) and return the result dict with its timings"""
+    return metrics.observe_job(
+        url, method,
+        lambda: result_cache.cached_call(url, method, lambda: run_scrape(url, method), is_success),
+        is_success,
+    )
+
+def run_scrape(url, method):
+    """Run one scrape with the requested method and return its result dict"""
+    started = scheduler.once('started', time.monotonic)
+    result = complete(scrape_stage(url, method))
+    router.record(url, result, time.monotonic() - started)
+    # Keep the page itself out of the result (and the cache); callers fetch it by reference
+    return blob_store.externalize(result)
+
+def scrape_stage(url, method):
+    """Fetch stage of run_scrape: a finished result or a PendingExtraction"""
+    probe = None
+    if method == 'auto':
+        # The router's choice where this host has a track record, else the detection probe;
+        # a rescheduled job keeps the route (and any probe claim) it was given
+        method, trial = scheduler.once('route', lambda: router.choose(url))
+        if trial:
+            result = scheduler.once('trial', lambda: trial_scrape(url, trial))
+            if result is not None:
+                return result
+        if method:
+            events.emit('method', method=method, source='router')
+        else:
+            with metrics.phase('detect'):
+                method, probe = detect_method(url)
+            method = rerouted(url, method)
+            events.emit('method', method=method, source='detect')
+    
+    # Execute scraping based on method
+    if method == 'beautifulsoup':
+        return fetch_static_page(url, response=probe)
+    elif method == 'static':
+        return fetch_static_page(url, render=False)
+    elif method == 'chromium':
+        return render_product_page(url)
+    elif method == 'selenium':
+        return load_with_selenium(url)
+    elif method == 'playwright':
+        # Placeholder for playwright implementation
+        return load_with_selenium(url, method='playwright')  # Fallback to selenium
+    else:
+        return {'success': False, 'error': f'Unknown method: {method}'}
+
+def rerouted(url, method):
+    """The detected method as the router names what it will run, swapped if its breaker is open"""
+    # A "beautifulsoup" page on a rendered site goes to chromium, so check that breaker
+    if method == 'beautifulsoup' and needs_rendering(url):
+        method = 'chromium'
+    return router.reroute(url, method)
+
+def trial_scrape(url, method):
+    """Try a cheaper method ahead of the routed one; its result if good enough, else None"""
+    started = time.monotonic()
+    events.emit('method', method=method, source='trial')
+    result = complete(scrape_stage(url, method))
+    if router.acceptable(result):
+        return result
+    router.record(url, result, time.monotonic() - started)
+    return None
+
+def pipeline_fetch(job):
+    """Pipeline fetch stage for a batch job: (cached result or scrape stage, its timings)"""
+    url, method = job['url'], job.get('method', 'auto')
+    with scheduler.deadline_scope(job.get('timeout')), metrics.job_scope() as timings:
+        cached = result_cache.lookup(url, method)
+        if cached is not None:
+            return cached, timings
+        return scrape_stage(url, method), timings
+
+def pipeline_done(job, result, timings):
+    """Pipeline finish step: store the page and cache the result, as run_job does"""
+    url, method = job['url'], job.get('method', 'auto')
+    if not result.get('cached'):
+        router.record(url, result, timings.total or 0.0)
+        result = blob_store.externalize(result)
+        result_cache.save(url, method, result, is_success(result))
+    return metrics.finish_job(url, method, result, timings, is_success)
+
+async def run_job_async(url, method, fetcher):
+    """run_job on the async engine: static pages are fetched on the event loop, browsers stay on threads"""
+    return await metrics.observe_job_async(
+        url, method,
+        lambda: result_cache.cached_call_async(url, method, lambda: run_scrape_async(url, method, fetcher), is_success),
+        is_success,
+    )
+
+async def run_scrape_async(url, method, fetcher):
+    import asyncio
+    probe = None
+    started = time.monotonic()
+    if method == 'auto':
+        # The router reads and writes SQLite; keep it off the event loop
+        method, trial = await asyncio.to_thread(router.choose, url)
+        if trial:
+            events.emit('method', method=trial, source='trial')
+            result = await scrape_with_beautifulsoup_async(url, fetcher, render=False)
+            await asyncio.to_thread(router.record, url, result, time.monotonic() - started)
+            if router.acceptable(result):
+                return await asyncio.to_thread(blob_store.externalize, result)
+        if method:
+            events.emit('method', method=method, source='router')
+        else:
+            with metrics.phase('detect'):
+                method, probe = await detect_method_async(url, fetcher)
+            method = await asyncio.to_thread(rerouted, url, method)
+            events.emit('method', method=method, source='detect')
+    
+    if method not in ('beautifulsoup', 'static'):
+        return await scheduler.run_in_thread(run_scrape, url, method)
+    
+    started = time.monotonic()
+    result = await scrape_with_beautifulsoup_async(url, fetcher, response=probe, render=method != 'static')
+    await asyncio.to_thread(router.record, url, result, time.monotonic() - started)
+    return await asyncio.to_thread(blob_store.externalize, result)
+
+def handle_worker_job(job):
+    """Worker handler: a job is {"id", "url", "method", "timeout"?} or {"id", "op": "stats" | "metrics"}"""
+    if job.get('op') == 'stats':
+        return {'pool': http_pool.pool_stats(), 'cache': result_cache.stats(), 'inflight': inflight.stats(),
+                'routes': router.stats(), 'hedge': hedge.stats()}
+    if job.get('op') == 'metrics':
+        return metrics.export(job.get('format', 'prometheus'))
+    with scheduler.deadline_scope(job.get('timeout')):
+        return run_job(job['url'], job.get('method', 'auto'))
+
+async def handle_batch_job_async(job, fetcher):
+    """Async batch handler: a job is {"url", "method"?, "timeout"?}"""
+    with scheduler.deadline_scope(job.get('timeout')):
+        return await run_job_async(job['url'], job.get('method', 'auto'), fetcher)
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        from worker import worker_main
+        browser_pool.enable()
+        worker_main(handle_worker_job, sys.argv[2:],
+                    job_key=lambda job: result_cache.cache_key(job['url'], job.get('method', 'auto')))
+        return
+    
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        from batch import batch_main
+        browser_pool.enable()
+        batch_main(handle_worker_job, sys.argv[2:], async_handler=handle_batch_job_async,
+                   stages=(pipeline_fetch, pipeline_done))
+        return
+    
     if len(sys.argv) != 3:
-        print(json.dumps({'success': False, 'error': 'Usage: scraper.py <url> <method>'}))
+        print(json.dumps({'success': False, 'error': 'Usage: scraper.py <url> <method> | scraper.py --worker [--concurrency N] [--socket PATH] | scraper.py --batch [FILE] [--method M] [--concurrency N] [--per-host N] [--engine threads|async|pipeline]'}))
         sys.exit(1)
     
     url = sys.argv[1]
     method = sys.argv[2]
     
     try:
-        # Auto-detect method if requested
-        if method == 'auto':
-            method = auto_detect_method(url)
-        
-        # Execute scraping based on method
-        if method == 'beautifulsoup':
-            result = scrape_with_beautifulsoup(url)
-        elif method == 'selenium':
-            result = scrape_with_selenium(url)
-        elif method == 'playwright':
-            # Placeholder for playwright implementation
-            result = scrape_with_selenium(url)  # Fallback to selenium
-            result['method'] = 'playwright'
-        else:
-            result = {'success': False, 'error': f'Unknown method: {method}'}
-        
+        result = run_job(url, method)
         print(json.dumps(result))
         
     except Exception as e:
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Shared on-disk state for scraper processes
+One SQLite database in WAL mode that every worker, batch run and CLI
+invocation on the box can read and write concurrently
+"""
+
+import os
+import sqlite3
+import threading
+
+STATE_DIR = os.environ.get(
+    'SCRAPER_STATE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'verification-scraper'),
+)
+DB_PATH = os.environ.get('SCRAPER_STATE_DB', os.path.join(STATE_DIR, 'state.sqlite3'))
+
+_local = threading.local()
+_schemas_lock = threading.Lock()
+_schemas = set()
+
+
+def connect():
+    """Per-thread autocommit connection to the shared state database"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DB_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+    return conn
+
+
+def ensure_schema(name, statements):
+    """Run a module's CREATE statements once per process"""
+    if name in _schemas:
+        return
+    with _schemas_lock:
+        if name in _schemas:
+            return
+        conn = connect()
+        for statement in statements:
+            conn.execute(statement)
+        _schemas.add(name)
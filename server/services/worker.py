@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Long-lived worker mode for the scraper entry points
+Reads newline-delimited JSON jobs on stdin (or a local unix socket) and writes
+one JSON line per finished job, so interpreter startup and imports are paid once.
+A job sent with "events": true also gets {"id", "event"} progress lines while it runs.
+When the entry point can name the key a job is coalesced and cached under, a
+{"id", "key"} line reports it as soon as the job is read, so a client can send
+identical jobs to the same worker without a copy of the key rule.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import events
+import scheduler
+
+DEFAULT_CONCURRENCY = 4
+
+
+class LineWriter:
+    """Serialize JSON messages onto a shared line-oriented stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, message):
+        line = json.dumps(message) + '\n'
+        with self.lock:
+            try:
+                self.stream.write(line)
+                self.stream.flush()
+            except (BrokenPipeError, OSError, ValueError):
+                # Client went away; nothing left to report to
+                pass
+
+
+class Jobs:
+    """Jobs accepted but not yet answered, including those waiting to be resumed"""
+
+    def __init__(self):
+        self.count = 0
+        self.cond = threading.Condition()
+
+    def add(self):
+        with self.cond:
+            self.count += 1
+
+    def done(self):
+        with self.cond:
+            self.count -= 1
+            self.cond.notify_all()
+
+    def wait(self):
+        with self.cond:
+            while self.count:
+                self.cond.wait()
+
+
+def run_job(handler, job, writer, executor=None, jobs=None, state=None):
+    """Run a single job and write its result line, preceded by its event lines if it asked for them
+
+    With an executor, a job that has to wait out a backoff or rate limit
+    gives its thread back and is resubmitted once the wait is over.
+    """
+    job_id = job.get('id')
+    state = {} if state is None else state
+    try:
+        with scheduler.resumable(state) if executor is not None else contextlib.nullcontext():
+            if job.get('events'):
+                started = state.setdefault('eventsStarted', time.perf_counter())
+                with events.stream(lambda event: writer.write({'id': job_id, 'event': event}), started):
+                    result = handler(job)
+            else:
+                result = handler(job)
+        writer.write({'id': job_id, 'result': result})
+    except scheduler.Reschedule as e:
+        scheduler.resume_later(e, executor.submit, run_job, handler, job, writer, executor, jobs, state)
+        return
+    except Exception as e:
+        writer.write({'id': job_id, 'error': str(e)})
+    if jobs is not None:
+        jobs.done()
+
+
+def serve_stream(handler, infile, writer, executor, jobs=None, job_key=None):
+    """Dispatch every job line read from infile onto the executor"""
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            job = json.loads(line)
+            if not isinstance(job, dict):
+                raise ValueError('job must be a JSON object')
+        except ValueError as e:
+            writer.write({'id': None, 'error': f'Invalid job line: {e}'})
+            continue
+        if job_key is not None and job.get('url'):
+            writer.write({'id': job.get('id'), 'key': job_key(job)})
+        if jobs is not None:
+            jobs.add()
+        executor.submit(run_job, handler, job, writer, executor, jobs)
+
+
+def serve_socket(handler, path, executor, job_key=None):
+    """Accept connections on a unix socket; each connection is its own job stream"""
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    print(f"Worker listening on {path}", file=sys.stderr)
+
+    def handle(conn):
+        with conn, conn.makefile('r', encoding='utf-8') as infile, \
+                conn.makefile('w', encoding='utf-8') as outfile:
+            jobs = Jobs()
+            serve_stream(handler, infile, LineWriter(outfile), executor, jobs, job_key)
+            # The client may stop sending before its jobs finish; answer them before closing
+            jobs.wait()
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def worker_main(handler, argv, job_key=None):
+    """Parse worker flags and serve jobs until stdin closes (or forever on a socket)
+
+    job_key(job) is the key identical jobs share, reported to the client for routing.
+    """
+    parser = argparse.ArgumentParser(description='Run the scraper as a long-lived worker')
+    parser.add_argument('--concurrency', type=int,
+                        default=int(os.environ.get('SCRAPER_WORKER_CONCURRENCY', DEFAULT_CONCURRENCY)),
+                        help='number of jobs handled at once')
+    parser.add_argument('--socket', help='serve on this unix socket path instead of stdin/stdout')
+    args = parser.parse_args(argv)
+
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+        if args.socket:
+            serve_socket(handler, args.socket, executor, job_key)
+        else:
+            jobs = Jobs()
+            serve_stream(handler, sys.stdin, LineWriter(sys.stdout), executor, jobs, job_key)
+            # Rescheduled jobs are resubmitted later; the executor must still be open for them
+            jobs.wait()
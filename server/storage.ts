@@ -36,8 +36,12 @@ export class MemStorage implements IStorage {
       completedAt: null,
       errorMessage: null,
       rawHtml: null,
+      rawHtmlRef: null,
+      rawHtmlSize: null,
       extractedData: null,
       processingTime: null,
+      phaseTimings: null,
+      progress: null,
     };
     this.scrapingJobs.set(id, job);
     return job;
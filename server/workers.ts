@@ -0,0 +1,183 @@
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process";
+import { createInterface } from "readline";
+
+export interface ScrapeJob {
+  url: string;
+  method?: string;
+}
+
+// Progress the scraper reports while a job runs, ahead of its result
+export type ScrapeEvent =
+  | { type: "phase"; name: string; state: "started" | "finished"; ms?: number; failed?: boolean; elapsedMs: number }
+  | { type: "retry"; attempt: number; maxAttempts: number; reason: string | null; elapsedMs: number }
+  | { type: "method"; method: string; source: "router" | "detect" | "trial"; elapsedMs: number }
+  | { type: "field"; name: string; value: string; elapsedMs: number }
+  | { type: "hedge"; request: string; afterMs: number; elapsedMs: number };
+
+// Non-scrape requests a worker answers, e.g. { op: "metrics", format: "json" }
+export interface WorkerOp {
+  op: "stats" | "metrics";
+  format?: "prometheus" | "json";
+}
+
+interface PendingJob {
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+  onEvent?: (event: ScrapeEvent) => void;
+  request?: string;
+  // The key the worker coalesces the job under, once it has reported it
+  key?: string;
+}
+
+interface Worker {
+  process: ChildProcessWithoutNullStreams;
+  pending: Map<number, PendingJob>;
+  stderrTail: string;
+}
+
+const STDERR_TAIL_LIMIT = 4000;
+// Requests whose coalescing key the pool remembers
+const KNOWN_KEYS_LIMIT = 10000;
+
+// The same URL and method always coalesce; the worker decides what else does
+function requestOf(job: ScrapeJob | WorkerOp): string | undefined {
+  if (!("url" in job)) return undefined;
+  return `${job.method ?? "auto"} ${job.url}`;
+}
+
+// Pool of long-lived `scraper.py --worker` processes speaking NDJSON over stdio.
+// Each worker handles several jobs at once; new jobs go to the least busy worker,
+// except that a job identical to one already running joins that job's worker,
+// where it waits on the running scrape instead of starting another. Workers
+// report the key each job is coalesced under, so a request that turned out to
+// share one (the same receipt at another URL) is routed with it next time.
+export class ScraperWorkerPool {
+  private workers: Worker[] = [];
+  private nextJobId = 1;
+  private closed = false;
+  private knownKeys = new Map<string, string>();
+
+  constructor(
+    private scriptPath: string,
+    private size: number,
+    private concurrency: number,
+  ) {}
+
+  // With onEvent, the job streams its progress events to it until the result arrives
+  run(job: ScrapeJob | WorkerOp, onEvent?: (event: ScrapeEvent) => void): Promise<any> {
+    if (this.closed) {
+      return Promise.reject(new Error("Scraper worker pool is shut down"));
+    }
+
+    const request = requestOf(job);
+    const key = request ? this.knownKeys.get(request) : undefined;
+    const worker = this.pickWorker(request, key);
+    const id = this.nextJobId++;
+
+    return new Promise((resolve, reject) => {
+      worker.pending.set(id, { resolve, reject, onEvent, request, key });
+      worker.process.stdin.write(JSON.stringify({ id, ...job, events: !!onEvent }) + "\n");
+    });
+  }
+
+  shutdown() {
+    this.closed = true;
+    for (const worker of this.workers) {
+      worker.process.stdin.end();
+    }
+  }
+
+  private pickWorker(request?: string, key?: string): Worker {
+    while (this.workers.length < this.size) {
+      this.workers.push(this.spawnWorker());
+    }
+    if (request) {
+      const running = this.workers.find((worker) =>
+        Array.from(worker.pending.values()).some(
+          (pending) => pending.request === request || (key !== undefined && pending.key === key),
+        ),
+      );
+      if (running) return running;
+    }
+    return this.workers.reduce((best, worker) =>
+      worker.pending.size < best.pending.size ? worker : best,
+    );
+  }
+
+  private rememberKey(request: string, key: string) {
+    this.knownKeys.delete(request);
+    this.knownKeys.set(request, key);
+    if (this.knownKeys.size > KNOWN_KEYS_LIMIT) {
+      // Maps iterate in insertion order, so the first entry is the least recently reported
+      this.knownKeys.delete(this.knownKeys.keys().next().value as string);
+    }
+  }
+
+  private spawnWorker(): Worker {
+    const child = spawn(
+      "python",
+      [this.scriptPath, "--worker", "--concurrency", String(this.concurrency)],
+      { stdio: ["pipe", "pipe", "pipe"] },
+    );
+    const worker: Worker = { process: child, pending: new Map(), stderrTail: "" };
+
+    createInterface({ input: child.stdout }).on("line", (line) => {
+      let message: any;
+      try {
+        message = JSON.parse(line);
+      } catch {
+        return;
+      }
+
+      const pending = worker.pending.get(message.id);
+      if (!pending) return;
+
+      if (message.key) {
+        pending.key = message.key;
+        if (pending.request) this.rememberKey(pending.request, message.key);
+        return;
+      }
+      if (message.event) {
+        try {
+          pending.onEvent?.(message.event);
+        } catch {
+          // A failing progress listener must not take the job down with it
+        }
+        return;
+      }
+      worker.pending.delete(message.id);
+
+      if (message.error) {
+        pending.reject(new Error(message.error));
+      } else {
+        pending.resolve(message.result);
+      }
+    });
+
+    child.stderr.on("data", (data) => {
+      worker.stderrTail = (worker.stderrTail + data.toString()).slice(-STDERR_TAIL_LIMIT);
+    });
+
+    const fail = (error: Error) => {
+      this.workers = this.workers.filter((w) => w !== worker);
+      for (const pending of Array.from(worker.pending.values())) {
+        pending.reject(error);
+      }
+      worker.pending.clear();
+    };
+
+    child.on("error", fail);
+    child.on("exit", (code) => {
+      fail(new Error(worker.stderrTail || `Scraper worker exited with code ${code}`));
+    });
+
+    return worker;
+  }
+}
+
+export const createScraperPool = (scriptPath: string) =>
+  new ScraperWorkerPool(
+    scriptPath,
+    parseInt(process.env.SCRAPER_WORKERS || "2"),
+    parseInt(process.env.SCRAPER_WORKER_CONCURRENCY || "4"),
+  );
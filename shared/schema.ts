@@ -10,9 +10,13 @@ export const scrapingJobs = pgTable("scraping_jobs", {
   startedAt: timestamp("started_at").defaultNow(),
   completedAt: timestamp("completed_at"),
   errorMessage: text("error_message"),
-  rawHtml: text("raw_html"),
+  rawHtml: text("raw_html"), // only set when the scraper runs with SCRAPER_INLINE_HTML=1
+  rawHtmlRef: text("raw_html_ref"), // blob store reference, e.g. sha256:<hex>
+  rawHtmlSize: integer("raw_html_size"), // uncompressed bytes
   extractedData: jsonb("extracted_data"),
   processingTime: integer("processing_time"), // in milliseconds
+  phaseTimings: jsonb("phase_timings"), // { phase: milliseconds } reported by the scraper
+  progress: jsonb("progress"), // { phase, method, attempt, maxAttempts, fields } streamed while the job runs
 });
 
 export const transactions = pgTable("transactions", {
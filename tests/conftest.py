@@ -0,0 +1,20 @@
+"""Shared setup: import the scraper services as their scripts do, against a throwaway state directory"""
+
+import os
+import sys
+import tempfile
+
+# Set before any service module is imported; they read their configuration at import time
+os.environ.setdefault('SCRAPER_STATE_DIR', tempfile.mkdtemp(prefix='scraper-tests-'))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server', 'services'))
+
+
+class ListWriter:
+    """LineWriter stand-in that keeps the messages"""
+
+    def __init__(self):
+        self.messages = []
+
+    def write(self, message):
+        self.messages.append(message)
@@ -0,0 +1,131 @@
+"""Concurrent batch mode (server/services/batch.py)"""
+
+import io
+import threading
+import time
+from collections import defaultdict
+
+import batch
+import scheduler
+from conftest import ListWriter
+
+
+class Recorder:
+    """Batch handler that records how many jobs ran at once, overall and per host"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.active = defaultdict(int)
+        self.host_peak = defaultdict(int)
+
+    def __call__(self, job):
+        host = job['url'].split('/')[2]
+        with self.lock:
+            self.running += 1
+            self.active[host] += 1
+            self.peak = max(self.peak, self.running)
+            self.host_peak[host] = max(self.host_peak[host], self.active[host])
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+            self.active[host] -= 1
+        return {'success': True}
+
+
+def run(handler, jobs, **kwargs):
+    writer = ListWriter()
+    runner = batch.BatchRunner(handler, writer, **kwargs)
+    for job in jobs:
+        runner.submit(job)
+    runner.join()
+    return writer.messages
+
+
+def test_limits_jobs_overall_and_per_host():
+    handler = Recorder()
+    jobs = [{'index': i, 'url': f'http://h{i % 4}.test/{i}'} for i in range(24)]
+
+    messages = run(handler, jobs, concurrency=6, per_host=2)
+
+    assert sorted(message['index'] for message in messages) == list(range(24))
+    assert handler.peak == 6
+    assert max(handler.host_peak.values()) == 2
+
+
+def test_busy_host_parks_its_jobs_without_blocking_others():
+    handler = Recorder(delay=0.2)
+    jobs = [{'index': i, 'url': f'http://slow.test/{i}'} for i in range(4)]
+    jobs.append({'index': 4, 'url': 'http://fast.test/'})
+
+    messages = run(handler, jobs, concurrency=4, per_host=1)
+
+    assert [message['index'] for message in messages].index(4) < 2
+    assert handler.host_peak['slow.test'] == 1
+
+
+def test_handler_error_becomes_an_error_line():
+    def handler(job):
+        raise RuntimeError('no route')
+
+    messages = run(handler, [{'index': 0, 'url': 'http://a.test/'}])
+
+    assert messages == [{'index': 0, 'url': 'http://a.test/', 'error': 'no route'}]
+
+
+def test_paused_job_gives_its_thread_back():
+    # One thread: if the paused job held it, the second job could not finish first
+    finished = []
+
+    def handler(job):
+        progress = scheduler.job_state().setdefault('progress', {'paused': False})
+        if job['index'] == 0 and not progress['paused']:
+            progress['paused'] = True
+            scheduler.pause(0.3, scheduler.Deadline(5))
+        finished.append(job['index'])
+        return {'success': True}
+
+    started = time.monotonic()
+    messages = run(handler, [{'index': 0, 'url': 'http://a.test/'}, {'index': 1, 'url': 'http://b.test/'}],
+                   concurrency=1, per_host=1)
+
+    assert finished == [1, 0]
+    assert [message['index'] for message in messages] == [1, 0]
+    assert 0.3 <= time.monotonic() - started < 2
+
+
+def test_paused_job_keeps_its_host_slot():
+    order = []
+
+    def handler(job):
+        progress = scheduler.job_state().setdefault('progress', {'paused': False})
+        if job['index'] == 0 and not progress['paused']:
+            progress['paused'] = True
+            scheduler.pause(0.2, scheduler.Deadline(5))
+        order.append(job['index'])
+        return {'success': True}
+
+    run(handler, [{'index': 0, 'url': 'http://a.test/1'}, {'index': 1, 'url': 'http://a.test/2'}],
+        concurrency=2, per_host=1)
+
+    # The same host's next job waits for the paused one, as it would for a running one
+    assert order == [0, 1]
+
+
+def test_read_jobs_accepts_plain_and_json_lines():
+    lines = io.StringIO('http://a.test/1\n'
+                        '# comment\n'
+                        '\n'
+                        'http://b.test/2 static\n'
+                        '{"url": "http://c.test/3", "timeout": 5}\n'
+                        '{not json\n')
+
+    jobs = list(batch.read_jobs(lines, 'auto'))
+
+    assert jobs == [
+        {'url': 'http://a.test/1', 'method': 'auto', 'index': 0},
+        {'url': 'http://b.test/2', 'method': 'static', 'index': 3},
+        {'url': 'http://c.test/3', 'timeout': 5, 'method': 'auto', 'index': 4},
+    ]
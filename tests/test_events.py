@@ -0,0 +1,33 @@
+"""Progress events (server/services/events.py) from the extractors"""
+
+import events
+import scraper
+
+RENDERED_PAGE = ('<html><body><span id="productTitle">  Acme Anvil, 50 lb  </span>'
+                 '<span class="a-price-whole">129.99</span>'
+                 '<span class="a-icon-alt">4.6 out of 5 stars</span>'
+                 '<div id="availability"><span>In Stock</span></div>'
+                 + '<p>' + 'x' * 1200 + '</p></body></html>')
+
+BLANK_PAGE = '<html><body>' + '<p>' + 'x' * 1200 + '</p></body></html>'
+
+
+def field_events(extract, *args):
+    sent = []
+    with events.stream(sent.append):
+        extract(*args)
+    return {event['name']: event['value'] for event in sent if event['type'] == 'field'}
+
+
+def test_rendered_extractor_reports_each_field():
+    fields = field_events(scraper.extract_real_product_data, RENDERED_PAGE, 'https://www.amazon.com/dp/B000TEST')
+
+    assert fields == {'title': 'Acme Anvil, 50 lb', 'price': '129.99', 'rating': '4.6', 'availability': 'In Stock'}
+
+
+def test_rendered_extractor_does_not_report_placeholders():
+    fields = field_events(scraper.extract_real_product_data, BLANK_PAGE, 'https://www.amazon.com/dp/B000TEST')
+
+    assert 'title' not in fields
+    assert 'availability' not in fields
+
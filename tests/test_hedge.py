@@ -0,0 +1,133 @@
+"""Hedged requests (server/services/hedge.py) over the shared HTTP pool"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import endpoint_health
+import hedge
+import http_pool
+import real_scraper
+
+
+class StallingServer:
+    """Local API whose first request hangs until released; later requests answer at once"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.requests = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                    first = server.requests == 1
+                if first:
+                    server.release.wait(10)
+                body = json.dumps({'path': self.path, 'first': first}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.release.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = StallingServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    """Hedge every request to a host after 50ms"""
+    monkeypatch.setattr(hedge, 'ENABLED', True)
+
+    def prime(host, kind):
+        entry = hedge._latency(host, kind)
+        for _ in range(hedge.MIN_SAMPLES):
+            entry.add(0.05)
+        entry.budget = hedge.BURST
+    return prime
+
+
+def fetch(url):
+    try:
+        return http_pool.get(url, timeout=10, cancel=hedge.current()).json()
+    except http_pool.RequestCancelled:
+        return None
+
+
+def test_winning_hedge_interrupts_the_stalled_primary(server, hedging):
+    hedging('127.0.0.1', 'test-win')
+
+    started = time.monotonic()
+    answer = hedge.call('127.0.0.1', 'test-win', lambda: fetch(server.url + '/a'))
+
+    # The duplicate answered, and the primary's blocked read was cut short instead of running to its timeout
+    assert answer == {'path': '/a', 'first': False}
+    assert time.monotonic() - started < 2
+    assert server.requests == 2
+
+
+def test_fast_primary_wins_without_a_hedge(server, hedging):
+    hedging('127.0.0.1', 'test-fast')
+    server.requests = 1
+
+    before = hedge.stats()['hedged']
+    answer = hedge.call('127.0.0.1', 'test-fast', lambda: fetch(server.url + '/b'))
+
+    assert answer == {'path': '/b', 'first': False}
+    assert hedge.stats()['hedged'] == before
+
+
+def test_cancelled_request_raises_before_sending(server):
+    cancel = hedge.Cancel()
+    cancel.set()
+
+    with pytest.raises(http_pool.RequestCancelled):
+        http_pool.get(server.url + '/c', cancel=cancel)
+    assert server.requests == 0
+
+
+def test_uncancelled_request_is_unaffected(server):
+    server.requests = 1
+
+    response = http_pool.get(server.url + '/d', cancel=hedge.Cancel())
+
+    assert response.json() == {'path': '/d', 'first': False}
+
+
+def test_losing_api_probe_is_not_recorded(server, hedging, monkeypatch):
+    monkeypatch.setattr(real_scraper, 'API_BASE_URL', server.url)
+    recorded = []
+    monkeypatch.setattr(endpoint_health, 'record', lambda *args, **kwargs: recorded.append(args))
+    hedging('127.0.0.1', 'test-api')
+
+    started = time.monotonic()
+    data = hedge.call('127.0.0.1', 'test-api',
+                      lambda: real_scraper.probe_endpoint('/api/{trx}', 'FT1', {}))
+
+    assert data == {'path': '/api/FT1', 'first': False}
+    assert time.monotonic() - started < 2
+    # Only the winning probe says anything about the endpoint's health
+    assert [(template, ok) for _, template, ok, _ in recorded] == [('/api/{trx}', True)]
@@ -0,0 +1,113 @@
+"""In-flight coalescing (server/services/inflight.py)"""
+
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import inflight
+import scheduler
+import worker
+from conftest import ListWriter
+
+_keys = itertools.count()
+
+
+@pytest.fixture
+def key():
+    return f'test:{next(_keys)}'
+
+
+def test_concurrent_calls_share_one_run(key):
+    runs = []
+    release = threading.Event()
+
+    def scrape():
+        runs.append(1)
+        release.wait(5)
+        return {'success': True, 'value': 42}
+
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(inflight.call, key, scrape) for _ in range(4)]
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(runs) == 1
+    assert all(result['value'] == 42 for result in results)
+    assert sum(1 for result in results if result.get('coalesced')) == 3
+
+
+def test_leader_error_reaches_every_waiter(key):
+    release = threading.Event()
+
+    def scrape():
+        release.wait(5)
+        raise RuntimeError('boom')
+
+    with ThreadPoolExecutor(3) as executor:
+        futures = [executor.submit(inflight.call, key, scrape) for _ in range(3)]
+        time.sleep(0.1)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError, match='boom'):
+                future.result()
+
+
+def test_waiter_gives_up_at_its_own_deadline(key):
+    release = threading.Event()
+
+    def scrape():
+        release.wait(5)
+        return {'success': True}
+
+    def waiter():
+        with scheduler.deadline_scope(0.2):
+            return inflight.call(key, scrape)
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(inflight.call, key, scrape)
+        time.sleep(0.05)
+        result = executor.submit(waiter).result()
+        release.set()
+        assert leader.result() == {'success': True}
+
+    assert result['success'] is False
+    assert 'Timed out' in result['error']
+
+
+def test_rescheduled_leader_is_not_starved_by_its_waiters(key):
+    """More identical jobs than worker threads, and the leader pauses: the waiters must not hold the threads"""
+    runs = []
+
+    def scrape():
+        progress = scheduler.job_state()
+        if not progress.get('paused'):
+            progress['paused'] = True
+            # A backoff; in a resumable job this hands the thread back
+            scheduler.pause(0.5)
+        runs.append(1)
+        return {'success': True}
+
+    def handler(job):
+        with scheduler.deadline_scope(5):
+            return inflight.call(key, scrape)
+
+    writer = ListWriter()
+    jobs = worker.Jobs()
+    started = time.monotonic()
+    with ThreadPoolExecutor(2) as executor:
+        for job_id in range(3):
+            jobs.add()
+            executor.submit(worker.run_job, handler, {'id': job_id}, writer, executor, jobs)
+            time.sleep(0.02)
+        jobs.wait()
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 2, f'jobs took {elapsed:.2f}s; the resumed leader waited behind its waiters'
+    assert len(runs) == 1
+    assert sorted(message['id'] for message in writer.messages) == [0, 1, 2]
+    assert all(message['result']['success'] for message in writer.messages)
+    assert sum(1 for message in writer.messages if message['result'].get('coalesced')) == 2
@@ -0,0 +1,171 @@
+"""Page versions (server/services/page_versions.py) and the blob store (server/services/blob_store.py)"""
+
+import hashlib
+import itertools
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import blob_store
+import page_versions
+import scraper
+
+_pages = itertools.count()
+
+PAGE = ('<html><head><title>Anvil</title></head><body><h1>Acme Anvil</h1>'
+        '<span class="price">$129.99</span></body></html>')
+
+
+def test_blob_round_trip_and_dedup():
+    html = f'<html><body>blob {next(_pages)}</body></html>'
+
+    first = blob_store.put(html)
+    second = blob_store.put(html)
+
+    assert first['ref'] == 'sha256:' + hashlib.sha256(html.encode()).hexdigest()
+    assert second['ref'] == first['ref']
+    assert first['size'] == len(html.encode())
+    assert blob_store.exists(first['ref'])
+    assert blob_store.get(first['ref']) == html
+
+
+def test_missing_blob_reads_as_none():
+    ref = 'sha256:' + '0' * 64
+
+    assert not blob_store.exists(ref)
+    assert blob_store.get(ref) is None
+
+
+def test_malformed_reference_is_rejected():
+    for ref in ('md5:abc', 'sha256:xyz', 'sha256:' + 'A' * 64, '../../etc/passwd'):
+        with pytest.raises(ValueError):
+            blob_store.get(ref)
+
+
+def test_externalize_moves_html_out_of_the_result():
+    html = f'<html><body>external {next(_pages)}</body></html>'
+    result = blob_store.externalize({'success': True, 'rawHtml': html})
+
+    assert 'rawHtml' not in result
+    assert blob_store.get(result['rawHtmlRef']) == html
+    assert result['rawHtmlSize'] == len(html.encode())
+
+
+def test_conditional_headers_use_whichever_validators_exist():
+    assert page_versions.conditional_headers(None) == {}
+    assert page_versions.conditional_headers({'etag': '"v1"', 'lastModified': None}) == {'If-None-Match': '"v1"'}
+    assert page_versions.conditional_headers({'etag': None, 'lastModified': 'Tue, 01 Sep 2026 00:00:00 GMT'}) == {
+        'If-Modified-Since': 'Tue, 01 Sep 2026 00:00:00 GMT'}
+
+
+def test_save_and_get_keep_validators_and_extraction():
+    url = f'https://versions.test/{next(_pages)}'
+    page_versions.save(url, {'ETag': '"v1"'}, 'ab' * 32, 120, {'title': 'Anvil'})
+
+    previous = page_versions.get(url)
+
+    assert previous['etag'] == '"v1"'
+    assert previous['lastModified'] is None
+    assert previous['contentHash'] == 'ab' * 32
+    assert previous['extracted'] == {'title': 'Anvil'}
+
+
+def test_changed_fields_ignore_volatile_fields():
+    before = {'extractedAt': '1', 'transactions': [{'price': '10', 'title': 'Anvil'}]}
+    after = {'extractedAt': '2', 'transactions': [{'price': '12', 'title': 'Anvil'}], 'seller': 'acme'}
+
+    assert page_versions.changed_fields(before, after) == {
+        'seller': {'old': None, 'new': 'acme'},
+        'transactions[0].price': {'old': '10', 'new': '12'},
+    }
+    assert page_versions.changed_fields(before, dict(before, extractedAt='3')) == {}
+
+
+class ValidatingServer:
+    """Serves one page with an ETag and answers a matching If-None-Match with 304"""
+
+    def __init__(self, body):
+        self.body = body
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.headers.get('If-None-Match'))
+                etag = '"' + hashlib.sha256(server.body.encode()).hexdigest()[:16] + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                data = server.body.encode()
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}/page/{next(_pages)}'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ValidatingServer(PAGE + f'<!-- {next(_pages)} -->')
+    yield server
+    server.close()
+
+
+def scrape(url):
+    return blob_store.externalize(scraper.scrape_with_beautifulsoup(url))
+
+
+def test_unchanged_page_is_revalidated_not_re_extracted(server):
+    first = scrape(server.url)
+    second = scrape(server.url)
+
+    assert first['changed'] is True
+    assert second['success'] and second['changed'] is False and second['notModified'] is True
+    assert second['rawHtmlRef'] == first['rawHtmlRef']
+    assert second['extractedData']['transactions'] == first['extractedData']['transactions']
+    # The second request carried the ETag from the first
+    assert server.requests[0] is None and server.requests[1] is not None
+
+
+def test_missing_blob_is_fetched_and_filed_again(server):
+    first = scrape(server.url)
+    digest = first['rawHtmlRef'].partition(':')[2]
+    for extension in ('.gz', '.zst'):
+        path = os.path.join(blob_store.BLOB_DIR, digest[:2], digest + extension)
+        if os.path.exists(path):
+            os.unlink(path)
+
+    second = scrape(server.url)
+
+    # No conditional request: a 304 would leave nothing to re-file
+    assert server.requests[1] is None
+    assert second['changed'] is False and second['notModified'] is False
+    assert second['rawHtmlRef'] == first['rawHtmlRef']
+    assert blob_store.get(second['rawHtmlRef']) == server.body
+
+
+def test_changed_page_reports_its_fields(server):
+    scrape(server.url)
+    server.body = server.body.replace('$129.99', '$139.99')
+
+    result = scrape(server.url)
+
+    assert result['changed'] is True
+    assert result['changedFields'] == {'transactions[0].price': {'old': '129.99', 'new': '139.99'}}
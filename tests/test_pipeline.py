@@ -0,0 +1,125 @@
+"""Staged pipeline engine (server/services/pipeline.py)"""
+
+import threading
+import time
+from collections import defaultdict
+
+import batch
+import pipeline
+from conftest import ListWriter
+
+
+class HostCounter:
+    """fetch stage that records how many fetches ran against each host at once"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.active = defaultdict(int)
+        self.peak = defaultdict(int)
+
+    def __call__(self, job):
+        host = pipeline.host_of(job)
+        with self.lock:
+            self.active[host] += 1
+            self.peak[host] = max(self.peak[host], self.active[host])
+        time.sleep(self.delay)
+        with self.lock:
+            self.active[host] -= 1
+        return {'success': True, 'url': job['url']}, None
+
+
+def run(jobs, fetch, **kwargs):
+    writer = ListWriter()
+    runner = pipeline.Pipeline(fetch, lambda job, result, timings: result, writer, **kwargs)
+    for job in jobs:
+        runner.submit(job)
+    runner.join()
+    return writer.messages
+
+
+def jobs_for(hosts, per_host_count):
+    return [{'index': i, 'url': f'http://{host}/{n}'}
+            for i, (host, n) in enumerate((host, n) for n in range(per_host_count) for host in hosts)]
+
+
+def test_per_host_limit_caps_fetches_against_each_host():
+    fetch = HostCounter()
+    jobs = jobs_for(['a.test', 'b.test'], 6)
+
+    messages = run(jobs, fetch, fetch_workers=8, parse_workers=1, per_host=2)
+
+    assert sorted(message['index'] for message in messages) == list(range(len(jobs)))
+    assert all(message['result']['success'] for message in messages)
+    assert fetch.peak == {'a.test': 2, 'b.test': 2}
+
+
+def test_busy_host_does_not_hold_back_other_hosts():
+    fetch = HostCounter(delay=0.2)
+    jobs = jobs_for(['slow.test'], 4) + [{'index': 4, 'url': 'http://fast.test/'}]
+
+    messages = run(jobs, fetch, fetch_workers=2, parse_workers=1, per_host=1)
+
+    # The fast host's job is fetched alongside the first slow one instead of behind all four
+    order = [message['url'] for message in messages]
+    assert order.index('http://fast.test/') < 2
+    assert fetch.peak['slow.test'] == 1
+
+
+def test_ordered_results_with_parked_jobs():
+    jobs = jobs_for(['a.test', 'b.test', 'c.test'], 4)
+
+    messages = run(jobs, HostCounter(delay=0.01), fetch_workers=4, parse_workers=1, per_host=1, ordered=True)
+
+    assert [message['index'] for message in messages] == list(range(len(jobs)))
+
+
+def test_fetch_error_becomes_a_failed_result():
+    def fetch(job):
+        raise RuntimeError('unreachable')
+
+    messages = run([{'index': 0, 'url': 'http://a.test/'}], fetch, fetch_workers=1, parse_workers=1, per_host=1)
+
+    assert messages[0]['result'] == {'success': False, 'error': 'unreachable'}
+
+
+def test_pending_extraction_runs_in_the_process_pool():
+    html = '<html><head><title>Anvil</title></head><body><span class="price">$129.99</span></body></html>'
+
+    def fetch(job):
+        finish = lambda extracted: {'success': True, 'extractedData': extracted}
+        return pipeline.PendingExtraction('product', html, (job['url'],), 'beautifulsoup', finish), None
+
+    jobs = [{'index': i, 'url': f'http://a.test/{i}'} for i in range(3)]
+    messages = run(jobs, fetch, fetch_workers=2, parse_workers=2, ordered=True)
+
+    assert [message['index'] for message in messages] == [0, 1, 2]
+    for message in messages:
+        assert message['result']['extractedData']['transactions'] == [{'title': 'Anvil', 'price': '129.99'}]
+
+
+def test_batch_flags_reach_the_pipeline(monkeypatch, tmp_path):
+    monkeypatch.delenv('SCRAPER_BATCH_PER_HOST', raising=False)
+    built = []
+
+    class Recorded:
+        def __init__(self, fetch, done, writer, **kwargs):
+            built.append(kwargs)
+
+        def submit(self, job):
+            pass
+
+        def join(self):
+            pass
+
+    monkeypatch.setattr(pipeline, 'Pipeline', Recorded)
+    urls = tmp_path / 'urls.txt'
+    urls.write_text('http://a.test/\n')
+
+    batch.batch_main(None, [str(urls), '--engine', 'pipeline', '--per-host', '3', '--concurrency', '7'],
+                     stages=(None, None))
+    batch.batch_main(None, [str(urls), '--engine', 'pipeline', '--concurrency', '7', '--fetch-workers', '5'],
+                     stages=(None, None))
+
+    assert built[0]['per_host'] == 3 and built[0]['fetch_workers'] == 7
+    assert built[1]['per_host'] == batch.DEFAULT_PER_HOST and built[1]['fetch_workers'] == 5
@@ -0,0 +1,137 @@
+"""Persistent result cache (server/services/result_cache.py)"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import result_cache
+
+HOST = 'cache.test'
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    """An empty, enabled cache that keeps cache.test results for an hour"""
+    monkeypatch.setattr(result_cache, 'ENABLED', True)
+    monkeypatch.setitem(result_cache.HOST_TTLS, HOST, 3600)
+    result_cache._conn().execute('DELETE FROM results')
+    yield
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock the cache sees, moved by hand"""
+    now = [time.time()]
+    monkeypatch.setattr(result_cache.time, 'time', lambda: now[0])
+    return now
+
+
+def test_cache_key_separates_receipts_methods_and_scripts():
+    receipt = 'https://apps.cbe.com.et/?trx=FT123&x=1'
+
+    assert result_cache.cache_key(receipt, 'auto') == 'trx:scraper:auto:apps.cbe.com.et:FT123'
+    assert result_cache.cache_key(receipt, 'auto') == result_cache.cache_key(
+        'https://APPS.cbe.com.et/?x=2&trx=FT123', 'auto')
+    assert result_cache.cache_key(receipt, 'auto', source='real_scraper') != result_cache.cache_key(receipt, 'auto')
+    assert result_cache.cache_key('https://shop.test/p/1', 'static') == 'url:scraper:static:https://shop.test/p/1'
+
+
+def test_uncached_host_is_never_stored():
+    stored = []
+    result = result_cache.cached_call('https://elsewhere.test/p', 'static',
+                                      lambda: stored.append(1) or {'success': True}, lambda r: r['success'])
+
+    assert result == {'success': True}
+    assert stored == [1]
+    assert result_cache.lookup('https://elsewhere.test/p', 'static') is None
+
+
+def test_hit_is_marked_cached_and_skips_the_scrape():
+    url = f'https://{HOST}/p/1'
+    runs = []
+
+    def scrape():
+        runs.append(1)
+        return {'success': True, 'title': 'Anvil'}
+
+    first = result_cache.cached_call(url, 'static', scrape, lambda r: r['success'])
+    second = result_cache.cached_call(url, 'static', scrape, lambda r: r['success'])
+
+    assert runs == [1]
+    assert 'cached' not in first
+    assert second == {'success': True, 'title': 'Anvil', 'cached': True}
+
+
+def test_entries_expire_with_their_ttl(clock):
+    url = f'https://{HOST}/p/2'
+    result_cache.save(url, 'static', {'success': True}, True)
+
+    clock[0] += 3599
+    assert result_cache.lookup(url, 'static') is not None
+    clock[0] += 2
+    assert result_cache.lookup(url, 'static') is None
+
+
+def test_failures_are_cached_briefly(clock, monkeypatch):
+    monkeypatch.setattr(result_cache, 'NEGATIVE_TTL', 60)
+    url = f'https://{HOST}/p/3'
+    result_cache.save(url, 'static', {'success': False, 'error': 'blocked'}, False)
+
+    before = result_cache.stats().get('negative_hits', 0)
+    assert result_cache.lookup(url, 'static') == {'success': False, 'error': 'blocked', 'cached': True}
+    assert result_cache.stats()['negative_hits'] == before + 1
+    clock[0] += 61
+    assert result_cache.lookup(url, 'static') is None
+
+
+def test_least_recently_used_entries_are_evicted(clock, monkeypatch):
+    monkeypatch.setattr(result_cache, 'MAX_ENTRIES', 4)
+    monkeypatch.setattr(result_cache, 'EVICTION_SLACK', 0)
+    urls = [f'https://{HOST}/lru/{n}' for n in range(4)]
+    for url in urls:
+        clock[0] += 1
+        result_cache.save(url, 'static', {'success': True, 'url': url}, True)
+    # Touch the oldest entry so the second oldest is the least recently used
+    clock[0] += 1
+    assert result_cache.lookup(urls[0], 'static') is not None
+
+    clock[0] += 1
+    result_cache.save(f'https://{HOST}/lru/new', 'static', {'success': True}, True)
+
+    assert result_cache.stats()['entries'] == 4
+    assert result_cache.lookup(urls[1], 'static') is None
+    assert result_cache.lookup(urls[0], 'static') is not None
+
+
+def test_concurrent_misses_share_one_scrape():
+    url = f'https://{HOST}/p/4'
+    runs = []
+    release = threading.Event()
+
+    def scrape():
+        runs.append(1)
+        release.wait(5)
+        return {'success': True}
+
+    with ThreadPoolExecutor(3) as executor:
+        futures = [executor.submit(result_cache.cached_call, url, 'static', scrape, lambda r: r['success'])
+                   for _ in range(3)]
+        time.sleep(0.1)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert runs == [1]
+    assert all(result['success'] for result in results)
+
+
+def test_disabled_cache_always_scrapes(monkeypatch):
+    monkeypatch.setattr(result_cache, 'ENABLED', False)
+    url = f'https://{HOST}/p/5'
+    runs = []
+
+    for _ in range(2):
+        result_cache.cached_call(url, 'static', lambda: runs.append(1) or {'success': True}, lambda r: r['success'])
+
+    assert runs == [1, 1]
@@ -0,0 +1,68 @@
+"""Per-host method router (server/services/router.py)"""
+
+import itertools
+
+import pytest
+
+import router
+import scraper
+
+_hosts = itertools.count()
+
+CAPTCHA_PAGE = ('<html><head><title>Robot Check</title></head><body>'
+                '<h4>Enter the characters you see below</h4>'
+                "<p>Sorry, we just need to make sure you're not a robot.</p>"
+                + '<div class="a-box">' + ' ' * 1200 + '</div></body></html>')
+
+PRODUCT_PAGE = ('<html><body><span id="productTitle">  Acme Anvil, 50 lb  </span>'
+                '<span class="a-price-whole">129.99</span>'
+                '<span class="a-icon-alt">4.6 out of 5 stars</span>'
+                '<div id="availability"><span>In Stock</span></div>'
+                + '<p>' + 'x' * 1200 + '</p></body></html>')
+
+
+def rendered(url, page):
+    return {'success': True, 'method': 'chromium_headless',
+            'extractedData': scraper.extract_real_product_data(page, url)}
+
+
+@pytest.fixture
+def url():
+    return f'https://www{next(_hosts)}.amazon.com/dp/B000TEST'
+
+
+def test_blocked_render_is_not_complete(url):
+    result = rendered(url, CAPTCHA_PAGE)
+    # The placeholders are still there for display
+    assert result['extractedData']['transactions'][0]['availability'] == 'Unknown'
+    assert router.completeness(result) == 0.0
+    assert not router.acceptable(result)
+
+
+def test_product_render_is_complete(url):
+    result = rendered(url, PRODUCT_PAGE)
+    assert 'placeholderFields' not in result['extractedData']
+    assert router.completeness(result) == 1.0
+    assert router.acceptable(result)
+
+
+def test_failures_and_demo_data_score_zero(url):
+    assert router.completeness({'success': False}) == 0.0
+    demo = {'success': True, 'extractedData': {'transactions': [
+        {'title': 'x', 'price': '1', 'description': 'Demo product data - Real extraction requires proper selectors'}]}}
+    assert router.completeness(demo) == 0.0
+
+
+def test_blocked_renders_open_the_breaker(url):
+    for _ in range(router.BREAK_AFTER):
+        router.record(url, rendered(url, CAPTCHA_PAGE), 2.0)
+    host_routes = router.stats()[router._host(url)]
+    assert host_routes['chromium']['breaker'] == 'open'
+    assert scraper.rerouted(url, 'beautifulsoup') == 'selenium'
+
+
+def test_router_prefers_the_cheapest_proven_method(url, monkeypatch):
+    monkeypatch.setattr(router, 'EXPLORE_RATE', 0)
+    for _ in range(router.MIN_SAMPLES):
+        router.record(url, rendered(url, PRODUCT_PAGE), 2.0)
+    assert router.choose(url) == ('chromium', None)
@@ -0,0 +1,176 @@
+"""Deadlines, host rate limits and resumable jobs (server/services/scheduler.py)"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import scheduler
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = scheduler.TokenBucket(rate=10, burst=2)
+
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+
+
+def test_token_bucket_refund_returns_the_token():
+    bucket = scheduler.TokenBucket(rate=1, burst=1)
+    bucket.reserve()
+    bucket.refund()
+
+    assert bucket.reserve() == 0.0
+
+
+def test_pace_refunds_a_wait_past_the_deadline():
+    bucket = scheduler.bucket_for('pace.test')
+    bucket.tokens = -10  # ten requests already queued ahead at 0.5/s
+
+    assert scheduler.pace('pace.test', scheduler.Deadline(1)) is False
+    assert bucket.tokens == pytest.approx(-10, abs=0.1)
+
+
+def test_backoff_stays_within_its_capped_window():
+    for attempt in range(1, 10):
+        window = min(30.0, 2.0 * 2 ** (attempt - 1))
+        delays = [scheduler.backoff(attempt) for _ in range(200)]
+        assert all(0 <= delay <= window for delay in delays)
+    # Full jitter: retries are spread over the window, not bunched at its end
+    assert len({round(scheduler.backoff(5), 3) for _ in range(50)}) > 10
+
+
+def test_deadline_caps_timeouts_and_refuses_to_oversleep():
+    deadline = scheduler.Deadline(0.5)
+
+    assert deadline.cap(10) <= 0.5
+    assert deadline.cap(0.1) == 0.1
+    started = time.monotonic()
+    assert deadline.sleep(5) is False
+    assert time.monotonic() - started < 0.1
+    assert deadline.sleep(0.05) is True
+    assert not deadline.expired()
+
+
+def test_pause_sleeps_outside_a_resumable_job():
+    started = time.monotonic()
+
+    assert scheduler.pause(0.05, scheduler.Deadline(5)) is True
+    assert time.monotonic() - started >= 0.05
+    assert scheduler.pause(10, scheduler.Deadline(1)) is False
+
+
+def test_pause_reschedules_inside_a_resumable_job():
+    with scheduler.resumable({}):
+        assert scheduler.is_resumable()
+        with pytest.raises(scheduler.Reschedule) as raised:
+            scheduler.pause(0.5, scheduler.Deadline(5))
+        # A wait past the deadline still gives up rather than rescheduling
+        assert scheduler.pause(10, scheduler.Deadline(1)) is False
+    assert raised.value.seconds == 0.5
+    assert not scheduler.is_resumable()
+
+
+def test_reschedule_gets_past_broad_exception_handlers():
+    def retry_loop():
+        try:
+            scheduler.pause(0.5, scheduler.Deadline(5))
+        except Exception:
+            return 'swallowed'
+
+    with scheduler.resumable({}), pytest.raises(scheduler.Reschedule):
+        retry_loop()
+
+
+def test_once_and_deadline_survive_a_resumed_run():
+    state = {}
+    calls = []
+    seen = []
+
+    def job():
+        with scheduler.deadline_scope(30) as deadline:
+            seen.append(deadline)
+            value = scheduler.once('value', lambda: calls.append(1) or len(calls))
+            if len(seen) == 1:
+                scheduler.pause(0.01)
+            return value
+
+    with scheduler.resumable(state), pytest.raises(scheduler.Reschedule):
+        job()
+    with scheduler.resumable(state):
+        assert job() == 1
+
+    assert calls == [1]
+    assert seen[0] is seen[1]
+
+
+def test_call_later_runs_in_due_order():
+    ran = []
+    done = threading.Event()
+    scheduler.call_later(0.1, lambda: (ran.append('late'), done.set()))
+    scheduler.call_later(0.02, ran.append, 'early')
+
+    assert done.wait(2)
+    assert ran == ['early', 'late']
+
+
+def test_resume_later_fires_once_when_woken_early():
+    wakers = []
+    fired = []
+    woken = threading.Event()
+
+    scheduler.resume_later(scheduler.Reschedule(0.2, wake=wakers.append), lambda: (fired.append(1), woken.set()))
+    wakers[0]()
+
+    assert woken.is_set()
+    time.sleep(0.3)
+    # The timer came due as well, but the job was already resumed
+    assert fired == [1]
+
+
+def test_resume_later_falls_back_to_the_timer():
+    woken = threading.Event()
+    started = time.monotonic()
+
+    scheduler.resume_later(scheduler.Reschedule(0.1, wake=lambda callback: None), woken.set)
+
+    assert woken.wait(2)
+    assert time.monotonic() - started >= 0.1
+
+
+def test_run_in_thread_waits_on_the_loop_and_resumes():
+    runs = []
+
+    def job():
+        progress = scheduler.job_state().setdefault('progress', {'paused': False})
+        runs.append(threading.current_thread().name)
+        if not progress['paused']:
+            progress['paused'] = True
+            scheduler.pause(0.1, scheduler.Deadline(5))
+        return 'done'
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        started = time.monotonic()
+        result = await scheduler.run_in_thread(job)
+        elapsed = time.monotonic() - started
+        ticker.cancel()
+        return result, elapsed, ticks
+
+    result, elapsed, ticks = asyncio.run(main())
+
+    assert result == 'done'
+    assert len(runs) == 2
+    assert 0.1 <= elapsed < 1
+    # The loop kept running while the job waited
+    assert ticks >= 5
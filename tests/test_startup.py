@@ -0,0 +1,21 @@
+"""Cold-start budget of the scraper entry points (see bench/startup_bench.py)"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bench'))
+
+import startup_bench
+
+
+def test_entry_points_start_within_budget():
+    budget_ms = float(os.environ.get('SCRAPER_STARTUP_BUDGET_MS', startup_bench.DEFAULT_BUDGET_MS))
+    report = startup_bench.run(runs=5, budget_ms=budget_ms, top=0)
+
+    assert {result['name'] for result in report['results']} == {name for name, _ in startup_bench.ENTRY_POINTS}
+    for result in report['results']:
+        assert result['startupMs'] <= budget_ms, result
+        assert result['deferredLoaded'] == [], result
+        # The one-shot job run has to get as far as the network, or only its usage check was timed
+        assert result['reachedNetwork'] in (None, True), result
+    assert report['failures'] == []
@@ -0,0 +1,61 @@
+"""Worker mode (server/services/worker.py)"""
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import worker
+from conftest import ListWriter
+
+
+def slow_handler(job):
+    time.sleep(0.2)
+    if job.get('fail'):
+        raise ValueError('bad job')
+    return {'success': True, 'url': job['url']}
+
+
+def test_stream_answers_every_job_and_reports_keys():
+    writer = ListWriter()
+    jobs = worker.Jobs()
+    lines = [json.dumps({'id': 1, 'url': 'http://a/'}), 'not json', json.dumps({'id': 2, 'url': 'http://b/', 'fail': True})]
+    with ThreadPoolExecutor(2) as executor:
+        worker.serve_stream(slow_handler, lines, writer, executor, jobs, job_key=lambda job: 'k:' + job['url'])
+        jobs.wait()
+
+    by_id = {}
+    for message in writer.messages:
+        by_id.setdefault(message['id'], []).append(message)
+    assert by_id[1] == [{'id': 1, 'key': 'k:http://a/'}, {'id': 1, 'result': {'success': True, 'url': 'http://a/'}}]
+    assert by_id[2][-1] == {'id': 2, 'error': 'bad job'}
+    assert by_id[None][0]['error'].startswith('Invalid job line')
+
+
+def test_socket_client_that_half_closes_still_gets_its_result():
+    path = os.path.join(tempfile.mkdtemp(), 'worker.sock')
+    executor = ThreadPoolExecutor(2)
+    threading.Thread(target=worker.serve_socket, args=(slow_handler, path, executor, lambda job: job['url']),
+                     daemon=True).start()
+    for _ in range(50):
+        if os.path.exists(path):
+            break
+        time.sleep(0.02)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(json.dumps({'id': 1, 'url': 'http://a/'}).encode() + b'\n')
+        client.shutdown(socket.SHUT_WR)
+        client.settimeout(5)
+        received = b''
+        while True:
+            chunk = client.recv(4096)
+            if not chunk:
+                break
+            received += chunk
+
+    messages = [json.loads(line) for line in received.decode().splitlines()]
+    assert messages == [{'id': 1, 'key': 'http://a/'}, {'id': 1, 'result': {'success': True, 'url': 'http://a/'}}]